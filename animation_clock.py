@@ -0,0 +1,71 @@
+# animation_clock.py
+import re
+import time
+from typing import Callable
+
+from image_pipeline import DecodedImage, ImageTk
+
+MAX_ANIMATION_FPS = 30 # Global cap: no emote advances more often than this, however short its frame delays
+EMBEDDED_IMAGE_SUFFIX = re.compile(r"#\d+$") # tk.Text names repeat embeds of one image "<image>#1", "<image>#2", ...
+
+class AnimatedEmote:
+    __slots__ = ("display", "frame_photos", "durations", "index", "next_due")
+
+    def __init__(self, display, frame_photos: list, durations: tuple):
+        self.display = display # The PhotoImage every chat line embeds; frames are copied into it
+        self.frame_photos = frame_photos
+        self.durations = durations
+        self.index = 0
+        self.next_due = 0.0
+
+class AnimationClock:
+    """Drives every animated emote from a single Tk after() timer.
+
+    Each emote's frames are decoded once and turned into PhotoImages once. All on-screen
+    instances embed one shared display image, so advancing an emote is a single Tk image
+    copy no matter how many chat lines show it. Only emotes that visible_images_fn reports
+    as on screen (current tab, visible region) are advanced. Tk thread only.
+    """
+    def __init__(self, tk_root, visible_images_fn: Callable[[], set], fps_cap: int = MAX_ANIMATION_FPS):
+        self.tk_root = tk_root
+        self.visible_images_fn = visible_images_fn # -> set of embedded image names currently visible
+        self.tick_ms = max(1, int(1000 / fps_cap))
+        self.animations = {} # display image name -> AnimatedEmote
+        self._after_id = None
+        self.frames_advanced = 0
+
+    def register(self, decoded_image: DecodedImage):
+        frame_photos = decoded_image.frame_photos()
+        display = ImageTk.PhotoImage("RGBA", (decoded_image.width, decoded_image.height))
+        self.tk_root.tk.call(str(display), "copy", str(frame_photos[0]), "-compositingrule", "set")
+        animation = AnimatedEmote(display, frame_photos, decoded_image.durations)
+        animation.next_due = time.monotonic() + decoded_image.durations[0] / 1000.0
+        self.animations[str(display)] = animation
+        if self._after_id is None: self._after_id = self.tk_root.after(self.tick_ms, self._tick)
+        return display
+
+    def unregister(self, display):
+        self.animations.pop(str(display), None)
+
+    def stop(self):
+        if self._after_id is not None:
+            try: self.tk_root.after_cancel(self._after_id)
+            except Exception: pass
+            self._after_id = None
+
+    def _tick(self):
+        self._after_id = None
+        if not self.animations: return # Restarted by the next register()
+        try:
+            visible_names = {EMBEDDED_IMAGE_SUFFIX.sub("", name) for name in self.visible_images_fn()}
+            now = time.monotonic()
+            for name in visible_names:
+                animation = self.animations.get(name)
+                if animation is None or now < animation.next_due: continue
+                animation.index = (animation.index + 1) % len(animation.frame_photos)
+                self.tk_root.tk.call(name, "copy", str(animation.frame_photos[animation.index]), "-compositingrule", "set")
+                animation.next_due = now + animation.durations[animation.index] / 1000.0
+                self.frames_advanced += 1
+        except Exception as e:
+            print(f"AnimationClock: tick failed: {e}")
+        self._after_id = self.tk_root.after(self.tick_ms, self._tick)
@@ -0,0 +1,28 @@
+# app_paths.py
+import os
+import sys
+from pathlib import Path
+
+APP_DIR_NAME = "kickerino"
+
+def user_cache_dir() -> Path:
+    """Per-user cache directory (%LOCALAPPDATA%, ~/Library/Caches or $XDG_CACHE_HOME)."""
+    override = os.environ.get("KICKERINO_CACHE_DIR")
+    if override: return Path(override)
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+        return Path(base) / APP_DIR_NAME / "Cache"
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Caches" / APP_DIR_NAME
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / APP_DIR_NAME
+
+def user_data_dir() -> Path:
+    """Per-user data directory for files the user keeps, e.g. chat archives (%APPDATA%, ~/Library/Application Support or $XDG_DATA_HOME)."""
+    override = os.environ.get("KICKERINO_DATA_DIR")
+    if override: return Path(override)
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser(r"~\AppData\Roaming")
+        return Path(base) / APP_DIR_NAME
+    if sys.platform == "darwin":
+        return Path.home() / "Library" / "Application Support" / APP_DIR_NAME
+    return Path(os.environ.get("XDG_DATA_HOME") or Path.home() / ".local" / "share") / APP_DIR_NAME
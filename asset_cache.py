@@ -0,0 +1,237 @@
+# asset_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import time
+import traceback
+from pathlib import Path
+
+from app_paths import user_cache_dir
+
+DEFAULT_MAX_CACHE_BYTES = 256 * 1024 * 1024
+REVALIDATE_AFTER_SECONDS = 24 * 3600 # Cached assets younger than this are served without asking the server
+INDEX_SAVE_DELAY_SECONDS = 2.0 # Index writes are debounced; a burst of stores costs one write
+
+class DiskAssetCache:
+    """On-disk cache of downloaded emote/badge bytes and their rasterized PNG variants, keyed by URL.
+
+    Files live under <cache dir>/assets as blobs/<sha256(url)> plus derived/<sha256(url)>.<variant>.png,
+    with a JSON index holding validators (ETag/Last-Modified), sizes and last access times. A cached asset
+    is returned from disk straight away; if it is older than REVALIDATE_AFTER_SECONDS it is revalidated
+    with a conditional GET in the background. Least recently used entries are evicted past max_bytes.
+    Must be used from the asyncio loop thread; file I/O runs in the default executor.
+    """
+    def __init__(self, root: Path | None = None, max_bytes: int = DEFAULT_MAX_CACHE_BYTES):
+        self.root = Path(root) if root else user_cache_dir() / "assets"
+        self.max_bytes = max_bytes
+        self.index_path = self.root / "index.json"
+        self.entries = {} # key -> {"url", "etag", "last_modified", "checked", "atime", "size", "variants": {variant: size}}
+        self.total_bytes = 0
+        self._loaded = False
+        self._save_handle = None
+        self._save_task = None # The debounced index write, kept referenced until it finishes
+        self._index_lock = asyncio.Lock() # One index write at a time, so the last snapshot taken is the one left on disk
+        self._revalidating = {} # key -> Task, so one background revalidation per asset at a time
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _blob_path(self, key: str) -> Path:
+        return self.root / "blobs" / key[:2] / key
+
+    def _derived_path(self, key: str, variant: str) -> Path:
+        return self.root / "derived" / key[:2] / f"{key}.{variant}.png"
+
+    async def _load_index(self):
+        if self._loaded: return
+        async with self._index_lock: # Callers arriving during the read wait for it instead of reading again
+            if self._loaded: return
+            self.entries = await asyncio.to_thread(self._read_index)
+            self.total_bytes = sum(self._entry_bytes(entry) for entry in self.entries.values())
+            self._loaded = True
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("entries", {})
+        except FileNotFoundError: return {}
+        except Exception as e:
+            print(f"AssetCache: index at {self.index_path} unreadable, starting empty: {e}")
+            return {}
+
+    @staticmethod
+    def _entry_bytes(entry: dict) -> int:
+        return entry.get("size", 0) + sum(entry.get("variants", {}).values())
+
+    def _schedule_index_save(self):
+        if self._save_handle: return
+        self._save_handle = asyncio.get_running_loop().call_later(INDEX_SAVE_DELAY_SECONDS, self._start_index_save)
+
+    def _start_index_save(self):
+        self._save_handle = None
+        self._save_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Writes the index to disk now. Call on shutdown; a debounced write still running is waited for, then superseded."""
+        if self._save_handle: self._save_handle.cancel(); self._save_handle = None
+        if not self._loaded: return
+        async with self._index_lock:
+            snapshot = json.dumps({"entries": self.entries}) # Taken under the lock: never older than what's on disk
+            def write_index():
+                self.root.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.index_path.with_suffix(".tmp")
+                tmp_path.write_text(snapshot, encoding="utf-8")
+                os.replace(tmp_path, self.index_path)
+            try: await asyncio.shield(asyncio.to_thread(write_index)) # A cancelled flush still leaves a whole index behind
+            except Exception as e: print(f"AssetCache: failed to write index: {e}")
+
+    def _touch(self, entry: dict):
+        entry["atime"] = time.time()
+        self._schedule_index_save()
+
+    async def _read_file(self, path: Path) -> bytes | None:
+        try: return await asyncio.to_thread(path.read_bytes)
+        except FileNotFoundError: return None
+
+    async def _write_file(self, path: Path, data: bytes):
+        def write():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        await asyncio.to_thread(write)
+
+    async def get_bytes(self, url: str) -> bytes | None:
+        """Cached raw bytes for url, or None. Never touches the network."""
+        await self._load_index()
+        key = self.key_for(url)
+        entry = self.entries.get(key)
+        if not entry: return None
+        data = await self._read_file(self._blob_path(key))
+        if data is None: # Blob deleted behind our back
+            self._forget(key); return None
+        self._touch(entry)
+        return data
+
+    async def get_derived(self, url: str, variant: str) -> bytes | None:
+        """Cached rasterized PNG for url at the given variant (e.g. "28x28"), or None."""
+        await self._load_index()
+        key = self.key_for(url)
+        entry = self.entries.get(key)
+        if not entry or variant not in entry.get("variants", {}): return None
+        data = await self._read_file(self._derived_path(key, variant))
+        if data is None:
+            self.total_bytes -= entry["variants"].pop(variant, 0); return None
+        self._touch(entry)
+        return data
+
+    async def put_derived(self, url: str, variant: str, png_bytes: bytes):
+        await self._load_index()
+        key = self.key_for(url)
+        entry = self.entries.get(key)
+        if not entry: return # Only derive from bytes we hold, so revalidation can invalidate variants
+        try: await self._write_file(self._derived_path(key, variant), png_bytes)
+        except Exception as e:
+            print(f"AssetCache: failed to store {variant} variant of {url}: {e}"); return
+        self.total_bytes += len(png_bytes) - entry["variants"].get(variant, 0)
+        entry["variants"][variant] = len(png_bytes)
+        self._touch(entry)
+        await self._evict_if_needed()
+
+    async def fetch(self, session, url: str) -> bytes | None:
+        """Raw bytes for url: from disk when cached (revalidating stale entries in the background), else from the network."""
+        data = await self.get_bytes(url)
+        if data is not None:
+            key = self.key_for(url)
+            if time.time() - self.entries[key].get("checked", 0) > REVALIDATE_AFTER_SECONDS and key not in self._revalidating:
+                task = asyncio.ensure_future(self.revalidate(session, url))
+                self._revalidating[key] = task
+                task.add_done_callback(lambda _t: self._revalidating.pop(key, None))
+            return data
+        return await self._download(session, url)
+
+    async def revalidate(self, session, url: str) -> bool:
+        """Conditional GET for a cached url. Returns True when the server sent new content."""
+        await self._load_index()
+        key = self.key_for(url)
+        entry = self.entries.get(key)
+        if not entry: return False
+        headers = {}
+        if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            if not session or session.closed: return False
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    entry["checked"] = time.time(); self._schedule_index_save()
+                    return False
+                if response.status != 200:
+                    print(f"AssetCache: revalidation of {url} returned HTTP {response.status}; keeping cached copy.")
+                    return False
+                await self._store(url, await response.read(), response.headers)
+                return True
+        except Exception as e:
+            print(f"AssetCache: revalidation of {url} failed, keeping cached copy: {e}")
+            return False
+
+    async def _download(self, session, url: str) -> bytes | None:
+        if not session or session.closed:
+            print(f"AssetCache: aiohttp session not ready for {url}.")
+            return None
+        async with session.get(url) as response:
+            if response.status != 200:
+                print(f"AssetCache: failed to fetch {url}: HTTP {response.status}")
+                return None
+            data = await response.read()
+            await self._store(url, data, response.headers)
+            return data
+
+    async def _store(self, url: str, data: bytes, headers):
+        await self._load_index()
+        key = self.key_for(url)
+        try: await self._write_file(self._blob_path(key), data)
+        except Exception as e:
+            print(f"AssetCache: failed to store {url}: {e}"); return
+        old_entry = self.entries.get(key)
+        if old_entry: self.total_bytes -= self._entry_bytes(old_entry)
+        now = time.time()
+        self.entries[key] = {
+            "url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+            "checked": now, "atime": now, "size": len(data), "variants": {}}
+        self.total_bytes += len(data)
+        self._schedule_index_save()
+        if old_entry and old_entry.get("variants"): # New content: previously rasterized variants are stale
+            try: await asyncio.to_thread(self._remove_variant_files, key, old_entry)
+            except Exception:
+                traceback.print_exc()
+        await self._evict_if_needed()
+
+    def _remove_variant_files(self, key: str, entry: dict):
+        for variant in entry.get("variants", {}):
+            try: self._derived_path(key, variant).unlink()
+            except OSError: pass
+
+    def _forget(self, key: str):
+        entry = self.entries.pop(key, None)
+        if entry: self.total_bytes -= self._entry_bytes(entry)
+        self._schedule_index_save()
+
+    async def _evict_if_needed(self):
+        if self.total_bytes <= self.max_bytes: return
+        target_bytes = int(self.max_bytes * 0.9) # Evict a little extra so we don't do this on every store
+        victims = []
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1].get("atime", 0)):
+            if self.total_bytes <= target_bytes: break
+            victims.append((key, entry))
+            self._forget(key)
+        def delete_files():
+            for key, entry in victims:
+                try: self._blob_path(key).unlink()
+                except OSError: pass
+                self._remove_variant_files(key, entry)
+        try: await asyncio.to_thread(delete_files)
+        except Exception:
+            traceback.print_exc()
+        print(f"AssetCache: evicted {len(victims)} assets, now {self.total_bytes / 1048576:.1f} MiB on disk.")
@@ -0,0 +1,154 @@
+# asset_prefetch.py
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+
+from chat_record import parse_badges
+from message_tokenizer import EMOTE_TOKEN_TYPES, MessageTokenizer
+from metrics import PREFETCH_HOLD, PREFETCH_PLACEHOLDERS
+
+DEFAULT_MAX_HOLD_MS = 40 # Longest a chat message waits for its images before it is shown with placeholders
+
+class _HeldEvent:
+    __slots__ = ("payload", "missing", "submitted_at", "deadline", "posted")
+
+    def __init__(self, payload: dict, submitted_at: float, deadline: float):
+        self.payload = payload
+        self.missing = set() # (kind, url) keys not in the image cache yet
+        self.submitted_at = submitted_at
+        self.deadline = deadline
+        self.posted = False
+
+class AssetPrefetcher:
+    """Gets a chat message's emotes and badges into the ImageCache before the message reaches the GUI.
+
+    submit() tokenizes each chat message on the loop thread (the tokens travel with the event, so
+    the Tk thread doesn't parse it again) and queues loads for the images the cache lacks. Loads
+    queued during one loop iteration, e.g. a burst of messages from one socket read, are
+    de-duplicated and started together. Each event is posted as a "chat_event" update once its
+    images are cached or max_hold_ms has passed; a channel's events keep their arrival order.
+    Images that finish after their message was posted are announced with "image_loaded", and the
+    tabs replace those placeholders in place. Loop thread only.
+    """
+    def __init__(self, image_cache, emote_manager, badge_manager, post: Callable[[str, dict], None], max_hold_ms: float = DEFAULT_MAX_HOLD_MS,
+                 emote_usage=None):
+        self.image_cache = image_cache
+        self.emote_usage = emote_usage # Optional emote_usage.EmoteUsageStats, fed every tokenized message
+        self.emote_manager = emote_manager
+        self.badge_manager = badge_manager
+        self.post = post # GuiDispatcher.post
+        self.max_hold = max_hold_ms / 1000.0
+        self.tokenizer = MessageTokenizer() # Separate from the tabs' tokenizer; its LRU isn't shared across threads
+        self._queues = {} # channel slug -> deque of _HeldEvents, oldest first
+        self._timers = {} # channel slug -> TimerHandle releasing the head of its queue at its deadline
+        self._waiting = {} # (kind, url) -> [_HeldEvent] that need it
+        self._loading = set() # (kind, url) being fetched
+        self._announce = set() # (kind, url) the Tk thread is showing a placeholder for, outside any held event
+        self._batch = {} # (kind, url) -> ensure() coroutine factory, started by _start_batch
+        self._batch_scheduled = False
+        self._fetches = set() # _fetch tasks in flight; the loop only keeps weak references to tasks
+
+    def submit(self, channel_slug: str, event: dict):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        held = _HeldEvent({"slug": channel_slug, "event": event}, now, now + self.max_hold)
+        if event.get("type") == "chat":
+            message_data = event.get("data") or {}
+            tokens = self.tokenizer.tokenize(message_data.get("content", ""), self.emote_manager.get_emote_index(channel_slug),
+                                             message_data.get("emotes", []))
+            held.payload["tokens"] = tokens
+            if self.emote_usage: self.emote_usage.record(channel_slug, tokens)
+            for kind, url, ensure in self._wanted_images(channel_slug, message_data, tokens):
+                key = (kind, url)
+                if key in held.missing or self.image_cache.has(kind, url): continue
+                held.missing.add(key)
+                self._waiting.setdefault(key, []).append(held)
+                if key not in self._loading: self._batch[key] = ensure
+        self._queues.setdefault(channel_slug, deque()).append(held)
+        if self._batch and not self._batch_scheduled:
+            self._batch_scheduled = True
+            loop.call_soon(self._start_batch)
+        self._release(channel_slug)
+
+    def request(self, kind: str, url: str, ensure: Callable[[], Awaitable]):
+        """For the Tk thread (via call_soon_threadsafe): fetches an image a line shows a placeholder for, then announces it."""
+        key = (kind, url)
+        self._announce.add(key)
+        if key not in self._loading:
+            self._loading.add(key)
+            self._start_fetch(key, ensure)
+
+    def remove_channel(self, channel_slug: str):
+        timer = self._timers.pop(channel_slug, None)
+        if timer: timer.cancel()
+        for held in self._queues.pop(channel_slug, ()): held.posted = True # Its loads still finish and stay cached
+
+    async def close(self):
+        """Drops every held event and cancels the loads still running. Call on shutdown."""
+        for channel_slug in list(self._queues): self.remove_channel(channel_slug)
+        tasks = list(self._fetches)
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _wanted_images(self, channel_slug: str, message_data: dict, tokens: tuple) -> list:
+        """(kind, url, ensure) for every badge and emote the message shows."""
+        wanted = []
+        for badge_type, _badge_text, badge_count in parse_badges(message_data):
+            badge_url = self.badge_manager.get_badge_url(badge_type, badge_count, channel_slug)
+            if badge_url:
+                wanted.append(("badge", badge_url, lambda url=badge_url, kind=badge_type: self.badge_manager.load_and_cache_badge(url, kind or "unknown")))
+        for part_type, part_data in tokens:
+            url = part_data.get("url") if part_type in EMOTE_TOKEN_TYPES else None
+            if url: wanted.append((part_type, url, lambda kind=part_type, emote_data=part_data: self.emote_manager.load_and_cache_emote(kind, emote_data)))
+        return wanted
+
+    def _start_batch(self):
+        self._batch_scheduled = False
+        batch, self._batch = self._batch, {}
+        for key, ensure in batch.items():
+            if key in self._loading: continue
+            self._loading.add(key)
+            self._start_fetch(key, ensure)
+
+    def _start_fetch(self, key: tuple, ensure: Callable[[], Awaitable]):
+        task = asyncio.ensure_future(self._fetch(key, ensure))
+        self._fetches.add(task)
+        task.add_done_callback(self._fetches.discard)
+
+    async def _fetch(self, key: tuple, ensure: Callable[[], Awaitable]):
+        cancelled = False
+        try: await ensure() # The ImageCache stores the result, or a negative entry on failure
+        except asyncio.CancelledError: cancelled = True; raise
+        except Exception as e: print(f"AssetPrefetcher: loading {key[0]} {key[1]} failed: {e}")
+        finally:
+            self._loading.discard(key)
+            waiters = self._waiting.pop(key, [])
+            for held in waiters: held.missing.discard(key)
+            if not cancelled and (key in self._announce or any(held.posted for held in waiters)): # Nothing to announce when shutting down
+                self._announce.discard(key)
+                self.post("image_loaded", {"kind": key[0], "url": key[1]})
+            for channel_slug in {held.payload["slug"] for held in waiters if not held.posted}:
+                self._release(channel_slug)
+
+    def _release(self, channel_slug: str, due: float = 0.0):
+        """Posts the channel's events from the front of its queue that are ready or out of time (deadline <= due counts as out)."""
+        queue = self._queues.get(channel_slug)
+        if queue is None: return
+        now = max(asyncio.get_running_loop().time(), due) # A timer may fire a clock tick early
+        while queue and (not queue[0].missing or queue[0].deadline <= now):
+            held = queue.popleft()
+            held.posted = True
+            if held.missing: PREFETCH_PLACEHOLDERS.inc(amount=len(held.missing))
+            PREFETCH_HOLD.observe(now - held.submitted_at)
+            self.post("chat_event", held.payload)
+        timer = self._timers.get(channel_slug)
+        if not queue:
+            del self._queues[channel_slug]
+            if timer: timer.cancel(); del self._timers[channel_slug]
+        elif timer is None or timer.when() != queue[0].deadline:
+            if timer: timer.cancel()
+            self._timers[channel_slug] = asyncio.get_running_loop().call_at(queue[0].deadline, self._on_deadline, channel_slug, queue[0].deadline)
+
+    def _on_deadline(self, channel_slug: str, deadline: float):
+        self._timers.pop(channel_slug, None)
+        self._release(channel_slug, deadline)
@@ -0,0 +1,61 @@
+# assets/badges/generate_fallbacks.py
+"""Writes the bundled badge PNGs that BadgeManager shows when an SVG can't be fetched or Cairo is missing.
+
+With --from-svg (needs network and cairosvg) the real kickdatabase.com SVGs are rasterized; otherwise
+simple coloured stand-ins are drawn. Writes <badge type>@1x.png and @2x.png next to this script.
+Run from the repository root:
+    python assets/badges/generate_fallbacks.py [--from-svg]
+"""
+import argparse
+import io
+import sys
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from PIL import Image, ImageDraw, ImageFont
+
+from badge_manager import BADGE_SCALES, BUNDLED_BADGE_DIR, PREDEFINED_BADGE_SVGS, badge_size
+
+STAND_INS = { # badge type -> (background, label)
+    "broadcaster": ("#E9113C", "B"), "moderator": ("#00A86B", "M"), "vip": ("#E0A800", "V"), "og": ("#1F8A70", "OG"),
+    "founder": ("#C68A00", "F"), "subscriber": ("#3DBE14", "S"), "sub_gifter": ("#8A4DFF", "G"), "verified": ("#1475E1", "✓"),
+    "staff": ("#5B2A86", "K"), "sidekick": ("#FF6A4A", "SK"), "trainwreckstv": ("#2D2D2D", "T"),
+}
+
+def draw_stand_in(background: str, label: str, size: tuple) -> bytes:
+    scale = 4 # Drawn large and downsampled for smooth edges
+    width, height = size[0] * scale, size[1] * scale
+    image = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rounded_rectangle((0, 0, width - 1, height - 1), radius=width // 4, fill=background)
+    if label == "✓": # Not in Pillow's built-in font
+        draw.line([(width * 0.26, height * 0.52), (width * 0.43, height * 0.70), (width * 0.75, height * 0.32)], fill="white", width=max(2, width // 9), joint="curve")
+    else:
+        font = ImageFont.load_default(size=int(height * (0.62 if len(label) == 1 else 0.46)))
+        draw.text((width / 2, height / 2), label, fill="white", font=font, anchor="mm")
+    image = image.resize(size, Image.Resampling.LANCZOS)
+    buffer = io.BytesIO(); image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+def rasterize_svg(svg_url: str, size: tuple) -> bytes:
+    import cairosvg
+    request = urllib.request.Request(svg_url, headers={"User-Agent": "Mozilla/5.0"})
+    with urllib.request.urlopen(request, timeout=20) as response: svg_data = response.read()
+    return cairosvg.svg2png(bytestring=svg_data, output_width=size[0], output_height=size[1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from-svg", action="store_true", help="rasterize the real SVGs instead of drawing stand-ins")
+    args = parser.parse_args()
+    BUNDLED_BADGE_DIR.mkdir(parents=True, exist_ok=True)
+    for badge_type, svg_url in PREDEFINED_BADGE_SVGS.items():
+        for scale in BADGE_SCALES:
+            size = badge_size(scale)
+            png_data = rasterize_svg(svg_url, size) if args.from_svg else draw_stand_in(*STAND_INS[badge_type], size)
+            (BUNDLED_BADGE_DIR / f"{badge_type}@{scale}x.png").write_bytes(png_data)
+    print(f"Wrote {len(PREDEFINED_BADGE_SVGS) * len(BADGE_SCALES)} badge PNGs to {BUNDLED_BADGE_DIR}")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,44 @@
 # badge_manager.py
 import asyncio
-import aiohttp
-from PIL import Image, ImageTk, UnidentifiedImageError
-import io
+import concurrent.futures
+import bisect
+import threading
 import traceback
+from pathlib import Path
+from image_cache import ImageCache
+from image_pipeline import ImagePipeline, DecodedImage
+from lazy_imports import lazy_import
 
-try:
-    import cairosvg
-    CAIROSVG_AVAILABLE = True
-    # print("BadgeManager: cairosvg library successfully imported.")
-except ImportError as e:
-    CAIROSVG_AVAILABLE = False
-    print(f"BadgeManager: cairosvg library import FAILED: {e}. Badges will be text.")
-    if "no library called" in str(e) or "cannot load library" in str(e):
-        print("This OSError often means the Cairo C library is missing or not in your system PATH.")
-
-BADGE_SIZE = (18, 18) 
+aiohttp = lazy_import("aiohttp")
+
+_cairosvg_probe = None # Future -> bool, started by probe_cairosvg()
+_cairosvg_probe_lock = threading.Lock()
+
+def _import_cairosvg() -> bool:
+    try:
+        import cairosvg # Loads the native Cairo library; rasterization itself happens in image_pipeline workers
+        return True
+    except (ImportError, OSError) as e:
+        print(f"BadgeManager: cairosvg library import FAILED: {e}. Badges will be text.")
+        if "no library called" in str(e) or "cannot load library" in str(e):
+            print("This OSError often means the Cairo C library is missing or not in your system PATH.")
+        return False
+
+def probe_cairosvg() -> concurrent.futures.Future:
+    """Starts importing cairosvg in a background thread (once); the future resolves to whether it is usable.
+
+    Finding (or failing to find) the Cairo DLL can take a noticeable time, so it is not done at import.
+    """
+    global _cairosvg_probe
+    with _cairosvg_probe_lock:
+        if _cairosvg_probe is None:
+            probe = _cairosvg_probe = concurrent.futures.Future()
+            threading.Thread(target=lambda: probe.set_result(_import_cairosvg()), name="cairosvg-probe", daemon=True).start()
+        return _cairosvg_probe
+
+BADGE_SIZE = (18, 18) # At 1x; the 2x variant is for high-DPI displays
+BADGE_SCALES = (1, 2) # Every badge is rasterized at each of these, so a scale change needs no network or Cairo
+BUNDLED_BADGE_DIR = Path(__file__).resolve().parent / "assets" / "badges" # <type>@<scale>x.png, see generate_fallbacks.py
 PREDEFINED_BADGE_SVGS = {
     "moderator": "https://www.kickdatabase.com/kickBadges/moderator.svg",
     "subscriber": "https://www.kickdatabase.com/kickBadges/subscriber.svg",
@@ -30,61 +53,130 @@ PREDEFINED_BADGE_SVGS = {
     "trainwreckstv": "https://www.kickdatabase.com/kickBadges/trainwreckstv.svg",
 }
 
+BADGE_TYPE_BY_URL = {svg_url: badge_type for badge_type, svg_url in PREDEFINED_BADGE_SVGS.items()}
+
+def badge_size(scale: int) -> tuple:
+    return (BADGE_SIZE[0] * scale, BADGE_SIZE[1] * scale)
+
+def badge_size_variant(scale: int) -> str:
+    """Disk cache key for a rasterized badge; 1x keeps the key older caches used."""
+    width, height = badge_size(scale)
+    return f"{width}x{height}"
+
 class BadgeManager:
-    def __init__(self, loop: asyncio.AbstractEventLoop, aiohttp_session: aiohttp.ClientSession):
+    def __init__(self, loop: asyncio.AbstractEventLoop, aiohttp_session: "aiohttp.ClientSession", disk_cache=None, image_pipeline: ImagePipeline | None = None,
+                 display_scale: int = 1, image_cache: ImageCache | None = None):
         self.loop = loop
         self.aiohttp_session = aiohttp_session
-        self.badge_image_cache = {}
-        self.badge_fetch_locks = {}
-        self.cairosvg_available = CAIROSVG_AVAILABLE
-        # if not self.cairosvg_available:
-        #     print("BadgeManager initialized: cairosvg IS NOT available.")
-        # else:
-        #     print("BadgeManager initialized: cairosvg IS available.")
+        self.disk_cache = disk_cache # Optional asset_cache.DiskAssetCache; cached PNGs work even without Cairo
+        self.image_pipeline = image_pipeline or ImagePipeline()
+        self.display_scale = display_scale if display_scale in BADGE_SCALES else 1 # Variant kept in the image cache
+        self.image_cache = image_cache or ImageCache() # Shared with EmoteManager; entries are ("badge", url)
+        self.channel_subscriber_badges = {} # channel slug -> ([months, ...], [image URL, ...]), ascending by months
+        self._cairosvg_probe = probe_cairosvg()
+
+    @property
+    def cairosvg_available(self) -> bool | None:
+        """None while the background probe is still running."""
+        return self._cairosvg_probe.result() if self._cairosvg_probe.done() else None
+
+    async def prerender_badges(self):
+        """Loads every predefined badge at every scale, concurrently, so chat lines get images from the start."""
+        await asyncio.gather(*(self.load_and_cache_badge(svg_url, badge_type) for badge_type, svg_url in PREDEFINED_BADGE_SVGS.items()))
+
+    async def load_channel_subscriber_badges(self, channel_slug: str, subscriber_badges: list):
+        """Registers a channel's own subscriber badges ([{"months", "url"}] from kick_api) and loads their images."""
+        badges = sorted((badge["months"], badge["url"]) for badge in subscriber_badges if badge.get("url") and badge.get("months") is not None)
+        if not badges:
+            self.channel_subscriber_badges.pop(channel_slug, None); return
+        self.channel_subscriber_badges[channel_slug] = ([months for months, _ in badges], [url for _, url in badges])
+        await asyncio.gather(*(self.load_and_cache_badge(url, "subscriber") for _, url in badges))
+
+    def remove_channel(self, channel_slug: str):
+        self.channel_subscriber_badges.pop(channel_slug, None)
+
+    def get_badge_url(self, badge_type: str, badge_count: int | None = None, channel_slug: str | None = None) -> str | None:
+        """Image URL for a chat badge: the channel's subscriber badge for that many months, else the predefined SVG."""
+        if badge_type == "subscriber" and channel_slug in self.channel_subscriber_badges:
+            months, urls = self.channel_subscriber_badges[channel_slug]
+            position = bisect.bisect_right(months, badge_count or 0) - 1 # Highest tier the subscriber has reached
+            return urls[max(position, 0)]
+        return PREDEFINED_BADGE_SVGS.get(badge_type)
 
     def get_badge_svg_url(self, badge_type: str) -> str | None:
         return PREDEFINED_BADGE_SVGS.get(badge_type)
 
-    def get_cached_badge_image(self, svg_url: str) -> ImageTk.PhotoImage | None:
-        return self.badge_image_cache.get(svg_url)
-
-    async def load_and_cache_badge_svg(self, svg_url: str, badge_identifier_for_log: str):
-        if not self.cairosvg_available:
-            if svg_url not in self.badge_image_cache:
-                 self.badge_image_cache[svg_url] = None
-            return
-        if svg_url in self.badge_image_cache: return
-        if svg_url not in self.badge_fetch_locks:
-            self.badge_fetch_locks[svg_url] = asyncio.Lock()
-        async with self.badge_fetch_locks[svg_url]:
-            if svg_url in self.badge_image_cache: return
-            tk_image = None
-            svg_data_bytes = None
-            try:
-                if not self.aiohttp_session or self.aiohttp_session.closed:
-                    # print(f"BadgeManager: aiohttp session is closed for {badge_identifier_for_log}.")
-                    self.badge_image_cache[svg_url] = None; return
-                async with self.aiohttp_session.get(svg_url) as response:
-                    if response.status == 200:
-                        svg_data_bytes = await response.read()
-                        try:
-                            png_data = cairosvg.svg2png(bytestring=svg_data_bytes, output_width=BADGE_SIZE[0], output_height=BADGE_SIZE[1])
-                            if png_data is not None:
-                                pil_image = Image.open(io.BytesIO(png_data))
-                                if pil_image.mode != 'RGBA': pil_image = pil_image.convert('RGBA')
-                                tk_image = ImageTk.PhotoImage(pil_image)
-                            else:
-                                print(f"BadgeManager: cairosvg.svg2png returned None for {badge_identifier_for_log} from {svg_url}")
-                        except Exception as e_render:
-                            print(f"BadgeManager: Error rendering/converting SVG for {badge_identifier_for_log} from {svg_url}: {e_render}")
-                            # traceback.print_exc() # Uncomment for full trace if needed
-                            # if svg_data_bytes: # Log snippet
-                            #     try:
-                            #         svg_text_snippet = svg_data_bytes.decode('utf-8', errors='ignore')
-                            #         # print(f"--- SVG Snippet for {svg_url} ---\n{svg_text_snippet[:500]}\n--- End Snippet ---")
-                            #     except: pass
-                    else:
-                        print(f"BadgeManager: Failed to fetch SVG {badge_identifier_for_log} from {svg_url}: HTTP {response.status}")
-            except aiohttp.ClientError as e_http: print(f"BadgeManager: HTTP error fetching SVG for {badge_identifier_for_log}: {e_http}")
-            except Exception as e_general: print(f"BadgeManager: General error loading badge {badge_identifier_for_log}: {e_general}") #traceback.print_exc()
-            self.badge_image_cache[svg_url] = tk_image
\ No newline at end of file
+    async def _load_cached_badge_png(self, badge_url: str, scale: int, badge_identifier_for_log: str) -> DecodedImage | None:
+        if not self.disk_cache: return None
+        png_data = await self.disk_cache.get_derived(badge_url, badge_size_variant(scale))
+        if not png_data: return None
+        try: return await self.image_pipeline.decode_image(png_data)
+        except Exception as e_cached:
+            print(f"BadgeManager: Ignoring unreadable cached PNG for {badge_identifier_for_log}: {e_cached}")
+            return None
+
+    async def _load_bundled_badge_png(self, badge_type: str, scale: int) -> DecodedImage | None:
+        path = BUNDLED_BADGE_DIR / f"{badge_type}@{scale}x.png"
+        try: return await self.image_pipeline.decode_image(await asyncio.to_thread(path.read_bytes), badge_size(scale))
+        except FileNotFoundError: return None
+        except Exception as e_bundled:
+            print(f"BadgeManager: Ignoring unreadable bundled badge {path.name}: {e_bundled}")
+            return None
+
+    async def _download_badge_bytes(self, badge_url: str, badge_identifier_for_log: str) -> bytes | None:
+        if self.disk_cache:
+            badge_data = await self.disk_cache.fetch(self.aiohttp_session, badge_url)
+            if badge_data is None: print(f"BadgeManager: Failed to fetch badge {badge_identifier_for_log} from {badge_url}")
+            return badge_data
+        async with self.aiohttp_session.get(badge_url) as response:
+            if response.status == 200:
+                return await response.read()
+            print(f"BadgeManager: Failed to fetch badge {badge_identifier_for_log} from {badge_url}: HTTP {response.status}")
+            return None
+
+    async def load_and_cache_badge(self, badge_url: str, badge_type: str):
+        """Caches the display_scale variant; the other scales only need to reach the disk cache."""
+        async def load_display_variant() -> DecodedImage | None:
+            variants = await self._load_badge_variants(badge_url, BADGE_TYPE_BY_URL.get(badge_url, badge_type))
+            return variants.get(self.display_scale)
+        await self.image_cache.load("badge", badge_url, load_display_variant)
+
+    async def _load_badge_variants(self, badge_url: str, badge_type: str) -> dict:
+        """{scale: DecodedImage} for every scale: disk-cached PNGs, else the source rendered at each scale, else the bundled PNG."""
+        cached = await asyncio.gather(*(self._load_cached_badge_png(badge_url, scale, badge_type) for scale in BADGE_SCALES))
+        variants = {scale: image for scale, image in zip(BADGE_SCALES, cached) if image is not None}
+        missing = [scale for scale in BADGE_SCALES if scale not in variants]
+        if missing:
+            variants.update(await self._render_badge_variants(badge_url, badge_type, missing))
+            for scale in BADGE_SCALES:
+                if scale not in variants:
+                    bundled_image = await self._load_bundled_badge_png(badge_type, scale)
+                    if bundled_image is not None: variants[scale] = bundled_image
+        return variants
+
+    async def _render_badge_variants(self, badge_url: str, badge_type: str, scales: list) -> dict:
+        """Downloads the badge once and renders it at each scale (SVGs need Cairo), caching the PNGs on disk."""
+        is_svg = badge_url in BADGE_TYPE_BY_URL or badge_url.lower().endswith(".svg")
+        if is_svg and not await asyncio.wrap_future(self._cairosvg_probe): return {}
+        if not self.aiohttp_session or self.aiohttp_session.closed: return {}
+        variants = {}
+        try:
+            badge_data = await self._download_badge_bytes(badge_url, badge_type)
+            if badge_data is None: return {}
+            encode_png = bool(self.disk_cache)
+            if is_svg:
+                rendered = await asyncio.gather(*(self.image_pipeline.rasterize_svg(badge_data, badge_size(scale), encode_png=encode_png) for scale in scales), return_exceptions=True)
+            else:
+                rendered = await asyncio.gather(*(self.image_pipeline.decode_image(badge_data, badge_size(scale), encode_png=encode_png) for scale in scales), return_exceptions=True)
+            for scale, decoded_image in zip(scales, rendered):
+                if isinstance(decoded_image, Exception):
+                    print(f"BadgeManager: Error rendering badge {badge_type} at {scale}x from {badge_url}: {decoded_image}"); continue
+                if decoded_image is None:
+                    print(f"BadgeManager: cairosvg.svg2png returned None for {badge_type} at {scale}x from {badge_url}"); continue
+                if self.disk_cache and decoded_image.png:
+                    await self.disk_cache.put_derived(badge_url, badge_size_variant(scale), decoded_image.png)
+                    decoded_image.png = None
+                variants[scale] = decoded_image
+        except aiohttp.ClientError as e_http: print(f"BadgeManager: HTTP error fetching badge {badge_type}: {e_http}")
+        except Exception as e_general: print(f"BadgeManager: General error loading badge {badge_type}: {e_general}")
+        return variants
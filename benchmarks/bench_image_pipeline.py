@@ -0,0 +1,84 @@
+# benchmarks/bench_image_pipeline.py
+"""Event-loop lag while emotes decode: inline on the loop thread vs. through ImagePipeline.
+
+Run from the repository root:  python benchmarks/bench_image_pipeline.py [--images 60]
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw
+
+from image_pipeline import ImagePipeline, decode_image
+from emote_manager import EMOTE_SIZE
+
+PROBE_INTERVAL = 0.005 # Stand-in for the recv loop: wakes every 5 ms and records how late it was
+
+def make_static_png(size: int = 512) -> bytes:
+    image = Image.new("RGBA", (size, size))
+    draw = ImageDraw.Draw(image)
+    for i in range(0, size, 8): draw.line((0, i, size, size - i), fill=(i % 255, 80, 200, 255), width=3)
+    buffer = io.BytesIO(); image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def make_animated_gif(size: int = 128, frames: int = 40) -> bytes:
+    images = []
+    for n in range(frames):
+        image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        ImageDraw.Draw(image).ellipse((n, n, size - n, size - n), fill=(255, n * 6 % 255, 0, 255))
+        images.append(image)
+    buffer = io.BytesIO(); images[0].save(buffer, format="GIF", save_all=True, append_images=images[1:], duration=40, loop=0)
+    return buffer.getvalue()
+
+async def lag_probe(samples: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append(max(0.0, time.perf_counter() - started - PROBE_INTERVAL))
+
+async def run_inline(inputs: list):
+    for data in inputs:
+        decode_image(data, EMOTE_SIZE, encode_png=True)
+        await asyncio.sleep(0) # What the old code did: decode, then yield at the next await
+
+async def run_pipeline(inputs: list, pipeline: ImagePipeline):
+    await asyncio.gather(*(pipeline.decode_image(data, EMOTE_SIZE, encode_png=True) for data in inputs))
+
+async def measure(label: str, workload) -> dict:
+    samples, stop = [], asyncio.Event()
+    probe = asyncio.create_task(lag_probe(samples, stop))
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    await workload
+    elapsed = time.perf_counter() - started
+    stop.set(); await probe
+    samples.sort()
+    return {
+        "label": label, "elapsed_ms": elapsed * 1000,
+        "lag_mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "lag_p99_ms": samples[int(len(samples) * 0.99) - 1] * 1000 if samples else 0.0,
+        "lag_max_ms": samples[-1] * 1000 if samples else 0.0,
+    }
+
+async def main(image_count: int):
+    static_png, animated_gif = make_static_png(), make_animated_gif()
+    inputs = [static_png if i % 2 else animated_gif for i in range(image_count)]
+    pipeline = ImagePipeline()
+    results = [await measure("inline (loop thread)", run_inline(inputs)),
+               await measure("ImagePipeline", run_pipeline(inputs, pipeline))]
+    pipeline.shutdown()
+    print(f"{image_count} images ({image_count // 2} static 512px PNG, {image_count - image_count // 2} animated GIF) -> {EMOTE_SIZE}")
+    print(f"{'mode':<22}{'total ms':>10}{'lag mean':>10}{'lag p99':>10}{'lag max':>10}")
+    for r in results:
+        print(f"{r['label']:<22}{r['elapsed_ms']:>10.1f}{r['lag_mean_ms']:>10.2f}{r['lag_p99_ms']:>10.2f}{r['lag_max_ms']:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=60)
+    asyncio.run(main(parser.parse_args().images))
@@ -0,0 +1,113 @@
+# benchmarks/bench_pusher_decode.py
+"""Pusher frame decoding: the old double json.loads per frame vs. the peek-first fast path.
+
+Frames come from a corpus file with one raw frame per line (as received from the socket), or are
+synthesized in Kick's wire format when none is given. Run from the repository root:
+    python benchmarks/bench_pusher_decode.py [--corpus frames.ndjson] [--frames 50000] [--write-corpus out.ndjson]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pusher_codec
+from kick_chat import HANDLED_PROTOCOL_EVENTS
+from pusher_codec import CHAT_MESSAGE_EVENT, peek_channel, peek_event
+
+WORDS = "the a chat is so back its over no way bro what did he just say lol true real this stream KEKW OMEGALUL".split()
+
+def legacy_decode(frame: str, subscribed: set):
+    # The recv loop before the fast path: envelope and inner data always decoded with the stdlib
+    message_data = json.loads(frame)
+    event_name = message_data.get("event")
+    if event_name == "App\\Events\\ChatMessageEvent":
+        data = message_data.get("data")
+        if data and message_data.get("channel") in subscribed: return json.loads(data)
+    elif event_name == "pusher:ping":
+        return json.dumps({"event": "pusher:pong", "data": {}})
+    return None
+
+def fast_decode(frame, subscribed: set, loads):
+    # Mirrors PusherConnection._run_session's classification, with the JSON backend injectable
+    event_name = peek_event(frame)
+    if event_name == CHAT_MESSAGE_EVENT:
+        if peek_channel(frame) not in subscribed: return None
+    elif event_name == "pusher:ping":
+        return pusher_codec.PUSHER_PONG_FRAME
+    elif event_name not in HANDLED_PROTOCOL_EVENTS:
+        return None
+    message_data = loads(frame)
+    data = message_data.get("data")
+    return loads(data) if isinstance(data, (str, bytes)) and data else data
+
+def synthesize_corpus(count: int, rng: random.Random) -> list:
+    """Kick-shaped frames: mostly chat, some for chatrooms no longer subscribed, plus pings and moderation events."""
+    started = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    frames = []
+    for n in range(count):
+        roll = rng.random()
+        channel = f"chatrooms.{rng.choice((1001, 1002, 1003, 9999))}.v2" # 9999: recently left, frames still trickling in
+        if roll < 0.01:
+            frames.append(json.dumps({"event": "pusher:ping", "data": {}}, separators=(",", ":")))
+            continue
+        if roll < 0.03:
+            event, data = "App\\Events\\UserBannedEvent", {"id": str(n), "user": {"username": "someone"}, "banned_by": {"username": "mod"}}
+        else:
+            event = CHAT_MESSAGE_EVENT
+            content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 25)))
+            if rng.random() < 0.3: content += f" [emote:{rng.randint(1, 4000000)}:KEKW]"
+            data = {
+                "id": f"{rng.getrandbits(128):032x}", "chatroom_id": int(channel.split(".")[1]), "content": content, "type": "message",
+                "created_at": (started + timedelta(milliseconds=n * 40)).isoformat().replace("+00:00", "Z"),
+                "sender": {"id": rng.randint(1, 10**8), "username": f"user{rng.randint(1, 5000)}", "slug": "user",
+                           "identity": {"color": "#%06X" % rng.getrandbits(24),
+                                        "badges": [{"type": "subscriber", "text": "Subscriber", "count": rng.randint(1, 24)}] if rng.random() < 0.4 else []}},
+                "metadata": None}
+        frames.append(json.dumps({"event": event, "data": json.dumps(data), "channel": channel}, separators=(",", ":")))
+    return frames
+
+def time_it(func, frames: list, repeats: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for frame in frames: func(frame)
+        best = min(best, time.perf_counter() - started)
+    return len(frames) / best
+
+def main(corpus: str | None, frame_count: int, write_corpus: str | None):
+    if corpus:
+        text_frames = [line for line in Path(corpus).read_text(encoding="utf-8").splitlines() if line.strip()]
+        source = corpus
+    else:
+        text_frames = synthesize_corpus(frame_count, random.Random(7))
+        source = "synthetic"
+    if write_corpus:
+        Path(write_corpus).write_text("\n".join(text_frames) + "\n", encoding="utf-8")
+        print(f"Wrote {len(text_frames)} frames to {write_corpus}")
+    byte_frames = [frame.encode("utf-8") for frame in text_frames]
+    subscribed = {"chatrooms.1001.v2", "chatrooms.1002.v2", "chatrooms.1003.v2"}
+    megabytes = sum(len(frame) for frame in byte_frames) / 1e6
+
+    print(f"{len(text_frames)} frames ({megabytes:.1f} MB) from {source}; accelerated backend: {pusher_codec.JSON_BACKEND}")
+    results = {
+        "legacy (2x json.loads, str)": time_it(lambda f: legacy_decode(f, subscribed), text_frames),
+        "fast path, stdlib json (str)": time_it(lambda f: fast_decode(f, subscribed, json.loads), text_frames),
+        f"fast path, {pusher_codec.JSON_BACKEND} (bytes)": time_it(lambda f: fast_decode(f, subscribed, pusher_codec.loads), byte_frames),
+    }
+    baseline = next(iter(results.values()))
+    print(f"{'decoder':<32}{'frames/s':>12}{'MB/s':>8}{'speedup':>9}")
+    for name, frames_per_second in results.items():
+        print(f"{name:<32}{frames_per_second:>12,.0f}{frames_per_second / len(byte_frames) * megabytes:>8.1f}{frames_per_second / baseline:>8.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="file with one raw Pusher frame per line")
+    parser.add_argument("--frames", type=int, default=50000, help="synthetic corpus size when --corpus is not given")
+    parser.add_argument("--write-corpus", help="also save the frames used to this file")
+    args = parser.parse_args()
+    main(args.corpus, args.frames, args.write_corpus)
@@ -0,0 +1,114 @@
+# benchmarks/bench_tokenizer.py
+"""Message tokenizer vs. the previous ChannelTab._parse_message_content.
+
+Run from the repository root:  python benchmarks/bench_tokenizer.py [--messages 5000]
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from emote_manager import EmoteManager
+from emote_providers import SevenTVEmoteProvider
+from message_tokenizer import MessageTokenizer
+
+def legacy_get_7tv_emote_data(emote_manager, emote_name: str, channel_slug: str) -> dict | None:
+    # EmoteManager.get_7tv_emote_data before the provider registry: channel set, then global set
+    providers = emote_manager.providers
+    return providers.channel_emotes("7tv", channel_slug).get(emote_name) or providers.global_sets.get("7tv", {}).get(emote_name)
+
+def legacy_parse_message_content(emote_manager, content_with_kick_placeholders: str, kick_emotes_meta: list, channel_slug_for_7tv: str):
+    # Copy of ChannelTab._parse_message_content before the tokenizer, kept as the baseline
+    final_parts = []
+    kick_pattern = re.compile(r"\[emote:(\d+):([^\]]+)\]")
+    kick_emote_data_map = {str(e.get("id", "")): e for e in kick_emotes_meta if e.get("id")}
+    last_idx_kick = 0
+    intermediate_segments = []
+    for kick_match in kick_pattern.finditer(content_with_kick_placeholders):
+        emote_id_in_placeholder = kick_match.group(1)
+        start, end = kick_match.span()
+        if start > last_idx_kick: intermediate_segments.append(("text", content_with_kick_placeholders[last_idx_kick:start]))
+        kick_emote_obj = kick_emote_data_map.get(emote_id_in_placeholder)
+        intermediate_segments.append(("kick_emote", kick_emote_obj) if kick_emote_obj else ("text", kick_match.group(0)))
+        last_idx_kick = end
+    if last_idx_kick < len(content_with_kick_placeholders): intermediate_segments.append(("text", content_with_kick_placeholders[last_idx_kick:]))
+
+    if not emote_manager: return intermediate_segments
+    for part_type, part_data in intermediate_segments:
+        if part_type == "text":
+            text_segment = part_data
+            words = re.split(r'(\s+)', text_segment)
+            for word_or_space in words:
+                if not word_or_space.strip():
+                    final_parts.append(("text", word_or_space))
+                    continue
+                seventv_emote_data = legacy_get_7tv_emote_data(emote_manager, word_or_space, channel_slug_for_7tv)
+                if seventv_emote_data: final_parts.append(("7tv_emote", seventv_emote_data))
+                else: final_parts.append(("text", word_or_space))
+        else: final_parts.append((part_type, part_data))
+
+    consolidated_parts = []; current_text = ""
+    for p_type, p_data in final_parts:
+        if p_type == "text": current_text += p_data
+        else:
+            if current_text: consolidated_parts.append(("text", current_text)); current_text = ""
+            consolidated_parts.append((p_type, p_data))
+    if current_text: consolidated_parts.append(("text", current_text))
+    return consolidated_parts
+
+WORDS = "the a chat is so back its over no way bro what did he just say lol true real this stream".split()
+
+def build_emote_manager(rng: random.Random, channel_slug: str) -> tuple:
+    emote_manager = EmoteManager(None, None, providers=[SevenTVEmoteProvider(None)])
+    def emote(name, source): return {"url": f"https://cdn.7tv.app/emote/{name}/1x.webp", "name": name, "id": name, "animated": False, "source": source}
+    global_names = [f"Glob{n}" for n in range(300)]
+    channel_names = [f"Chan{n}" for n in range(1200)]
+    emote_manager.providers.set_global_emotes("7tv", {name: emote(name, "7tv_global") for name in global_names})
+    emote_manager.providers.open_channels.add(channel_slug)
+    emote_manager.providers.set_channel_emotes("7tv", channel_slug, {name: emote(name, "7tv_channel") for name in channel_names})
+    return emote_manager, global_names + channel_names
+
+def make_messages(rng: random.Random, emote_names: list, count: int, emote_ratio: float) -> list:
+    messages = []
+    for _ in range(count):
+        words = []
+        for _ in range(rng.randint(4, 20)):
+            roll = rng.random()
+            if roll < emote_ratio * 0.3: words.append(f"[emote:{rng.randint(1, 99999)}:KEKW]")
+            elif roll < emote_ratio: words.append(rng.choice(emote_names))
+            else: words.append(rng.choice(WORDS))
+        messages.append(" ".join(words))
+    return messages
+
+def time_it(func, messages: list) -> float:
+    started = time.perf_counter()
+    for message in messages: func(message)
+    return (time.perf_counter() - started) / len(messages) * 1e6
+
+def main(message_count: int):
+    rng = random.Random(7)
+    channel_slug = "bench"
+    emote_manager, emote_names = build_emote_manager(rng, channel_slug)
+    emote_index = emote_manager.get_emote_index(channel_slug)
+    cases = {
+        "plain": make_messages(rng, emote_names, message_count, 0.0),
+        "emote-heavy": make_messages(rng, emote_names, message_count, 0.6),
+        "copypasta": make_messages(rng, emote_names, 20, 0.4) * (message_count // 20),
+    }
+    print(f"{'case':<14}{'legacy us/msg':>15}{'tokenizer us/msg':>18}{'+LRU us/msg':>14}{'speedup':>9}")
+    for name, messages in cases.items():
+        legacy = time_it(lambda m: legacy_parse_message_content(emote_manager, m, [], channel_slug), messages)
+        uncached = MessageTokenizer(cache_size=0)
+        fresh = time_it(lambda m: uncached.tokenize(m, emote_index), messages)
+        cached_tokenizer = MessageTokenizer()
+        cached = time_it(lambda m: cached_tokenizer.tokenize(m, emote_index), messages)
+        print(f"{name:<14}{legacy:>15.2f}{fresh:>18.2f}{cached:>14.2f}{legacy / cached:>8.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=5000)
+    main(parser.parse_args().messages)
@@ -0,0 +1,285 @@
+# benchmarks/fake_kick_server.py
+"""Local stand-in for Kick's Pusher socket and channel API, for offline end-to-end and load tests.
+
+Serves, on one port:
+  ws   /app/<key>                         Pusher protocol 7: connection_established, subscribe/unsubscribe, ping/pong
+  GET  /api/v2/channels/<slug>            channel info (chatroom id, livestream, subscriber_badges)
+  GET  /api/v2/channels/<id>/messages     recent chat, for reconnect backfill
+  GET  /emotes/<slug>                     Kick emote groups: the channel's own set, Global and Emoji
+
+Chat is either synthetic (--rate messages/sec per channel, with a realistic emote and badge mix)
+or replayed from NDJSON at --speed x (normalized records as written by headless.py or
+`python chat_archive.py <channel>`, or raw Pusher frames, one per line).
+
+Run from the repository root, then point the app or headless ingestion at it:
+    python benchmarks/fake_kick_server.py --channels alpha,beta --rate 50
+    KICKERINO_PUSHER_URL=ws://127.0.0.1:8765/app/local KICKERINO_API_BASE_URL=http://127.0.0.1:8765/api/v2 python main.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime, timezone
+from pathlib import Path
+
+from aiohttp import WSMsgType, web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pusher_codec import CHAT_MESSAGE_EVENT, dumps, loads
+
+HISTORY_SIZE = 50 # Messages kept per channel for the /messages endpoint
+TICK_SECONDS = 0.01 # Synthetic generators emit in 10 ms batches
+ACTIVITY_TIMEOUT = 120
+
+WORDS = ("the a chat is so back its over no way bro what did he just say lol true real this stream "
+         "W L clip it ratio fr hes cooking gg go next chat is this real").split()
+SEVENTV_STYLE_WORDS = "KEKW OMEGALUL Pog PogU LULW monkaS Sadge catJAM peepoHappy EZ Clap FeelsStrongMan".split()
+KICK_EMOTES = [(37226, "KEKLEO"), (37227, "LULW"), (37230, "POLICE"), (37232, "PatrickBoo"), (39251, "beeBobble"), (39261, "vibePlz")]
+BADGE_MIX = [ # (probability, badge)
+    (0.35, {"type": "subscriber", "text": "Subscriber"}),
+    (0.03, {"type": "moderator", "text": "Moderator"}),
+    (0.02, {"type": "vip", "text": "VIP"}),
+    (0.02, {"type": "og", "text": "OG"}),
+    (0.01, {"type": "founder", "text": "Founder"}),
+    (0.04, {"type": "sub_gifter", "text": "Sub Gifter"}),
+]
+SUBSCRIBER_BADGE_MONTHS = (1, 2, 3, 6, 9, 12, 18, 24)
+CHANNEL_EMOTE_SUFFIXES = ("Hype", "Love", "Wave", "Rage")
+
+def iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+def stable_id(text: str, base: int) -> int:
+    return base + zlib.crc32(text.encode("utf-8")) % 1_000_000
+
+class FakeChannel:
+    def __init__(self, slug: str):
+        self.slug = slug
+        self.channel_id = stable_id(slug, 1_000_000)
+        self.chatroom_id = stable_id(slug, 2_000_000)
+        self.pusher_channel = f"chatrooms.{self.chatroom_id}.v2"
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.sent = 0
+
+    def info(self) -> dict:
+        return {
+            "id": self.channel_id, "slug": self.slug, "user_id": self.channel_id, "user": {"id": self.channel_id, "username": self.slug},
+            "chatroom": {"id": self.chatroom_id, "channel_id": self.channel_id},
+            "livestream": {"session_title": f"{self.slug} fake stream", "viewer_count": random.randint(100, 50000),
+                           "is_live": True, "categories": [{"name": "Just Chatting"}]},
+            "subscriber_badges": [{"id": months, "channel_id": self.channel_id, "months": months,
+                                   "badge_image": {"src": f"https://files.kick.com/channel_subscriber_badges/{months}/original"}}
+                                  for months in SUBSCRIBER_BADGE_MONTHS],
+        }
+
+    def emote_groups(self) -> list:
+        channel_emotes = [{"id": stable_id(f"{self.slug}{suffix}", 3_000_000), "channel_id": self.channel_id, "name": f"{self.slug}{suffix}",
+                           "subscribers_only": True} for suffix in CHANNEL_EMOTE_SUFFIXES]
+        return [{"id": self.channel_id, "user_id": self.channel_id, "slug": self.slug, "emotes": channel_emotes},
+                {"id": "Global", "name": "Global", "emotes": [{"id": emote_id, "channel_id": None, "name": name} for emote_id, name in KICK_EMOTES]}]
+
+class FakeKickServer:
+    def __init__(self, slugs: list, rate: float = 0.0, rng: random.Random | None = None):
+        self.channels = {slug: FakeChannel(slug) for slug in slugs}
+        self.by_channel_id = {c.channel_id: c for c in self.channels.values()}
+        self.by_pusher_channel = {c.pusher_channel: c for c in self.channels.values()}
+        self.rate = rate
+        self.rng = rng or random.Random()
+        self.subscribers = {} # Pusher channel name -> set of WebSocketResponse
+        self.sockets = set()
+        self.frames_sent = 0
+        self.users = [(n, f"viewer{n}", "#%06X" % self.rng.getrandbits(24)) for n in range(1, 5001)]
+
+    def channel(self, slug: str) -> FakeChannel:
+        if slug not in self.channels: # Unknown slugs get a channel on demand, so any name "exists"
+            channel = FakeChannel(slug)
+            self.channels[slug] = channel
+            self.by_channel_id[channel.channel_id] = channel
+            self.by_pusher_channel[channel.pusher_channel] = channel
+        return self.channels[slug]
+
+    # --- HTTP ---
+    async def handle_channel(self, request: web.Request):
+        key = request.match_info["slug"]
+        if key.isdigit() and int(key) in self.by_channel_id: return web.json_response(self.by_channel_id[int(key)].info())
+        return web.json_response(self.channel(key).info())
+
+    async def handle_emotes(self, request: web.Request):
+        return web.json_response(self.channel(request.match_info["slug"].lower()).emote_groups())
+
+    async def handle_messages(self, request: web.Request):
+        channel = self.by_channel_id.get(int(request.match_info["channel_id"]))
+        if channel is None: return web.json_response({"status": {"error": True, "code": 404}}, status=404)
+        return web.json_response({"status": {"error": False, "code": 200}, "data": {"messages": list(channel.history)[::-1], "cursor": None}})
+
+    # --- Pusher ---
+    async def handle_socket(self, request: web.Request):
+        websocket = web.WebSocketResponse(autoping=True)
+        await websocket.prepare(request)
+        self.sockets.add(websocket)
+        await websocket.send_str(dumps({"event": "pusher:connection_established",
+                                        "data": dumps({"socket_id": f"{random.randint(1, 10**6)}.{random.randint(1, 10**6)}", "activity_timeout": ACTIVITY_TIMEOUT})}))
+        try:
+            async for message in websocket:
+                if message.type != WSMsgType.TEXT: continue
+                try: frame = loads(message.data)
+                except ValueError: continue
+                event, data = frame.get("event"), frame.get("data") or {}
+                if event == "pusher:ping":
+                    await websocket.send_str(dumps({"event": "pusher:pong", "data": {}}))
+                elif event == "pusher:subscribe":
+                    channel_name = data.get("channel")
+                    self.subscribers.setdefault(channel_name, set()).add(websocket)
+                    await websocket.send_str(dumps({"event": "pusher_internal:subscription_succeeded", "data": "{}", "channel": channel_name}))
+                elif event == "pusher:unsubscribe":
+                    self.subscribers.get(data.get("channel"), set()).discard(websocket)
+        finally:
+            self.sockets.discard(websocket)
+            for sockets in self.subscribers.values(): sockets.discard(websocket)
+        return websocket
+
+    async def publish(self, channel: FakeChannel, message: dict):
+        """Sends one chat message to every socket subscribed to the channel; the frame is encoded once."""
+        channel.history.append(message)
+        channel.sent += 1
+        sockets = self.subscribers.get(channel.pusher_channel)
+        if not sockets: return
+        frame = dumps({"event": CHAT_MESSAGE_EVENT, "data": dumps(message), "channel": channel.pusher_channel})
+        for websocket in list(sockets):
+            if websocket.closed: continue
+            try: await websocket.send_str(frame); self.frames_sent += 1
+            except ConnectionError: sockets.discard(websocket)
+
+    async def drop_all_sockets(self):
+        for websocket in list(self.sockets):
+            await websocket.close(code=4200, message=b"Fake server reconnect test")
+
+    # --- Traffic ---
+    def synthetic_message(self, channel: FakeChannel) -> dict:
+        rng = self.rng
+        words = []
+        for _ in range(rng.choice((1, 2, 3, 4, 6, 8, 12, 20))):
+            roll = rng.random()
+            if roll < 0.12: emote_id, name = rng.choice(KICK_EMOTES); words.append(f"[emote:{emote_id}:{name}]")
+            elif roll < 0.35: words.append(rng.choice(SEVENTV_STYLE_WORDS))
+            elif roll < 0.37: words.append(f"@{rng.choice(self.users)[1]}")
+            else: words.append(rng.choice(WORDS))
+        user_id, username, color = rng.choice(self.users)
+        badges = []
+        for probability, badge in BADGE_MIX:
+            if rng.random() < probability:
+                badge = dict(badge)
+                if badge["type"] == "subscriber": badge["count"] = rng.choice(SUBSCRIBER_BADGE_MONTHS)
+                if badge["type"] == "sub_gifter": badge["count"] = rng.choice((1, 5, 25, 100))
+                badges.append(badge)
+        return {"id": str(uuid.uuid4()), "chatroom_id": channel.chatroom_id, "content": " ".join(words), "type": "message",
+                "created_at": iso_now(), "sender": {"id": user_id, "username": username, "slug": username.lower(),
+                                                    "identity": {"color": color, "badges": badges}}}
+
+    async def generate(self, channel: FakeChannel):
+        """rate msgs/sec for one channel, emitted in TICK_SECONDS batches so high rates stay accurate."""
+        loop = asyncio.get_running_loop()
+        next_tick, owed = loop.time(), 0.0
+        while True:
+            owed += self.rate * TICK_SECONDS
+            while owed >= 1:
+                owed -= 1
+                await self.publish(channel, self.synthetic_message(channel))
+            next_tick += TICK_SECONDS
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+
+    async def replay(self, path: Path, speed: float, loop_forever: bool):
+        """Replays an NDJSON recording at speed x, keeping the original spacing between messages."""
+        while True:
+            started_wall, first_ts = asyncio.get_running_loop().time(), None
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip(): continue
+                    try: record = json.loads(line)
+                    except ValueError: continue
+                    replayed = replay_message(record)
+                    if replayed is None: continue
+                    slug, message, ts = replayed
+                    if ts is not None:
+                        first_ts = ts if first_ts is None else first_ts
+                        delay = started_wall + (ts - first_ts) / speed - asyncio.get_running_loop().time()
+                        if delay > 0: await asyncio.sleep(delay)
+                    message["id"] = str(uuid.uuid4()) # Fresh ids so looped replays aren't de-duplicated away
+                    message["created_at"] = iso_now()
+                    await self.publish(self.channel(slug), message)
+            if not loop_forever: return
+
+def replay_message(record: dict):
+    """(channel slug, ChatMessageEvent data, original timestamp) for a recorded line, or None for non-chat lines."""
+    if "event" in record: # Raw Pusher frame
+        if record.get("event") != CHAT_MESSAGE_EVENT: return None
+        message = json.loads(record["data"]) if isinstance(record.get("data"), str) else record.get("data") or {}
+        slug = f"chatroom{message.get('chatroom_id') or record.get('channel', '').split('.')[1]}"
+        created = message.get("created_at")
+        return slug, message, datetime.fromisoformat(created.replace("Z", "+00:00")).timestamp() if created else None
+    if record.get("type") != "chat": return None
+    message = {"content": record.get("content") or "", "type": record.get("message_type") or "message",
+               "sender": {"id": record.get("user_id"), "username": record.get("user"), "slug": (record.get("user") or "").lower(),
+                          "identity": {"color": record.get("color"), "badges": record.get("badges") or []}}}
+    return record.get("channel") or "replay", message, record.get("received_at")
+
+def build_app(server: FakeKickServer) -> web.Application:
+    app = web.Application()
+    app.router.add_get("/app/{key}", server.handle_socket)
+    app.router.add_get("/api/v2/channels/{channel_id:\\d+}/messages", server.handle_messages)
+    app.router.add_get("/api/v2/channels/{slug}", server.handle_channel)
+    app.router.add_get("/emotes/{slug}", server.handle_emotes)
+    return app
+
+async def serve(args):
+    server = FakeKickServer([s.strip().lower() for s in args.channels.split(",") if s.strip()], args.rate, random.Random(args.seed))
+    runner = web.AppRunner(build_app(server))
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    base = f"{args.host}:{args.port}"
+    print(f"Fake Kick server on {base}. Point clients at it with:\n"
+          f"  KICKERINO_PUSHER_URL=ws://{base}/app/local KICKERINO_API_BASE_URL=http://{base}/api/v2", flush=True)
+    tasks = []
+    if args.replay:
+        tasks.append(asyncio.create_task(server.replay(Path(args.replay), args.speed, args.loop)))
+    elif args.rate > 0:
+        tasks.extend(asyncio.create_task(server.generate(channel)) for channel in list(server.channels.values()))
+    async def drop_periodically():
+        while True:
+            await asyncio.sleep(args.drop_every)
+            print(f"Dropping {len(server.sockets)} sockets.", flush=True)
+            await server.drop_all_sockets()
+    if args.drop_every: tasks.append(asyncio.create_task(drop_periodically()))
+    try:
+        last_sent, last_time = 0, time.monotonic()
+        for _ in itertools.count():
+            await asyncio.sleep(args.stats_interval)
+            now, sent = time.monotonic(), sum(c.sent for c in server.channels.values())
+            print(f"{(sent - last_sent) / (now - last_time):,.0f} msgs/s generated, {server.frames_sent:,} frames sent, "
+                  f"{len(server.sockets)} sockets", flush=True)
+            last_sent, last_time = sent, now
+    finally:
+        for task in tasks: task.cancel()
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--channels", default="alpha,beta", help="comma-separated slugs that exist up front (others are created on lookup)")
+    parser.add_argument("--rate", type=float, default=20.0, help="synthetic messages/sec per channel (0 = none)")
+    parser.add_argument("--replay", help="NDJSON recording to replay instead of synthetic chat")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier")
+    parser.add_argument("--loop", action="store_true", help="restart the replay when it ends")
+    parser.add_argument("--drop-every", type=float, default=0, help="close every socket every N seconds, to exercise reconnects")
+    parser.add_argument("--stats-interval", type=float, default=5.0)
+    parser.add_argument("--seed", type=int)
+    try: asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt: pass
@@ -0,0 +1,288 @@
+# benchmarks/suite.py
+"""Microbenchmarks for the chat hot paths, compared against a saved baseline.
+
+Runs offline: inputs are built deterministically, or read from benchmarks/fixtures/ when real captures
+are placed there (seventv_emote_set.json, static_emote.*, animated_emote.*, chat_messages.ndjson).
+The display_chat_message case needs a display; on a headless machine run it under a virtual one
+(xvfb-run python benchmarks/suite.py), otherwise it is skipped.
+
+Run from the repository root:
+    python benchmarks/suite.py                     # run, compare with benchmarks/baseline.json
+    python benchmarks/suite.py --save-baseline     # run and record the results as the new baseline
+    python benchmarks/suite.py --only parse --threshold 0.1
+Exits with status 1 when any case is slower than its baseline by more than --threshold.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw
+
+from emote_manager import EmoteManager
+from emote_providers import SevenTVEmoteProvider
+from fake_kick_server import FakeKickServer, KICK_EMOTES, SEVENTV_STYLE_WORDS
+from image_pipeline import ImagePipeline
+from message_tokenizer import KICK_EMOTE_URL_TEMPLATE
+
+BENCH_DIR = Path(__file__).resolve().parent
+FIXTURE_DIR = BENCH_DIR / "fixtures"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+DEFAULT_THRESHOLD = 0.20 # A case regresses when it is this much slower than its baseline
+MIN_RUN_SECONDS = 0.2 # Each timed repeat is scaled up to at least this long
+REPEATS = 5 # Best of
+SEED = 7
+
+class Skip(Exception):
+    """Raised by a case that can't run here (e.g. no display)."""
+
+# --- Fixtures ---
+def seventv_emote_set(emote_count: int = 1000, rng: random.Random | None = None) -> bytes:
+    """A 7TV v3 emote-set document: per emote, 1x-4x in AVIF/WEBP (plus GIF and *_static files when animated)."""
+    fixture = FIXTURE_DIR / "seventv_emote_set.json"
+    if fixture.exists(): return fixture.read_bytes()
+    rng = rng or random.Random(SEED)
+    emotes = []
+    for n in range(emote_count):
+        animated = rng.random() < 0.4
+        files = []
+        for scale in range(1, 5):
+            for fmt in (("AVIF", "WEBP", "GIF") if animated else ("AVIF", "WEBP", "PNG")):
+                files.append({"name": f"{scale}x.{fmt.lower()}", "static_name": f"{scale}x_static.{fmt.lower()}",
+                              "width": 32 * scale, "height": 32 * scale, "frame_count": 24 if animated else 1,
+                              "size": rng.randint(500, 90000), "format": fmt})
+        name = f"{rng.choice(SEVENTV_STYLE_WORDS)}{n}"
+        emotes.append({"id": f"{rng.getrandbits(96):024x}", "name": name, "flags": 0, "timestamp": 1700000000000 + n,
+                       "actor_id": None, "data": {"id": f"{rng.getrandbits(96):024x}", "name": name, "flags": 0,
+                       "lifecycle": 3, "state": ["LISTED"], "listed": True, "animated": animated,
+                       "owner": {"id": f"{rng.getrandbits(96):024x}", "username": "owner", "display_name": "owner"},
+                       "host": {"url": f"//cdn.7tv.app/emote/{n:024x}", "files": files}}})
+    return json.dumps({"id": "bench", "name": "Bench set", "emotes": emotes, "emote_count": len(emotes), "capacity": 1000}).encode("utf-8")
+
+def large_file_lists(list_count: int = 2000, rng: random.Random | None = None) -> list:
+    """7TV file lists of 8-40 entries, a third of them with no WEBP/PNG (the slow fallback path)."""
+    rng = rng or random.Random(SEED)
+    lists = []
+    for _ in range(list_count):
+        formats = ("AVIF", "GIF") if rng.random() < 0.33 else ("AVIF", "GIF", "WEBP", "PNG")
+        files = [{"name": f"{scale}x{suffix}.{fmt.lower()}", "format": fmt}
+                 for scale in range(1, rng.randint(3, 6)) for suffix in ("", "_static") for fmt in formats]
+        rng.shuffle(files)
+        lists.append(files)
+    return lists
+
+def chat_messages(count: int, emote_heavy: bool, rng: random.Random | None = None) -> list:
+    """Kick ChatMessageEvent payloads. Emote-heavy ones are mostly 7TV words and Kick placeholders."""
+    fixture = FIXTURE_DIR / "chat_messages.ndjson"
+    if fixture.exists():
+        messages = [json.loads(line) for line in fixture.read_text(encoding="utf-8").splitlines() if line.strip()]
+        return [m for m in messages if (m.get("content", "").count("[emote:") + sum(w in SEVENTV_STYLE_WORDS for w in m.get("content", "").split()) > 2) == emote_heavy] or messages
+    rng = rng or random.Random(SEED)
+    server = FakeKickServer(["bench"], rng=rng)
+    channel = server.channel("bench")
+    messages = []
+    for _ in range(count):
+        message = server.synthetic_message(channel)
+        if emote_heavy:
+            words = [rng.choice(SEVENTV_STYLE_WORDS) if rng.random() < 0.6 else
+                     "[emote:%d:%s]" % rng.choice(KICK_EMOTES) for _ in range(rng.randint(3, 12))]
+            message["content"] = " ".join(words)
+        else:
+            message["content"] = " ".join(w for w in message["content"].split() if not w.startswith("[emote:") and w not in SEVENTV_STYLE_WORDS) or "hello chat"
+        messages.append(message)
+    return messages
+
+def image_fixture(animated: bool) -> bytes:
+    for path in FIXTURE_DIR.glob("animated_emote.*" if animated else "static_emote.*"): return path.read_bytes()
+    size = 112 if animated else 128 # 7TV 4x files
+    if not animated:
+        image = Image.new("RGBA", (size, size))
+        draw = ImageDraw.Draw(image)
+        for i in range(0, size, 4): draw.line((0, i, size, size - i), fill=(i * 2 % 255, 80, 200, 255), width=2)
+        buffer = io.BytesIO(); image.save(buffer, format="WEBP", quality=90)
+        return buffer.getvalue()
+    frames = []
+    for n in range(24):
+        image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+        ImageDraw.Draw(image).ellipse((n, n, size - n, size - n), fill=(255, n * 10 % 255, 0, 255))
+        frames.append(image)
+    buffer = io.BytesIO(); frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=50, loop=0)
+    return buffer.getvalue()
+
+def bench_emote_manager(slug: str) -> EmoteManager:
+    emote_manager = EmoteManager(None, None, providers=[SevenTVEmoteProvider(None)])
+    emote_map = SevenTVEmoteProvider.build_emote_map(json.loads(seventv_emote_set(400))["emotes"], "7tv_channel")
+    for word in SEVENTV_STYLE_WORDS: # So the fixture words used in messages resolve
+        emote_map[word] = {"url": f"https://cdn.7tv.app/emote/{word}/1x.webp", "name": word, "id": word, "animated": False, "source": "7tv_channel"}
+    emote_manager.providers.open_channels.add(slug)
+    emote_manager.providers.set_channel_emotes("7tv", slug, emote_map)
+    return emote_manager
+
+# --- Cases: each returns (run(n) -> None, unit label); run performs n operations ---
+def case_parse(emote_heavy: bool):
+    from channel_tab import ChannelTab
+    slug = "bench"
+    stub_tab = SimpleNamespace(app=SimpleNamespace(emote_manager=bench_emote_manager(slug)))
+    messages = [m["content"] for m in chat_messages(3000, emote_heavy)] # More than the tokenizer LRU holds: every parse is a miss
+    def run(n):
+        for i in range(n): ChannelTab._parse_message_content(stub_tab, messages[i % len(messages)], [], slug)
+    return run, "message"
+
+def case_select_7tv_file():
+    file_lists = large_file_lists()
+    def run(n):
+        for i in range(n): SevenTVEmoteProvider.select_emote_file(file_lists[i % len(file_lists)])
+    return run, "file list"
+
+def case_build_7tv_map():
+    document = seventv_emote_set()
+    def run(n):
+        for _ in range(n): SevenTVEmoteProvider.build_emote_map(json.loads(document).get("emotes", []), "7tv_channel")
+    return run, "emote set"
+
+def case_fetch_and_process(animated: bool):
+    data = image_fixture(animated)
+    pipeline = ImagePipeline()
+    emote_manager = EmoteManager(None, None, image_pipeline=pipeline)
+    async def download(image_url, name_for_log, source_for_log): return data
+    emote_manager._download_image_bytes = download # No network, no disk cache: measures decode + resize only
+    loop = asyncio.new_event_loop()
+    def run(n):
+        async def batch():
+            results = await asyncio.gather(*(emote_manager._fetch_and_process_image(f"https://bench/{i}", "bench", "bench") for i in range(n)))
+            if any(r is None for r in results): raise RuntimeError("image fixture failed to decode")
+        loop.run_until_complete(batch())
+    run.cleanup = lambda: (pipeline.shutdown(), loop.close())
+    return run, "image"
+
+def case_display_chat_message():
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        raise Skip("no display; run under xvfb-run to include it")
+    import customtkinter as ctk
+    from channel_tab import ChannelTab
+    from image_pipeline import decode_image
+    try: root = ctk.CTk()
+    except Exception as e: raise Skip(f"Tk unavailable: {e}")
+    root.geometry("900x750")
+    slug = "bench"
+    emote_manager = bench_emote_manager(slug)
+    emote_png = image_fixture(False)
+    for emote in emote_manager.providers.channel_emotes("7tv", slug).values(): # Every emote already loaded, as in a warm session
+        emote_manager.image_cache.put("7tv_emote", emote["url"], decode_image(emote_png, emote_manager.emote_size))
+    for emote_id, _name in KICK_EMOTES:
+        emote_manager.image_cache.put("kick_emote", KICK_EMOTE_URL_TEMPLATE.format(emote_id=emote_id), decode_image(emote_png, emote_manager.emote_size))
+    app = SimpleNamespace(emote_manager=emote_manager, badge_manager=None, image_cache=emote_manager.image_cache, loop=None, SCROLLBACK_LIMIT=500,
+                          APP_FONT_FAMILY="Segoe UI", DEFAULT_FONT_SIZE=13, DEFAULT_FONT=("Segoe UI", 13),
+                          TITLE_FONT=("Segoe UI", 15, "bold"), INFO_FONT=("Segoe UI", 12), close_specific_channel=lambda slug: None)
+    tab = ChannelTab(root, slug, app)
+    tab.pack(expand=True, fill="both")
+    root.update()
+    rng = random.Random(SEED)
+    messages = chat_messages(1000, False, rng) + chat_messages(1000, True, rng)
+    rng.shuffle(messages)
+    def run(n):
+        for i in range(n):
+            tab.display_chat_message(messages[i % len(messages)])
+            if i % 25 == 24: root.update() # The dispatcher yields to Tk between frames
+        root.update()
+    run.cleanup = root.destroy
+    return run, "message"
+
+def case_import_main():
+    # Cold start budget: a fresh interpreter importing the app module (window creation excluded)
+    repo_root = str(BENCH_DIR.parent)
+    def run(n):
+        for _ in range(n): subprocess.run([sys.executable, "-c", "import main"], cwd=repo_root, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return run, "interpreter"
+
+CASES = {
+    "startup.import_main": case_import_main,
+    "parse_message_content.plain": lambda: case_parse(False),
+    "parse_message_content.emote_heavy": lambda: case_parse(True),
+    "select_7tv_emote_file.large_lists": case_select_7tv_file,
+    "build_7tv_emote_map.1000_emotes": case_build_7tv_map,
+    "fetch_and_process_image.static": lambda: case_fetch_and_process(False),
+    "fetch_and_process_image.animated": lambda: case_fetch_and_process(True),
+    "display_chat_message.insert": case_display_chat_message,
+}
+
+# --- Runner ---
+def time_case(run) -> float:
+    """Best-of-REPEATS seconds per operation, with the op count calibrated so each repeat takes MIN_RUN_SECONDS."""
+    n = 1
+    while True:
+        started = time.perf_counter(); run(n); elapsed = time.perf_counter() - started
+        if elapsed >= MIN_RUN_SECONDS / 4 or n >= 1 << 20: break
+        n *= 4
+    n = max(1, int(n * MIN_RUN_SECONDS / max(elapsed, 1e-9)))
+    best = float("inf")
+    for _ in range(REPEATS):
+        started = time.perf_counter(); run(n)
+        best = min(best, (time.perf_counter() - started) / n)
+    return best
+
+def machine_info() -> dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count()}
+
+def format_time(seconds: float) -> str:
+    if seconds >= 1e-3: return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed slowdown vs. baseline (0.2 = 20%%)")
+    parser.add_argument("--only", help="run only cases whose name contains this text")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline.exists():
+        saved = json.loads(args.baseline.read_text(encoding="utf-8"))
+        baseline = saved.get("results", {})
+        if saved.get("machine", {}).get("platform") != machine_info()["platform"]:
+            print(f"Note: baseline was recorded on {saved.get('machine', {}).get('platform')}; comparisons are indicative only.")
+
+    results, regressions = {}, []
+    print(f"{'case':<38}{'time/op':>12}{'baseline':>12}{'change':>9}")
+    for name, factory in CASES.items():
+        if args.only and args.only not in name: continue
+        try:
+            run, unit = factory()
+        except Skip as e:
+            print(f"{name:<38}{'skipped':>12}  ({e})")
+            continue
+        try: seconds = time_case(run)
+        finally:
+            if hasattr(run, "cleanup"): run.cleanup()
+        results[name] = {"seconds_per_op": seconds, "unit": unit}
+        reference = baseline.get(name, {}).get("seconds_per_op")
+        change = f"{(seconds / reference - 1) * 100:+.1f}%" if reference else "new"
+        flag = ""
+        if reference and seconds > reference * (1 + args.threshold):
+            regressions.append(name); flag = "  REGRESSION"
+        print(f"{name:<38}{format_time(seconds):>12}{format_time(reference) if reference else '-':>12}{change:>9}{flag}")
+
+    if args.save_baseline:
+        merged = dict(baseline); merged.update(results) # Cases skipped here keep their previous baseline
+        args.baseline.write_text(json.dumps({"machine": machine_info(), "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                             "results": merged}, indent=2) + "\n", encoding="utf-8")
+        print(f"Baseline saved to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
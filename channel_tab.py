@@ -1,24 +1,22 @@
 # channel_tab.py
 import customtkinter as ctk
+import tkinter as tk
 import asyncio
-import re
+import time
+import webbrowser
+from collections import deque
+from chat_record import ChatRecord
+from message_tokenizer import EMOTE_TOKEN_TYPES, MessageTokenizer
+from image_cache import MISS
+from metrics import RENDER_LATENCY
 
 DEFAULT_USERNAME_COLOR = "#6495ED"
-
-class ChatLine(ctk.CTkFrame):
-    def __init__(self, master, app_instance):
-        super().__init__(master, fg_color="transparent")
-        self.app = app_instance
-        self.image_references = [] 
-    def add_text(self, text_content, text_color=None, font=None):
-        if not font: font = self.app.DEFAULT_FONT
-        label = ctk.CTkLabel(self, text=text_content, text_color=text_color, font=font, anchor="w")
-        label.pack(side="left", pady=0, padx=0)
-    def add_image(self, tk_image):
-        if tk_image:
-            self.image_references.append(tk_image) 
-            label = ctk.CTkLabel(self, image=tk_image, text="", anchor="w")
-            label.pack(side="left", pady=(0, 2), padx=1)
+SYSTEM_TEXT_COLOR = "gray"
+ERROR_TEXT_COLOR = "#ff6961"
+WRAP_INDENT_PX = 12 # Continuation lines of a wrapped message are indented under the first
+LINK_TEXT_COLOR = "#53a8ff"
+MESSAGE_TOKENIZER = MessageTokenizer() # Shared by every tab so identical messages across channels hit one LRU
+DEFAULT_SCROLLBACK_LIMIT = 500 # Lines kept per channel when the app doesn't configure SCROLLBACK_LIMIT
 
 class ChannelTab(ctk.CTkFrame):
     def __init__(self, master, channel_slug: str, app_instance):
@@ -48,120 +46,207 @@ class ChannelTab(ctk.CTkFrame):
             font=(self.app.APP_FONT_FAMILY, 16, "bold"),
             fg_color="#FF6347", hover_color="#E55337", command=self.request_close_channel)
         self.close_button.grid(row=0, column=1, padx=(5,0), pady=(0,0), sticky="ne")
-        self.chat_scroll_frame = ctk.CTkScrollableFrame(self, corner_radius=10, fg_color="transparent")
-        self.chat_scroll_frame.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
-        self.chat_lines_container = [] 
+        # --- Chat area: one tk.Text per tab, each message is a run of tagged text and embedded images ---
+        chat_bg_color = ctk.ThemeManager.theme["CTkFrame"]["top_fg_color"]
+        self.chat_frame = ctk.CTkFrame(self, corner_radius=10, fg_color=chat_bg_color)
+        self.chat_frame.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+        self.chat_frame.grid_columnconfigure(0, weight=1)
+        self.chat_frame.grid_rowconfigure(0, weight=1)
+        self.chat_text = tk.Text(
+            self.chat_frame, wrap="word", state="disabled", cursor="arrow",
+            bg=self._apply_appearance_mode(chat_bg_color),
+            fg=self._apply_appearance_mode(ctk.ThemeManager.theme["CTkLabel"]["text_color"]),
+            font=self.app.DEFAULT_FONT, borderwidth=0, highlightthickness=0, padx=8, pady=6,
+            spacing1=1, spacing3=2, lmargin2=WRAP_INDENT_PX, takefocus=0)
+        self.chat_text.grid(row=0, column=0, padx=(6,0), pady=6, sticky="nsew")
+        self.chat_scrollbar = ctk.CTkScrollbar(self.chat_frame, command=self.chat_text.yview)
+        self.chat_scrollbar.grid(row=0, column=1, padx=(0,4), pady=6, sticky="ns")
+        self.chat_text.configure(yscrollcommand=self.chat_scrollbar.set)
+        self.chat_text.tag_configure("username", font=(self.app.APP_FONT_FAMILY, self.app.DEFAULT_FONT_SIZE, "bold"))
+        self.chat_text.tag_configure("badge_text", font=self.app.INFO_FONT)
+        self.chat_text.tag_configure("mention", font=(self.app.APP_FONT_FAMILY, self.app.DEFAULT_FONT_SIZE, "bold"))
+        self.chat_text.tag_configure("link", foreground=LINK_TEXT_COLOR, underline=True)
+        self.chat_text.tag_bind("link", "<Enter>", lambda e: self.chat_text.configure(cursor="hand2"))
+        self.chat_text.tag_bind("link", "<Leave>", lambda e: self.chat_text.configure(cursor="arrow"))
+        self.chat_text.tag_bind("link", "<Button-1>", self._open_link_at_click)
+        self.color_tags = set() # Foreground tags already configured on chat_text, one per distinct user color
+        # Ring buffer of ChatRecords; record i is always line i+1 of chat_text, so evicting one drops its line too
+        self.history = deque(maxlen=getattr(self.app, "SCROLLBACK_LIMIT", DEFAULT_SCROLLBACK_LIMIT))
+        self.image_cache = self.app.image_cache # Images embedded in history are pinned there until their line is dropped
+        self._placeholder_tags = {} # (kind, url) -> text tag over the "[name]" placeholders waiting for that image
+        self._placeholder_serial = 0
+        self._follow_tail = True # Whether the view was at the bottom before the current batch of inserts
+        self._scroll_pending = False
 
     def request_close_channel(self): self.app.close_specific_channel(self.channel_slug)
+    def destroy(self):
+        for record in self.history: self.image_cache.unpin(record.image_keys)
+        self.history.clear()
+        super().destroy()
     def update_stream_info(self, info_data: dict):
-        self.stream_title_label.configure(text=f"{info_data['title']}")
-        self.viewers_label.configure(text=f"Viewers: {info_data['viewers']:,}")
-        self.category_label.configure(text=f"Category: {info_data['category']}")
-        self.live_status_label.configure(text="LIVE" if info_data.get('is_live') else "OFFLINE", 
-                                         text_color="#77dd77" if info_data.get('is_live') else "#ff6961")
+        # info_data may hold only the fields that changed since the last refresh
+        if "title" in info_data: self.stream_title_label.configure(text=f"{info_data['title']}")
+        if "viewers" in info_data: self.viewers_label.configure(text=f"Viewers: {info_data['viewers'] or 0:,}")
+        if "category" in info_data: self.category_label.configure(text=f"Category: {info_data['category']}")
+        if "is_live" in info_data:
+            self.live_status_label.configure(text="LIVE" if info_data.get('is_live') else "OFFLINE", 
+                                             text_color="#77dd77" if info_data.get('is_live') else "#ff6961")
     def update_stream_info_error(self, error_message: str):
         self.stream_title_label.configure(text="Title: Error"); self.viewers_label.configure(text="Viewers: N/A")
         self.category_label.configure(text="Category: N/A"); self.live_status_label.configure(text="ERROR", text_color="orange")
         self.add_message_to_gui(f"[ERROR] API: {error_message}\n", is_error=True)
     def add_message_to_gui(self, text_content, is_system=True, is_error=False):
-        line_frame = ChatLine(self.chat_scroll_frame, self.app)
-        line_frame.pack(side="top", fill="x", anchor="w", pady=(0,2))
-        color = "gray" if is_system else ("#ff6961" if is_error else None)
-        line_frame.add_text(text_content.strip(), text_color=color, font=self.app.DEFAULT_FONT)
-        self.chat_lines_container.append(line_frame); self._scroll_to_bottom()
-    
+        color = SYSTEM_TEXT_COLOR if is_system else (ERROR_TEXT_COLOR if is_error else None)
+        record = ChatRecord.system(text_content.strip(), color)
+        self._insert_line(record, [(text_content.strip(), self._color_tag(color))])
+
+    def set_scrollback_limit(self, limit: int):
+        limit = max(1, int(limit))
+        excess = len(self.history) - limit
+        if excess > 0:
+            for _ in range(excess): self.image_cache.unpin(self.history.popleft().image_keys)
+            self.chat_text.configure(state="normal")
+            self.chat_text.delete("1.0", f"{excess + 1}.0")
+            self.chat_text.configure(state="disabled")
+        self.history = deque(self.history, maxlen=limit)
+
+    def _color_tag(self, color: str | None) -> str | tuple:
+        if not color: return ()
+        tag = f"color_{color}"
+        if tag not in self.color_tags:
+            try: self.chat_text.tag_configure(tag, foreground=color)
+            except tk.TclError: return () # Malformed color from the API; fall back to the default text color
+            self.color_tags.add(tag)
+        return tag
+
+    def _insert_line(self, record: ChatRecord, runs: list):
+        """Appends one chat line. runs holds (text, tags) tuples and PhotoImage objects, in display order.
+
+        Adjacent text runs are written with a single multi-run insert; images are embedded in place.
+        Once the scrollback is full, the oldest record and its line are dropped together.
+        """
+        if not self._scroll_pending: self._follow_tail = self.chat_text.yview()[1] >= 0.999
+        self.chat_text.configure(state="normal")
+        if len(self.history) == self.history.maxlen:
+            self.chat_text.delete("1.0", "2.0")
+            self.image_cache.unpin(self.history[0].image_keys)
+        self.history.append(record)
+        self.image_cache.pin(record.image_keys)
+        pending_text_args = []
+        for run in runs:
+            if isinstance(run, tuple):
+                pending_text_args.extend((run[0].replace("\n", " "), run[1])) # One record per line, always
+                continue
+            if pending_text_args:
+                self.chat_text.insert("end", *pending_text_args); pending_text_args = []
+            self.chat_text.image_create("end", image=run, padx=1, align="center")
+        pending_text_args.extend(("\n", ()))
+        self.chat_text.insert("end", *pending_text_args)
+        self.chat_text.configure(state="disabled")
+        if self._follow_tail: self.request_scroll_to_bottom()
+
     def _parse_message_content(self, content_with_kick_placeholders: str, kick_emotes_meta: list, channel_slug_for_7tv: str):
-        final_parts = []
-        kick_pattern = re.compile(r"\[emote:(\d+):([^\]]+)\]")
-        kick_emote_data_map = {str(e.get("id", "")): e for e in kick_emotes_meta if e.get("id")}
-        last_idx_kick = 0
-        intermediate_segments = []
-        for kick_match in kick_pattern.finditer(content_with_kick_placeholders):
-            emote_id_in_placeholder = kick_match.group(1)
-            start, end = kick_match.span()
-            if start > last_idx_kick: intermediate_segments.append(("text", content_with_kick_placeholders[last_idx_kick:start]))
-            kick_emote_obj = kick_emote_data_map.get(emote_id_in_placeholder)
-            intermediate_segments.append(("kick_emote", kick_emote_obj) if kick_emote_obj else ("text", kick_match.group(0)))
-            last_idx_kick = end
-        if last_idx_kick < len(content_with_kick_placeholders): intermediate_segments.append(("text", content_with_kick_placeholders[last_idx_kick:]))
-
-        if not self.app.emote_manager: return intermediate_segments
-        for part_type, part_data in intermediate_segments:
-            if part_type == "text":
-                text_segment = part_data; current_pos_in_segment = 0
-                words = re.split(r'(\s+)', text_segment) # Split by spaces, keeping spaces
-                for word_or_space in words:
-                    if not word_or_space.strip(): # If it's only whitespace
-                        final_parts.append(("text", word_or_space))
-                        continue
-                    seventv_emote_data = self.app.emote_manager.get_7tv_emote_data(word_or_space, channel_slug_for_7tv)
-                    if seventv_emote_data: final_parts.append(("7tv_emote", seventv_emote_data))
-                    else: final_parts.append(("text", word_or_space))
-            else: final_parts.append((part_type, part_data))
-        
-        consolidated_parts = []; current_text = ""
-        for p_type, p_data in final_parts:
-            if p_type == "text": current_text += p_data
-            else:
-                if current_text: consolidated_parts.append(("text", current_text)); current_text = ""
-                consolidated_parts.append((p_type, p_data))
-        if current_text: consolidated_parts.append(("text", current_text))
-        return consolidated_parts
+        emote_index = self.app.emote_manager.get_emote_index(channel_slug_for_7tv) if self.app.emote_manager else None
+        return MESSAGE_TOKENIZER.tokenize(content_with_kick_placeholders, emote_index, kick_emotes_meta)
+
+    def _open_link_at_click(self, event):
+        link_range = self.chat_text.tag_prevrange("link", f"@{event.x},{event.y} +1c")
+        if link_range:
+            url = self.chat_text.get(*link_range)
+            webbrowser.open(url if "://" in url else f"https://{url}")
+
+    def visible_image_names(self) -> list:
+        """Embedded image names in the visible part of the chat, for the animation clock."""
+        if not self.chat_text.winfo_ismapped(): return []
+        bottom = self.chat_text.winfo_height()
+        return [name for _kind, name, _index in self.chat_text.dump("@0,0", f"@0,{bottom} lineend", image=True)]
+
+    def request_scroll_to_bottom(self):
+        """Scrolls once the current batch of GUI updates is done, however many lines it added."""
+        if self._scroll_pending: return
+        self._scroll_pending = True
+        self.after_idle(self._scroll_to_bottom)
 
     def _scroll_to_bottom(self):
-        self.chat_scroll_frame._parent_canvas.after(30, lambda: self.chat_scroll_frame._parent_canvas.yview_moveto(1.0))
-
-    def display_chat_message(self, message_data: dict):
-        line_frame = ChatLine(self.chat_scroll_frame, self.app)
-        line_frame.pack(side="top", fill="x", anchor="w", pady=(0,2)) 
-        self.chat_lines_container.append(line_frame)
-        sender_info = message_data.get("sender", {}); sender_name = sender_info.get("username", "Anon")
-        identity = sender_info.get("identity", {}); user_color = identity.get("color", DEFAULT_USERNAME_COLOR) 
-        user_badges = identity.get("badges", [])
-
-        if self.app.badge_manager: 
-            for badge_data in user_badges:
-                if badge_data.get("active") is False: continue
-                badge_type = badge_data.get("type"); badge_text_fallback = f"[{badge_data.get('text', badge_type or 'badge')}]"
-                badge_svg_url = self.app.badge_manager.get_badge_svg_url(badge_type)
-                if badge_svg_url:
-                    tk_badge_image = self.app.badge_manager.get_cached_badge_image(badge_svg_url)
-                    if tk_badge_image: line_frame.add_image(tk_badge_image)
-                    elif tk_badge_image is None and badge_svg_url in self.app.badge_manager.badge_image_cache: 
-                        line_frame.add_text(badge_text_fallback + " ", font=self.app.INFO_FONT)
-                    else: 
-                        line_frame.add_text(badge_text_fallback + " ", font=self.app.INFO_FONT)
-                        asyncio.run_coroutine_threadsafe(
-                            self.app.badge_manager.load_and_cache_badge_svg(badge_svg_url, badge_type or "unknown"), self.app.loop)
-                else: line_frame.add_text(badge_text_fallback + " ", font=self.app.INFO_FONT)
-        
-        line_frame.add_text(f"{sender_name}", text_color=user_color, font=(self.app.APP_FONT_FAMILY, self.app.DEFAULT_FONT_SIZE, "bold"))
-        line_frame.add_text(": ", text_color=user_color if user_color != DEFAULT_USERNAME_COLOR else None)
+        self._scroll_pending = False
+        self.chat_text.yview_moveto(1.0)
+
+    def display_chat_message(self, message_data: dict, message_parts: tuple | None = None):
+        """message_parts are the tokens if the asset prefetcher already parsed the message."""
+        if message_parts is None:
+            message_parts = self._parse_message_content(message_data.get("content", ""), message_data.get("emotes", []), self.channel_slug)
+        record = ChatRecord.from_chat_message(message_data, message_parts, DEFAULT_USERNAME_COLOR)
+        runs, record.image_keys = self._render_record(record)
+        self._insert_line(record, runs)
+        RENDER_LATENCY.observe(max(0.0, time.time() - record.timestamp), self.channel_slug) # Includes any clock skew against Kick's servers
+
+    def _cached_image_run(self, kind: str, url: str, fallback_run: tuple, load, image_keys: list):
+        """The cached image for url, else fallback_run. On a miss the fallback is tagged and swapped for the image when it loads."""
+        state, image = self.image_cache.lookup(kind, url)
+        if image is not None:
+            image_keys.append((kind, url)); return image
+        if state != MISS: return fallback_run
+        prefetcher = getattr(self.app, "asset_prefetcher", None)
+        if prefetcher is None:
+            asyncio.run_coroutine_threadsafe(load(), self.app.loop); return fallback_run
+        tag = self._placeholder_tags.get((kind, url))
+        if tag is None:
+            self._placeholder_serial += 1
+            tag = self._placeholder_tags[(kind, url)] = f"pending_image_{self._placeholder_serial}"
+            self.app.loop.call_soon_threadsafe(prefetcher.request, kind, url, load) # Usually already loading; announces it either way
+        text, tags = fallback_run
+        return (text, (tags if isinstance(tags, tuple) else (tags,)) + (tag,))
+
+    def replace_placeholders(self, kind: str, url: str):
+        """Swaps every placeholder for a newly loaded image in place, pinning it for the lines that now embed it."""
+        key = (kind, url)
+        tag = self._placeholder_tags.pop(key, None)
+        if tag is None: return
+        ranges = self.chat_text.tag_ranges(tag)
+        if ranges:
+            self.image_cache.pin((key,)) # Before the lookup, so the image can't be evicted in between
+            _state, image = self.image_cache.lookup(kind, url)
+            self.image_cache.unpin((key,))
+            if image is not None: # A failed load keeps its text placeholder
+                if not self._scroll_pending: self._follow_tail = self.chat_text.yview()[1] >= 0.999
+                self.chat_text.configure(state="normal")
+                for start, end in reversed(list(zip(ranges[0::2], ranges[1::2]))): # Back to front, so earlier indices stay valid
+                    self.chat_text.delete(start, end)
+                    self.chat_text.image_create(start, image=image, padx=1, align="center")
+                    record = self.history[int(str(start).split(".")[0]) - 1] # Record i is line i+1
+                    record.image_keys += (key,)
+                    self.image_cache.pin((key,))
+                self.chat_text.configure(state="disabled")
+                if self._follow_tail: self.request_scroll_to_bottom()
+        self.chat_text.tag_delete(tag)
+
+    def _render_record(self, record: ChatRecord) -> tuple:
+        """(runs for _insert_line, (kind, url) keys of the cached images among them)."""
+        runs, image_keys = [], []
+        badge_manager = self.app.badge_manager
+        if badge_manager: 
+            for badge_type, badge_text, badge_count in record.badges:
+                badge_text_run = (f"[{badge_text or badge_type or 'badge'}] ", "badge_text")
+                badge_url = badge_manager.get_badge_url(badge_type, badge_count, self.channel_slug)
+                if badge_url:
+                    runs.append(self._cached_image_run("badge", badge_url, badge_text_run, 
+                                                       lambda url=badge_url, kind=badge_type or "unknown": badge_manager.load_and_cache_badge(url, kind), image_keys))
+                else: runs.append(badge_text_run)
         
-        content_with_kick_placeholders = message_data.get("content", "")
-        kick_emotes_meta_array = message_data.get("emotes", [])
-        message_parts = self._parse_message_content(content_with_kick_placeholders, kick_emotes_meta_array, self.channel_slug)
-
-        if self.app.emote_manager:
-            for part_type, part_data in message_parts:
-                if part_type == "text": line_frame.add_text(part_data)
-                elif part_type == "kick_emote": 
-                    name, url = part_data.get('name', 'emote'), part_data.get('url')
-                    if not url: line_frame.add_text(f"[{name}]"); continue
-                    img = self.app.emote_manager.get_cached_kick_emote_image(url)
-                    if img: line_frame.add_image(img)
-                    elif img is None and url in self.app.emote_manager.kick_emote_cache: line_frame.add_text(f"[{name}]")
-                    else: 
-                        line_frame.add_text(f"[{name}]") 
-                        asyncio.run_coroutine_threadsafe(self.app.emote_manager.load_and_cache_kick_emote(url, name), self.app.loop)
-                elif part_type == "7tv_emote":
-                    name, url = part_data.get('name', '7tv_emote'), part_data.get('url')
-                    if not url: line_frame.add_text(f"[{name}]"); continue
-                    img = self.app.emote_manager.get_cached_7tv_emote_image(url)
-                    if img: line_frame.add_image(img)
-                    elif img is None and url in self.app.emote_manager.seventv_emote_cache: line_frame.add_text(f"[{name}]")
-                    else:
-                        line_frame.add_text(f"[{name}]")
-                        asyncio.run_coroutine_threadsafe(self.app.emote_manager.load_and_cache_7tv_emote(part_data), self.app.loop)
-        else: line_frame.add_text(content_with_kick_placeholders)
-        self._scroll_to_bottom()
\ No newline at end of file
+        user_color = record.color
+        user_color_tag = self._color_tag(user_color)
+        runs.append((f" {record.sender}" if runs else f"{record.sender}", ("username", user_color_tag) if user_color_tag else "username"))
+        runs.append((": ", user_color_tag if user_color != DEFAULT_USERNAME_COLOR else ()))
+
+        emote_manager = self.app.emote_manager
+        for part_type, part_data in record.tokens:
+            if part_type == "text": runs.append((part_data, ()))
+            elif part_type == "url": runs.append((part_data, "link"))
+            elif part_type == "mention": runs.append((part_data, "mention"))
+            elif not emote_manager: runs.append((f"[{part_data.get('name', 'emote')}]", ()))
+            elif part_type in EMOTE_TOKEN_TYPES:
+                name, url = part_data.get('name', 'emote'), part_data.get('url')
+                if not url: runs.append((f"[{name}]", ())); continue
+                runs.append(self._cached_image_run(part_type, url, (f"[{name}]", ()),
+                                                   lambda kind=part_type, emote_data=part_data: emote_manager.load_and_cache_emote(kind, emote_data), image_keys))
+        return runs, image_keys
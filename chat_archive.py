@@ -0,0 +1,242 @@
+# chat_archive.py
+import asyncio
+import bisect
+import gzip
+import io
+import json
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app_paths import user_data_dir
+from pusher_codec import dumps
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_MAX_SEGMENT_BYTES = 64 * 1024 * 1024 # Compressed size at which a channel's segment is rotated
+DEFAULT_MAX_SEGMENT_SECONDS = 3600 # ...or its age; whichever comes first
+DEFAULT_FLUSH_INTERVAL = 1.0 # Seconds events wait in memory before being compressed and written as one batch
+DEFAULT_MAX_PENDING = 50000 # Events held in memory across channels; past this new ones are dropped (and counted)
+INDEX_INTERVAL = 60 # One index entry per minute of chat: a 10-hour segment has ~600 entries
+SEGMENT_SUFFIXES = {"zstd": ".ndjson.zst", "gzip": ".ndjson.gz"}
+INDEX_SUFFIX = ".idx"
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9_.-]")
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "gzip"
+
+class _Segment:
+    """An open segment file; only touched from the archive's writer thread."""
+    __slots__ = ("path", "file", "index_file", "started_at", "size", "last_indexed_at")
+
+    def __init__(self, path: Path, started_at: float):
+        self.path = path
+        self.file = open(path, "ab")
+        self.index_file = open(path.with_name(path.name + INDEX_SUFFIX), "a", encoding="utf-8")
+        self.started_at = started_at
+        self.size = self.file.tell()
+        self.last_indexed_at = None
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+class ChatArchive:
+    """Append-only, compressed per-channel chat log with a time index.
+
+    append() only buffers the record in memory, so it is safe to call from the recv path. Every
+    flush_interval the buffered events are handed to the archive's single writer thread, which compresses each
+    channel's batch as one independent gzip member / zstd frame and appends it to the channel's
+    current segment (<root>/<channel>/<UTC start>.ndjson.gz|.zst), rotating by size and age.
+    Because every batch is a self-contained compressed block, a reader can seek to any batch
+    boundary; the sidecar <segment>.idx lists {"ts", "offset"} for the first batch of each minute.
+    Must be used from the asyncio loop thread.
+    """
+    def __init__(self, root: Path | None = None, codec: str | None = None,
+                 max_segment_bytes: int = DEFAULT_MAX_SEGMENT_BYTES, max_segment_seconds: float = DEFAULT_MAX_SEGMENT_SECONDS,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, max_pending: int = DEFAULT_MAX_PENDING):
+        self.root = Path(root) if root else user_data_dir() / "archive"
+        self.codec = codec or default_codec()
+        if self.codec == "zstd" and zstandard is None: raise RuntimeError("zstd archive requested but the zstandard package is not installed")
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_seconds = max_segment_seconds
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {} # channel -> list of records
+        self._pending_count = 0
+        self._segments = {} # channel -> _Segment (writer thread)
+        self._writer = None # One-thread executor: every write and close runs there, in submission order
+        self._task = None
+        self._flush_requested = None
+        self.dropped_count = 0
+        self.records_written = 0
+        self.bytes_written = 0
+
+    def start(self):
+        if self._task and not self._task.done(): return
+        self._flush_requested = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def append(self, channel_slug: str, record: dict):
+        """Buffers one normalized event (see kick_chat.normalize_chat_event). Never blocks."""
+        if self._pending_count >= self.max_pending:
+            self.dropped_count += 1
+            if self.dropped_count in (1, 1000) or self.dropped_count % 100000 == 0:
+                print(f"ChatArchive: writer falling behind, {self.dropped_count} events dropped so far.")
+            return
+        self._pending.setdefault(channel_slug, []).append(record)
+        self._pending_count += 1
+
+    async def close(self):
+        """Writes everything still buffered and closes the segment files."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._flush() # Queued behind a write the cancelled task had in flight
+        await self._in_writer(self._close_segments)
+        self._writer.shutdown(wait=False)
+        self._writer = None
+
+    async def close_channel(self, channel_slug: str):
+        """Writes the channel's buffered events and closes its segment, e.g. when its tab closes. A later append opens a new segment."""
+        records = self._pending.pop(channel_slug, None)
+        if records: self._pending_count -= len(records)
+        try: await asyncio.shield(self._in_writer(self._write_and_close_channel, channel_slug, records or []))
+        except Exception as e:
+            print(f"ChatArchive: failed to close {channel_slug}: {e}")
+            traceback.print_exc()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush()
+
+    async def _flush(self):
+        if not self._pending: return
+        batches, self._pending, self._pending_count = self._pending, {}, 0
+        try: await asyncio.shield(self._in_writer(self._write_batches, batches)) # A cancelled flush still finishes writing
+        except Exception as e:
+            print(f"ChatArchive: failed to write batch: {e}")
+            traceback.print_exc()
+
+    async def _in_writer(self, func, *args):
+        if self._writer is None: self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-archive")
+        return await asyncio.get_running_loop().run_in_executor(self._writer, func, *args)
+
+    # --- Writer thread ---
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd": return zstandard.ZstdCompressor(level=3).compress(data)
+        return gzip.compress(data, compresslevel=6, mtime=0)
+
+    def _segment_for(self, channel_slug: str, first_ts: float) -> _Segment:
+        segment = self._segments.get(channel_slug)
+        if segment and (segment.size >= self.max_segment_bytes or first_ts - segment.started_at >= self.max_segment_seconds):
+            segment.close(); segment = None
+        if segment is None:
+            channel_dir = self.root / _UNSAFE_NAME_CHARS.sub("_", channel_slug)
+            channel_dir.mkdir(parents=True, exist_ok=True)
+            stamp = datetime.fromtimestamp(first_ts, timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            path = channel_dir / f"{stamp}{SEGMENT_SUFFIXES[self.codec]}"
+            suffix = 1
+            while path.exists(): # Restart within the same second; never append to a segment we didn't open
+                path = channel_dir / f"{stamp}-{suffix}{SEGMENT_SUFFIXES[self.codec]}"; suffix += 1
+            segment = _Segment(path, first_ts)
+            self._segments[channel_slug] = segment
+        return segment
+
+    def _write_batches(self, batches: dict):
+        for channel_slug, records in batches.items():
+            first_ts = records[0].get("received_at") or time.time()
+            segment = self._segment_for(channel_slug, first_ts)
+            block = self._compress(("\n".join(dumps(record) for record in records) + "\n").encode("utf-8"))
+            offset = segment.size
+            segment.file.write(block)
+            segment.file.flush()
+            segment.size += len(block)
+            if segment.last_indexed_at is None or first_ts - segment.last_indexed_at >= INDEX_INTERVAL:
+                # Written after the data, so an entry never points past the end of the segment
+                segment.index_file.write(json.dumps({"ts": first_ts, "offset": offset}) + "\n")
+                segment.index_file.flush()
+                segment.last_indexed_at = first_ts
+            self.records_written += len(records)
+            self.bytes_written += len(block)
+
+    def _write_and_close_channel(self, channel_slug: str, records: list):
+        if records: self._write_batches({channel_slug: records})
+        segment = self._segments.pop(channel_slug, None)
+        if segment: segment.close()
+
+    def _close_segments(self):
+        for segment in self._segments.values(): segment.close()
+        self._segments.clear()
+
+# --- Reading ---
+def _codec_for(path: Path) -> str:
+    return "zstd" if path.name.endswith(SEGMENT_SUFFIXES["zstd"]) else "gzip"
+
+def read_segment_index(segment_path: Path) -> list:
+    """[(ts, offset), ...] from a segment's sidecar index, oldest first. [] if missing."""
+    entries = []
+    try:
+        with open(segment_path.with_name(segment_path.name + INDEX_SUFFIX), "r", encoding="utf-8") as f:
+            for line in f:
+                try: entry = json.loads(line); entries.append((entry["ts"], entry["offset"]))
+                except (ValueError, KeyError): break # Torn last line after a crash
+    except FileNotFoundError: pass
+    return entries
+
+def iter_segment(segment_path: Path, since: float | None = None):
+    """Yields the records of one segment, starting near since via the index rather than from the top."""
+    offset = 0
+    if since is not None:
+        index = read_segment_index(segment_path)
+        position = bisect.bisect_right([ts for ts, _ in index], since) - 1
+        if position >= 0: offset = index[position][1]
+    with open(segment_path, "rb") as f:
+        f.seek(offset)
+        if _codec_for(segment_path) == "zstd":
+            if zstandard is None: raise RuntimeError(f"{segment_path} is zstd-compressed; install zstandard to read it")
+            reader = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+        else:
+            reader = gzip.GzipFile(fileobj=f, mode="rb") # Reads consecutive members from the current position
+        try:
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                record = json.loads(line)
+                if since is not None and (record.get("received_at") or 0) < since: continue
+                yield record
+        except (EOFError, gzip.BadGzipFile, ValueError) as e: # Torn final batch after a crash
+            print(f"ChatArchive: stopped reading {segment_path.name} at a damaged block: {e}", file=sys.stderr)
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                print(f"ChatArchive: stopped reading {segment_path.name} at a damaged block: {e}", file=sys.stderr)
+            else: raise
+
+def iter_channel(channel_slug: str, since: float | None = None, until: float | None = None, root: Path | None = None):
+    """Yields a channel's archived records from since to until across segments, in time order."""
+    channel_dir = (Path(root) if root else user_data_dir() / "archive") / _UNSAFE_NAME_CHARS.sub("_", channel_slug)
+    segments = sorted(p for p in channel_dir.glob("*.ndjson.*") if not p.name.endswith(INDEX_SUFFIX))
+    starts = [datetime.strptime(p.name[:16], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc).timestamp() for p in segments]
+    first = max(0, bisect.bisect_right(starts, since) - 1) if since is not None else 0
+    for segment_path in segments[first:]:
+        for record in iter_segment(segment_path, since):
+            if until is not None and (record.get("received_at") or 0) > until: return
+            yield record
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Print a channel's archived chat as NDJSON.")
+    parser.add_argument("channel")
+    parser.add_argument("--since", help="UTC time to start from, e.g. 2025-01-31T20:15")
+    parser.add_argument("--until", help="UTC time to stop at")
+    parser.add_argument("--root", help="archive directory (default: the app's data directory)")
+    args = parser.parse_args()
+    def parse_time(value): return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp() if value else None
+    for archived_record in iter_channel(args.channel, parse_time(args.since), parse_time(args.until), args.root):
+        print(json.dumps(archived_record, ensure_ascii=False))
@@ -0,0 +1,45 @@
+# chat_record.py
+import time
+from datetime import datetime
+
+class ChatRecord:
+    """One line of a channel's scrollback, parsed once from the Pusher payload.
+
+    The raw message dict is not kept; badges are (type, text, count) tuples and tokens are the
+    (part_type, part_data) pairs produced by the message parser. image_keys lists the image cache
+    entries its line embeds, which stay pinned while the record is in the scrollback.
+    """
+    __slots__ = ("id", "timestamp", "sender", "color", "badges", "tokens", "image_keys")
+
+    def __init__(self, id, timestamp: float, sender: str | None, color: str | None, badges: tuple, tokens: tuple):
+        self.id = id
+        self.timestamp = timestamp
+        self.sender = sender
+        self.color = color
+        self.badges = badges
+        self.tokens = tokens
+        self.image_keys = ()
+
+    @classmethod
+    def from_chat_message(cls, message_data: dict, tokens, default_color: str | None = None) -> "ChatRecord":
+        sender_info = message_data.get("sender", {})
+        identity = sender_info.get("identity", {})
+        return cls(message_data.get("id"), parse_timestamp(message_data.get("created_at")),
+                   sender_info.get("username", "Anon"), identity.get("color", default_color),
+                   parse_badges(message_data), tuple(tokens))
+
+    @classmethod
+    def system(cls, text: str, color: str | None = None) -> "ChatRecord":
+        return cls(None, time.time(), None, color, (), (("text", text),))
+
+def parse_badges(message_data: dict) -> tuple:
+    """The sender's active badges as (type, text, count) tuples."""
+    identity = message_data.get("sender", {}).get("identity", {})
+    return tuple((badge.get("type"), badge.get("text"), badge.get("count"))
+                 for badge in identity.get("badges", []) if badge.get("active") is not False)
+
+def parse_timestamp(created_at: str | None) -> float:
+    if created_at:
+        try: return datetime.fromisoformat(created_at.replace("Z", "+00:00")).timestamp()
+        except ValueError: pass
+    return time.time()
@@ -0,0 +1,87 @@
+# emote_usage.py
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from app_paths import user_data_dir
+from message_tokenizer import EMOTE_TOKEN_TYPES
+
+SAVE_DELAY_SECONDS = 30.0 # Counts change with every message; writes are debounced to one per this interval
+MAX_NAMES_PER_CHANNEL = 1000 # Least used names beyond this are dropped when saving
+
+class EmoteUsageStats:
+    """Per-channel histogram of emote names seen in chat, kept across launches.
+
+    Used to decide which of a channel's emotes to load first when its tab opens. Stored as JSON at
+    <data dir>/emote_usage.json. Loop thread only; file I/O runs in the default executor.
+    """
+    def __init__(self, path: Path | None = None):
+        self.path = Path(path) if path else user_data_dir() / "emote_usage.json"
+        self.channels = {} # channel slug -> {emote name: count}
+        self._loaded = False
+        self._load_task = None # The file read, shared by every caller waiting for it
+        self._save_handle = None
+        self._save_task = None # The debounced write, kept referenced until it finishes
+        self._write_lock = asyncio.Lock() # One write at a time, so the last snapshot taken is the one left on disk
+
+    async def _load(self):
+        if self._loaded: return
+        if self._load_task is None: self._load_task = asyncio.ensure_future(asyncio.to_thread(self._read_file))
+        saved = await asyncio.shield(self._load_task)
+        if self._loaded: return
+        self._loaded = True
+        for slug, counts in self.channels.items(): # Recorded while the file was being read
+            saved_counts = saved.setdefault(slug, {})
+            for name, count in counts.items(): saved_counts[name] = saved_counts.get(name, 0) + count
+        self.channels = saved
+
+    def _read_file(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return {slug: dict(counts) for slug, counts in json.load(f).get("channels", {}).items()}
+        except FileNotFoundError: return {}
+        except Exception as e:
+            print(f"EmoteUsageStats: {self.path} unreadable, starting empty: {e}")
+            return {}
+
+    async def counts(self, channel_slug: str) -> dict:
+        """{emote name: times seen} for the channel (empty for a new channel). Do not modify."""
+        await self._load()
+        return self.channels.get(channel_slug, {})
+
+    def record(self, channel_slug: str, tokens: tuple):
+        """Counts the emotes in one tokenized message. Before the saved counts are read, they are merged in on load."""
+        counts = None
+        for part_type, part_data in tokens:
+            if part_type not in EMOTE_TOKEN_TYPES: continue
+            name = part_data.get("name")
+            if not name: continue
+            if counts is None:
+                counts = self.channels.setdefault(channel_slug, {})
+            counts[name] = counts.get(name, 0) + 1
+        if counts is not None and self._save_handle is None:
+            self._save_handle = asyncio.get_running_loop().call_later(SAVE_DELAY_SECONDS, self._start_save)
+
+    def _start_save(self):
+        self._save_handle = None
+        self._save_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Writes the histogram to disk now. Call on shutdown; a debounced write still running is waited for, then superseded."""
+        if self._save_handle: self._save_handle.cancel(); self._save_handle = None
+        if not self._loaded:
+            if not self.channels: return
+            await self._load() # Never replace the saved counts with only this session's
+        async with self._write_lock:
+            for slug, counts in self.channels.items():
+                if len(counts) > MAX_NAMES_PER_CHANNEL:
+                    self.channels[slug] = dict(sorted(counts.items(), key=lambda item: -item[1])[:MAX_NAMES_PER_CHANNEL])
+            snapshot = json.dumps({"channels": self.channels}) # Taken under the lock: never older than what's on disk
+            def write():
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self.path.with_suffix(".tmp")
+                tmp_path.write_text(snapshot, encoding="utf-8")
+                os.replace(tmp_path, self.path)
+            try: await asyncio.shield(asyncio.to_thread(write)) # A cancelled flush still leaves a whole file behind
+            except Exception as e: print(f"EmoteUsageStats: failed to write {self.path}: {e}")
@@ -0,0 +1,96 @@
+# gui_dispatcher.py
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable
+
+from metrics import GUI_QUEUE_WAIT
+
+WAKE_POLL_MS = 8 # How often the idle Tk thread checks for posted updates
+DEFAULT_FRAME_BUDGET_MS = 12 # Tk work per tick before yielding back so the window can repaint and take input
+# Update types where only the newest payload per channel matters; older pending ones are overwritten in place
+COALESCED_TASK_TYPES = frozenset({"stream_info_update", "stream_info_error"})
+
+class GuiDispatcher:
+    """Hands GUI updates from any thread to the Tk thread.
+
+    post() is thread-safe and never touches Tk, so it cannot block on the Tk thread. Waking Tk from
+    another thread (event_generate, after) is marshalled by tkinter and waits until the Tk thread
+    serves it, so instead the Tk thread checks the queue every WAKE_POLL_MS with after(). When it
+    finds updates it drains them in batches limited to frame_budget_ms, rescheduling itself until
+    the queue is empty. Must be created on the Tk thread.
+    """
+    def __init__(self, tk_root, handler: Callable, frame_budget_ms: float = DEFAULT_FRAME_BUDGET_MS):
+        self.tk_root = tk_root
+        self.handler = handler # handler(task_type, payload), always called on the Tk thread
+        self.frame_budget = frame_budget_ms / 1000.0
+        self._lock = threading.Lock()
+        self._pending = deque() # (task_type, payload, posted_at), with coalesce_key in place of payload for coalesced types
+        self._coalesced = {} # (task_type, slug) -> newest payload
+        self._draining = False # Tk thread only
+        self._closed = False
+        self.processed_count = 0
+        self.coalesced_count = 0
+        self.max_depth = 0
+        self._poll_id = tk_root.after(WAKE_POLL_MS, self._poll)
+
+    def depth(self) -> int:
+        """Number of updates waiting for the Tk thread."""
+        with self._lock:
+            return len(self._pending)
+
+    def post(self, task_type: str, payload: dict):
+        with self._lock:
+            if self._closed: return
+            if task_type in COALESCED_TASK_TYPES:
+                key = (task_type, payload.get("slug"))
+                if key in self._coalesced:
+                    self._coalesced[key] = payload
+                    self.coalesced_count += 1
+                    return
+                self._coalesced[key] = payload
+                self._pending.append((task_type, key, time.perf_counter()))
+            else:
+                self._pending.append((task_type, payload, time.perf_counter()))
+            if len(self._pending) > self.max_depth: self.max_depth = len(self._pending)
+
+    def close(self):
+        """Drops pending updates and ignores later posts. Call on the Tk thread."""
+        with self._lock:
+            self._closed = True
+            self._pending.clear(); self._coalesced.clear()
+        if self._poll_id is not None:
+            self.tk_root.after_cancel(self._poll_id); self._poll_id = None
+
+    def _poll(self):
+        self._poll_id = None
+        with self._lock:
+            if self._closed: return
+            ready = bool(self._pending) and not self._draining
+        if ready:
+            self._draining = True
+            self._drain()
+        self._poll_id = self.tk_root.after(WAKE_POLL_MS, self._poll)
+
+    def _drain(self):
+        deadline = time.perf_counter() + self.frame_budget
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._draining = False
+                    return
+                task_type, payload, posted_at = self._pending.popleft()
+                if task_type in COALESCED_TASK_TYPES:
+                    payload = self._coalesced.pop(payload)
+            GUI_QUEUE_WAIT.observe(time.perf_counter() - posted_at)
+            try:
+                self.handler(task_type, payload)
+            except Exception as e:
+                print(f"GuiDispatcher: error handling {task_type}: {e}")
+                traceback.print_exc()
+            self.processed_count += 1
+            if time.perf_counter() >= deadline:
+                # Out of budget for this frame: let Tk paint and handle input, then carry on
+                self.tk_root.after(1, self._drain)
+                return
@@ -0,0 +1,176 @@
+# headless.py
+"""Headless chat ingestion: joins Kick channels without Tk and streams their events as NDJSON.
+
+Run from the repository root:
+    python -m headless --channels xqc,adinross [--output chat.ndjson] [--duration 3600]
+
+Each line is one chat, system or error event (see kick_chat.normalize_chat_event). Library
+logging goes to stderr so stdout stays pure NDJSON; a per-channel throughput summary is printed
+to stderr every --stats-interval seconds and on exit.
+"""
+import argparse
+import asyncio
+import contextlib
+import sys
+import time
+
+from kick_api import get_channel_info, get_chat_history
+from kick_chat import PusherConnectionManager, listen_to_kick_chat, normalize_chat_event, PUSHER_MAX_CHANNELS_PER_SOCKET
+from kick_http import KickHttpClient
+from pusher_codec import dumps
+
+DEFAULT_BATCH_SIZE = 500 # Lines per write
+DEFAULT_FLUSH_INTERVAL = 0.5 # Seconds a partial batch waits before it is written anyway
+DEFAULT_MAX_PENDING = 20000 # Events buffered for the writer; past this new events are dropped (and counted), never the recv loop blocked
+MAX_CONCURRENT_LOOKUPS = 8 # Channel info requests in flight while joining
+
+class ChannelStats:
+    __slots__ = ("slug", "chat", "system", "errors", "dropped", "joined_at")
+
+    def __init__(self, slug: str):
+        self.slug = slug
+        self.chat = 0
+        self.system = 0
+        self.errors = 0
+        self.dropped = 0
+        self.joined_at = None
+
+class NdjsonWriter:
+    """Batches records from the loop and writes them in a worker thread, so a slow sink never stalls chat."""
+    def __init__(self, stream, batch_size: int = DEFAULT_BATCH_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL, max_pending: int = DEFAULT_MAX_PENDING):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = asyncio.Queue(max_pending)
+        self.lines_written = 0
+        self.batches_written = 0
+
+    def submit(self, record: dict) -> bool:
+        """Queues a record; False if the buffer is full and the record was dropped."""
+        try: self.queue.put_nowait(dumps(record))
+        except asyncio.QueueFull: return False
+        return True
+
+    def _write(self, lines: list):
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+        self.lines_written += len(lines); self.batches_written += 1
+
+    async def run(self):
+        """Writes until cancelled, then drains whatever is still queued."""
+        batch = []
+        write = None
+        try:
+            while True:
+                batch.append(await self.queue.get())
+                deadline = asyncio.get_running_loop().time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    while len(batch) < self.batch_size and not self.queue.empty(): batch.append(self.queue.get_nowait())
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    if len(batch) >= self.batch_size or remaining <= 0: break
+                    try: batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                    except asyncio.TimeoutError: break
+                write = asyncio.ensure_future(asyncio.to_thread(self._write, batch))
+                batch = []
+                await asyncio.shield(write) # Cancelling us must not abandon a half-done write
+        finally:
+            if write is not None and not write.done(): await asyncio.gather(write, return_exceptions=True)
+            while not self.queue.empty(): batch.append(self.queue.get_nowait())
+            if batch: self._write(batch) # Shutdown path: the loop has nothing else to do
+
+def format_summary(stats: dict, started_at: float, writer: NdjsonWriter, manager: PusherConnectionManager) -> str:
+    elapsed = max(time.monotonic() - started_at, 1e-9)
+    rows = [f"{'channel':<24}{'chat':>10}{'msgs/s':>9}{'system':>8}{'errors':>8}{'dropped':>9}"]
+    for channel_stats in sorted(stats.values(), key=lambda s: s.chat, reverse=True):
+        active_for = max(time.monotonic() - (channel_stats.joined_at or started_at), 1e-9)
+        rows.append(f"{channel_stats.slug:<24}{channel_stats.chat:>10}{channel_stats.chat / active_for:>9.2f}"
+                    f"{channel_stats.system:>8}{channel_stats.errors:>8}{channel_stats.dropped:>9}")
+    total_chat = sum(s.chat for s in stats.values())
+    rows.append(f"{'total':<24}{total_chat:>10}{total_chat / elapsed:>9.2f}  over {elapsed:.0f}s; "
+                f"{writer.lines_written} lines in {writer.batches_written} writes, {manager.reconnect_count} reconnects")
+    return "\n".join(rows)
+
+async def ingest_channel(slug: str, client: KickHttpClient, manager: PusherConnectionManager, writer: NdjsonWriter,
+                         channel_stats: ChannelStats, lookup_semaphore: asyncio.Semaphore):
+    def emit(record: dict):
+        if not writer.submit(record): channel_stats.dropped += 1
+
+    async with lookup_semaphore:
+        info = await get_channel_info(client, slug)
+    if info.get("error") or not info.get("chatroom_id"):
+        channel_stats.errors += 1
+        emit({"type": "error", "channel": slug, "received_at": time.time(), "message": info.get("error") or "No chatroom for channel."})
+        return
+
+    async def on_chat_event(event_obj: dict):
+        record = normalize_chat_event(slug, event_obj, time.time())
+        if record["type"] == "chat": channel_stats.chat += 1
+        elif record["type"] == "error": channel_stats.errors += 1
+        else: channel_stats.system += 1
+        emit(record)
+
+    channel_id = info.get("channel_id")
+    backfill = (lambda: get_chat_history(client, channel_id)) if channel_id else None
+    channel_stats.joined_at = time.monotonic()
+    emit({"type": "system", "channel": slug, "received_at": time.time(), "message": f"Joining chat for {info.get('username', slug)}.", "info": info})
+    await listen_to_kick_chat(int(info["chatroom_id"]), on_chat_event, manager=manager, backfill=backfill)
+
+async def run_headless(channel_slugs: list, stream, duration: float | None, stats_interval: float,
+                       batch_size: int, flush_interval: float, max_pending: int, max_sockets: int):
+    client = KickHttpClient()
+    manager = PusherConnectionManager(max_sockets=max_sockets)
+    writer = NdjsonWriter(stream, batch_size, flush_interval, max_pending)
+    stats = {slug: ChannelStats(slug) for slug in channel_slugs}
+    started_at = time.monotonic()
+    lookup_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LOOKUPS)
+    writer_task = asyncio.create_task(writer.run())
+    channel_tasks = [asyncio.create_task(ingest_channel(slug, client, manager, writer, stats[slug], lookup_semaphore)) for slug in channel_slugs]
+
+    async def report_periodically():
+        while True:
+            await asyncio.sleep(stats_interval)
+            print(format_summary(stats, started_at, writer, manager), file=sys.stderr, flush=True)
+
+    report_task = asyncio.create_task(report_periodically()) if stats_interval > 0 else None
+    try:
+        listeners = asyncio.gather(*channel_tasks, return_exceptions=True)
+        if duration: await asyncio.wait_for(listeners, timeout=duration)
+        else: await listeners
+    except asyncio.TimeoutError:
+        pass # --duration reached
+    finally:
+        for task in channel_tasks + ([report_task] if report_task else []): task.cancel()
+        await asyncio.gather(*channel_tasks, return_exceptions=True)
+        await manager.close()
+        await client.close()
+        writer_task.cancel()
+        await asyncio.gather(writer_task, return_exceptions=True)
+        print(format_summary(stats, started_at, writer, manager), file=sys.stderr, flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream Kick chat from many channels as NDJSON, without a GUI.")
+    parser.add_argument("--channels", required=True, help="comma-separated channel slugs")
+    parser.add_argument("--output", help="NDJSON file to append to (default: stdout)")
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--stats-interval", type=float, default=60.0, help="seconds between throughput summaries on stderr (0 = only on exit)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--flush-interval", type=float, default=DEFAULT_FLUSH_INTERVAL)
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING, help="events buffered before new ones are dropped")
+    parser.add_argument("--max-sockets", type=int, help="Pusher sockets to spread subscriptions over (default: one per 50 channels)")
+    args = parser.parse_args(argv)
+
+    channel_slugs = list(dict.fromkeys(slug.strip().lower() for slug in args.channels.split(",") if slug.strip()))
+    if not channel_slugs: parser.error("no channels given")
+    max_sockets = args.max_sockets or max(1, -(-len(channel_slugs) // PUSHER_MAX_CHANNELS_PER_SOCKET))
+    stream = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr): # Library prints must not interleave with the NDJSON
+            asyncio.run(run_headless(channel_slugs, stream, args.duration, args.stats_interval, args.batch_size,
+                                     args.flush_interval, args.max_pending, max_sockets))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.output: stream.close()
+
+if __name__ == "__main__":
+    main()
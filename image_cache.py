@@ -0,0 +1,155 @@
+# image_cache.py
+import asyncio
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from image_pipeline import DecodedImage, release_photo
+from metrics import IMAGE_CACHE_LOOKUPS, IMAGE_FETCHES_IN_FLIGHT
+
+DEFAULT_IMAGE_CACHE_BYTES = 64 * 1024 * 1024 # Decoded pixels kept in memory; KICKERINO_IMAGE_CACHE_MB overrides it in the app
+NEGATIVE_TTL_SECONDS = 120.0 # A failed load is retried after this long, so one bad response doesn't hide an image all session
+HIT, MISS, NEGATIVE = "hit", "miss", "negative"
+
+def decoded_size(image: DecodedImage) -> int:
+    """RGBA bytes of every frame; animated images also keep one display image of the same size."""
+    frame_bytes = image.width * image.height * 4
+    return frame_bytes * (len(image.frames) + (1 if image.is_animated else 0))
+
+class _Entry:
+    __slots__ = ("image", "size", "expires_at")
+
+    def __init__(self, image, size: int, expires_at: float | None):
+        self.image = image # DecodedImage until first shown, then the PhotoImage made from it; None for a failed load
+        self.size = size
+        self.expires_at = expires_at # Negative entries only
+
+class ImageCache:
+    """Decoded emote and badge images for every loader, keyed by (kind, url), e.g. ("badge", url).
+
+    Sizes are counted in decoded RGBA bytes. Past max_bytes the least recently used entries are
+    dropped, except pinned ones: images embedded in a tab's scrollback, which Tk would blank out
+    if their PhotoImage were freed. A failed load is kept as a negative entry for negative_ttl
+    seconds. load() runs one loader per key at a time and forgets it once it finishes.
+
+    lookup(), pin() and unpin() run on the Tk thread; load() and put() on the asyncio loop thread.
+    PhotoImages evicted on the loop thread are handed back to the Tk thread to be released.
+    """
+    def __init__(self, max_bytes: int = DEFAULT_IMAGE_CACHE_BYTES, negative_ttl: float = NEGATIVE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict() # (kind, url) -> _Entry, least recently used first
+        self._pins = {} # (kind, url) -> number of scrollback lines showing it
+        self._in_flight = {} # (kind, url) -> loader Task; loop thread only
+        self._evicted = [] # Images dropped from the cache, released on the Tk thread
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def pinned_bytes(self) -> int:
+        with self._lock: return sum(self._entries[key].size for key in self._pins if key in self._entries)
+
+    def lookup(self, kind: str, url: str) -> tuple:
+        """(HIT, PhotoImage), (NEGATIVE, None) for a recent failure, or (MISS, None): the caller should start load()."""
+        key = (kind, url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.image is None and entry.expires_at <= time.monotonic():
+                del self._entries[key]; entry = None
+            if entry is None: state, image = MISS, None
+            elif entry.image is None: state, image = NEGATIVE, None
+            else:
+                self._entries.move_to_end(key)
+                if isinstance(entry.image, DecodedImage): entry.image = entry.image.to_photo() # Under the lock, so eviction can't race it
+                state, image = HIT, entry.image
+        IMAGE_CACHE_LOOKUPS.inc(kind, state)
+        self._release_evicted()
+        return state, image
+
+    def pin(self, keys):
+        """Keeps these (kind, url) images through eviction until unpinned; counts nest."""
+        if not keys: return
+        with self._lock:
+            for key in keys: self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, keys):
+        if not keys: return
+        with self._lock:
+            for key in keys:
+                count = self._pins.get(key, 0) - 1
+                if count > 0: self._pins[key] = count
+                else: self._pins.pop(key, None)
+            self._evict_locked()
+        self._release_evicted()
+
+    def put(self, kind: str, url: str, image: DecodedImage | None):
+        """Stores a finished load; None records a failure that expires after negative_ttl."""
+        now = time.monotonic()
+        entry = _Entry(image, decoded_size(image), None) if image is not None else _Entry(None, 0, now + self.negative_ttl)
+        with self._lock:
+            previous = self._entries.pop((kind, url), None)
+            if previous is not None:
+                self.total_bytes -= previous.size
+                if previous.image is not None: self._evicted.append(previous.image)
+            self._entries[(kind, url)] = entry
+            self.total_bytes += entry.size
+            if now >= self._next_sweep: self._sweep_negatives_locked(now)
+            self._evict_locked()
+
+    def has(self, kind: str, url: str) -> bool:
+        """Whether a lookup would hit or find a recent failure, i.e. no load is needed."""
+        with self._lock:
+            entry = self._entries.get((kind, url))
+            return entry is not None and (entry.image is not None or entry.expires_at > time.monotonic())
+
+    async def load(self, kind: str, url: str, loader: Callable[[], Awaitable[DecodedImage | None]]):
+        """Runs loader() and stores its result, unless the image is cached or already loading (then waits for that load)."""
+        key = (kind, url)
+        if self.has(kind, url): return
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_loader(kind, url, loader))
+            self._in_flight[key] = task
+            def on_done(finished):
+                if self._in_flight.get(key) is finished: del self._in_flight[key]
+            task.add_done_callback(on_done)
+        await asyncio.shield(task) # One waiter being cancelled doesn't abandon the load for the others
+
+    async def _run_loader(self, kind: str, url: str, loader: Callable[[], Awaitable[DecodedImage | None]]):
+        IMAGE_FETCHES_IN_FLIGHT.inc(kind)
+        try: image = await loader()
+        except Exception as e:
+            print(f"ImageCache: loading {kind} {url} failed: {e}")
+            traceback.print_exc()
+            image = None
+        finally: IMAGE_FETCHES_IN_FLIGHT.dec(kind)
+        self.put(kind, url, image)
+
+    def _sweep_negatives_locked(self, now: float):
+        for key in [key for key, entry in self._entries.items() if entry.image is None and entry.expires_at <= now]:
+            del self._entries[key]
+        self._next_sweep = now + self.negative_ttl
+
+    def _evict_locked(self):
+        if self.total_bytes <= self.max_bytes: return
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes: break
+            if key in self._pins: continue
+            entry = self._entries.pop(key)
+            self.total_bytes -= entry.size
+            self.evictions += 1
+            if entry.image is not None: self._evicted.append(entry.image)
+
+    def _release_evicted(self):
+        """Tk thread: frees evicted PhotoImages (and stops their animations)."""
+        if not self._evicted: return
+        with self._lock: evicted, self._evicted = self._evicted, []
+        for image in evicted:
+            if not isinstance(image, DecodedImage): release_photo(image)
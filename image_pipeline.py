@@ -0,0 +1,141 @@
+# image_pipeline.py
+import asyncio
+import io
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+
+# Loaded on first decode (in a worker) or first PhotoImage, not when the app starts
+Image = lazy_import("PIL.Image")
+ImageTk = lazy_import("PIL.ImageTk")
+ImageSequence = lazy_import("PIL.ImageSequence")
+
+DEFAULT_DECODE_WORKERS = 2 # Decodes in flight at once; keeps a burst of new emotes from hogging every core
+MAX_ANIMATION_FRAMES = 120 # Longer animations are truncated; at 28x28 this is ~375 KB of RGBA per emote
+DEFAULT_FRAME_DURATION_MS = 100 # Browsers' value for GIF frames with a missing or near-zero delay
+
+_animation_clock = None # Set by the app; receives animated images so one clock drives them all
+
+def set_animation_clock(clock):
+    global _animation_clock
+    _animation_clock = clock
+
+class DecodedImage:
+    """A finished RGBA raster produced off the Tk thread. Only the *photo* methods may touch Tk.
+
+    Animated images carry every frame in frames (frames[0] is rgba) and per-frame durations in ms.
+    """
+    __slots__ = ("width", "height", "rgba", "png", "frames", "durations")
+
+    def __init__(self, width: int, height: int, rgba: bytes, png: bytes | None = None, frames: tuple = (), durations: tuple = ()):
+        self.width = width
+        self.height = height
+        self.rgba = rgba
+        self.png = png # Encoded copy for the disk cache, when requested
+        self.frames = frames or (rgba,)
+        self.durations = durations or (0,)
+
+    @property
+    def is_animated(self) -> bool:
+        return len(self.frames) > 1
+
+    def frame_photos(self) -> list:
+        """One PhotoImage per frame. Must be called on the Tk thread."""
+        return [ImageTk.PhotoImage(Image.frombuffer("RGBA", (self.width, self.height), frame, "raw", "RGBA", 0, 1))
+                for frame in self.frames]
+
+    def to_photo(self) -> "ImageTk.PhotoImage":
+        """Builds the PhotoImage. Must be called on the Tk thread.
+
+        Animated images are handed to the animation clock, which returns the shared display image it advances.
+        """
+        if self.is_animated and _animation_clock is not None:
+            return _animation_clock.register(self)
+        return ImageTk.PhotoImage(Image.frombuffer("RGBA", (self.width, self.height), self.rgba, "raw", "RGBA", 0, 1))
+
+def release_photo(photo):
+    """Stops animating a PhotoImage made by to_photo(); Tk frees it once the last reference is gone. Tk thread only."""
+    if _animation_clock is not None: _animation_clock.unregister(photo)
+
+def _finish(pil_image: "Image.Image", encode_png: bool) -> DecodedImage:
+    if pil_image.mode != "RGBA": pil_image = pil_image.convert("RGBA")
+    png_data = None
+    if encode_png:
+        png_buffer = io.BytesIO(); pil_image.save(png_buffer, format="PNG"); png_data = png_buffer.getvalue()
+    return DecodedImage(pil_image.width, pil_image.height, pil_image.tobytes(), png_data)
+
+def decode_image(data: bytes, size: tuple | None = None, target_height: int | None = None, encode_png: bool = False, animated: bool = False) -> DecodedImage:
+    """Decodes data and resizes it to size, or to target_height keeping the aspect ratio.
+
+    Only the first frame is kept unless animated is set, in which case every frame (up to
+    MAX_ANIMATION_FRAMES) is decoded and the PNG copy is an APNG. Runs in a worker; raises
+    PIL.UnidentifiedImageError for data Pillow can't read.
+    """
+    pil_image = Image.open(io.BytesIO(data))
+    if size is None and target_height:
+        target_width = int(target_height * pil_image.width / pil_image.height) if pil_image.height else 0
+        size = (target_width if target_width > 0 else target_height, target_height)
+    if not (animated and getattr(pil_image, "n_frames", 1) > 1):
+        if getattr(pil_image, "is_animated", False): pil_image.seek(0)
+        if pil_image.mode != "RGBA": pil_image = pil_image.convert("RGBA")
+        if size and size != pil_image.size:
+            pil_image = pil_image.resize(size, Image.Resampling.LANCZOS)
+        return _finish(pil_image, encode_png)
+
+    frame_images, durations = [], []
+    for frame in ImageSequence.Iterator(pil_image):
+        if len(frame_images) >= MAX_ANIMATION_FRAMES: break
+        duration = frame.info.get("duration") or 0
+        durations.append(int(duration) if duration > 10 else DEFAULT_FRAME_DURATION_MS)
+        frame = frame.convert("RGBA")
+        if size and size != frame.size: frame = frame.resize(size, Image.Resampling.LANCZOS)
+        frame_images.append(frame)
+    png_data = None
+    if encode_png:
+        png_buffer = io.BytesIO()
+        frame_images[0].save(png_buffer, format="PNG", save_all=True, append_images=frame_images[1:], duration=durations, loop=0)
+        png_data = png_buffer.getvalue()
+    frames = tuple(frame.tobytes() for frame in frame_images)
+    return DecodedImage(frame_images[0].width, frame_images[0].height, frames[0], png_data, frames, tuple(durations))
+
+def rasterize_svg(svg_data: bytes, size: tuple, encode_png: bool = False) -> DecodedImage | None:
+    import cairosvg # Imported in the worker; the caller checks availability first
+    png_data = cairosvg.svg2png(bytestring=svg_data, output_width=size[0], output_height=size[1])
+    if png_data is None: return None
+    decoded = _finish(Image.open(io.BytesIO(png_data)), False)
+    if encode_png: decoded.png = png_data
+    return decoded
+
+class ImagePipeline:
+    """Runs image decode/resize/SVG rasterization in a worker pool with capped concurrency.
+
+    Coroutines are awaited from the asyncio loop thread, which only waits on the result and
+    keeps receiving chat in the meantime. Results are DecodedImages for the Tk thread to wrap.
+    """
+    def __init__(self, max_workers: int = DEFAULT_DECODE_WORKERS, use_processes: bool = False):
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self._executor: Executor | None = None
+        self._semaphore = None # Created lazily so it binds to the loop that uses it
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes: self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else: self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image-decode")
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self._semaphore is None: self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+
+    async def decode_image(self, data: bytes, size: tuple | None = None, target_height: int | None = None, encode_png: bool = False, animated: bool = False) -> DecodedImage:
+        return await self._run(decode_image, data, size, target_height, encode_png, animated)
+
+    async def rasterize_svg(self, svg_data: bytes, size: tuple, encode_png: bool = False) -> DecodedImage | None:
+        return await self._run(rasterize_svg, svg_data, size, encode_png)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,86 +1,109 @@
 # kick_api.py
-import aiohttp
 import asyncio
-from aiohttp.client_exceptions import ContentTypeError
+import os
 import traceback
 
-API_BASE_URL = "https://kick.com/api/v2"
+from kick_http import KickHttpClient
+from lazy_imports import lazy_import
 
-async def get_channel_info(session: aiohttp.ClientSession, channel_slug: str):
+aiohttp = lazy_import("aiohttp")
+
+API_BASE_URL = os.environ.get("KICKERINO_API_BASE_URL", "https://kick.com/api/v2").rstrip("/") # Overridable for offline/load testing
+SITE_BASE_URL = API_BASE_URL.rsplit("/api/", 1)[0] # Endpoints outside the versioned API, e.g. /emotes/<slug>
+CHANNEL_EMOTES_TTL = 300 # Emote sets change rarely; reopening a tab reuses the last lookup
+CHANNEL_INFO_TTL = 15 # Seconds a channel lookup is reused as-is (reconnects, tabs reopened)
+CHANNEL_INFO_STALE_TTL = 300 # Further seconds it is still served, while refreshed in the background
+KICK_API_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Origin': 'https://kick.com'
+}
+
+async def get_channel_info(client: KickHttpClient, channel_slug: str, max_age: float | None = None):
+    """Stream/chatroom info for a channel, or a dict with an "error" key.
+
+    Concurrent lookups of one slug share a request; successful results are cached (see
+    KickHttpClient.cached). Pass max_age=0 to force a fresh fetch, e.g. from the poller.
+    """
+    return await client.cached(("channel_info", channel_slug), lambda: _fetch_channel_info(client, channel_slug),
+                               CHANNEL_INFO_TTL, CHANNEL_INFO_STALE_TTL,
+                               cacheable=lambda info: bool(info) and not info.get("error"), max_age=max_age)
+
+def _parse_subscriber_badges(data: dict) -> list:
+    """[{"months", "url"}] from the channel payload's subscriber_badges, ascending by months."""
+    badges = []
+    for badge in data.get("subscriber_badges") or []:
+        url = (badge.get("badge_image") or {}).get("src")
+        if url and isinstance(badge.get("months"), int): badges.append({"months": badge["months"], "url": url})
+    return sorted(badges, key=lambda badge: badge["months"])
+
+async def _fetch_channel_info(client: KickHttpClient, channel_slug: str):
     url = f"{API_BASE_URL}/channels/{channel_slug}"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Referer': f'https://kick.com/{channel_slug}',
-        'Origin': 'https://kick.com'
-    }
-    
+    headers = {**KICK_API_HEADERS, 'Referer': f'https://kick.com/{channel_slug}'}
+
     response_obj = None 
     try:
-        async with session.get(url, headers=headers) as resp:
-            response_obj = resp 
-            
-            content_type_header = response_obj.headers.get('Content-Type', '').lower()
-            is_expected_json_type = 'application/json' in content_type_header
+        response_obj = await client.get(url, headers=headers)
 
-            if not is_expected_json_type:
-                print(f"INFO: API for '{channel_slug}' returned Content-Type '{content_type_header}' (Status: {response_obj.status}), but attempting to parse as JSON.")
+        content_type_header = response_obj.content_type
+        is_expected_json_type = 'application/json' in content_type_header
 
-            response_obj.raise_for_status()
-            data = await response_obj.json(content_type=None) 
-            
-            livestream_data = data.get("livestream")
-            chatroom_data = data.get("chatroom")
-            user_data = data.get("user", {})
-
-            if not livestream_data:
-                return {
-                    "username": user_data.get("username", channel_slug),
-                    "title": "Offline",
-                    "viewers": 0,
-                    "category": "N/A",
-                    "chatroom_id": chatroom_data.get("id") if chatroom_data else None,
-                    "is_live": False
-                }
+        if response_obj.status == 404:
+            print(f"API HTTP Error for {channel_slug}: 404.")
+            return {"error": f"Channel '{channel_slug}' not found (404).", "status": 404}
+        if response_obj.status >= 400:
+            print(f"API HTTP Error for {channel_slug}: {response_obj.status}.")
+            return {"error": f"API HTTP Error: {response_obj.status}", "status": response_obj.status}
+
+        if not is_expected_json_type:
+            print(f"INFO: API for '{channel_slug}' returned Content-Type '{content_type_header}' (Status: {response_obj.status}), but attempting to parse as JSON.")
+
+        data = response_obj.json()
+
+        livestream_data = data.get("livestream")
+        chatroom_data = data.get("chatroom")
+        user_data = data.get("user", {})
 
+        if not livestream_data:
             return {
                 "username": user_data.get("username", channel_slug),
-                "title": livestream_data.get("session_title", "N/A"),
-                "viewers": livestream_data.get("viewer_count", 0),
-                "category": livestream_data.get("categories", [{}])[0].get("name", "N/A") 
-                            if livestream_data.get("categories") else "N/A",
+                "title": "Offline",
+                "viewers": 0,
+                "category": "N/A",
                 "chatroom_id": chatroom_data.get("id") if chatroom_data else None,
-                "is_live": True
+                "channel_id": data.get("id"),
+                "user_id": data.get("user_id") or user_data.get("id"),
+                "subscriber_badges": _parse_subscriber_badges(data),
+                "is_live": False
             }
-    
-    except ContentTypeError as e:
-        error_text_content = "Could not read text from erroring response (ContentTypeError)"
-        current_status = "N/A"
-        if response_obj:
-            current_status = response_obj.status
-            try:
-                error_text_content = await response_obj.text()
-                print(f"ContentTypeError for {channel_slug}: {e}. Status: {current_status}. Content-Type was '{response_obj.headers.get('Content-Type', '')}'.")
-                print(f"Response body that caused ContentTypeError (first 300 chars): {error_text_content[:300]}")
-            except Exception as read_err:
-                error_text_content = f"Could not read text from erroring response: {read_err}"
-        
+
+        return {
+            "username": user_data.get("username", channel_slug),
+            "title": livestream_data.get("session_title", "N/A"),
+            "viewers": livestream_data.get("viewer_count", 0),
+            "category": livestream_data.get("categories", [{}])[0].get("name", "N/A") 
+                        if livestream_data.get("categories") else "N/A",
+            "chatroom_id": chatroom_data.get("id") if chatroom_data else None,
+            "channel_id": data.get("id"),
+            "user_id": data.get("user_id") or user_data.get("id"), # Kick user id, which 7TV links accounts by
+            "subscriber_badges": _parse_subscriber_badges(data),
+            "is_live": True
+        }
+
+    except ValueError as e: # Body wasn't JSON (e.g. a Cloudflare HTML page)
+        error_text_content = response_obj.text() if response_obj else "No response body"
+        current_status = response_obj.status if response_obj else "N/A"
+        print(f"JSON parsing failed for {channel_slug}: {e}. Status: {current_status}. Content-Type was '{response_obj.content_type if response_obj else ''}'.")
+        print(f"Response body that failed to parse (first 300 chars): {error_text_content[:300]}")
         return {
-            "error": f"JSON Parsing Failed (ContentTypeError): {e}. Server might have sent HTML or malformed JSON.",
+            "error": f"JSON Parsing Failed: {e}. Server might have sent HTML or malformed JSON.",
             "status": current_status,
             "preview": error_text_content[:200].replace('\n', ' ')
         }
 
-    except aiohttp.ClientResponseError as e:
-        current_status = e.status
-        print(f"API HTTP Error for {channel_slug}: {current_status} - {e.message}.")
-        if current_status == 404:
-            return {"error": f"Channel '{channel_slug}' not found (404).", "status": 404}
-        return {"error": f"API HTTP Error: {current_status} - {e.message}", "status": current_status}
-
-    except aiohttp.ClientConnectionError as e:
-        error_message = str(e) 
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+        error_message = str(e) or type(e).__name__
         print(f"Client Connection Error fetching channel info for {channel_slug}: {error_message}")
         return {"error": f"Connection Error: {error_message}"}
         
@@ -90,12 +113,46 @@ async def get_channel_info(session: aiohttp.ClientSession, channel_slug: str):
         current_status = response_obj.status if response_obj else "N/A"
         return {"error": f"Unexpected error during API call: {e}", "status": current_status}
 
+async def get_chat_history(client: KickHttpClient, channel_id: int) -> list:
+    """Most recent chat messages of a channel (oldest first), shaped like ChatMessageEvent data. [] on any failure."""
+    url = f"{API_BASE_URL}/channels/{channel_id}/messages"
+    try:
+        result = await client.get(url, headers={**KICK_API_HEADERS, 'Referer': 'https://kick.com/'})
+        if result.status != 200:
+            print(f"Chat history for channel {channel_id}: HTTP {result.status}.")
+            return []
+        messages = (result.json().get("data") or {}).get("messages") or []
+        return sorted((m for m in messages if isinstance(m, dict)), key=lambda m: m.get("created_at") or "")
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, AttributeError) as e:
+        print(f"Chat history for channel {channel_id} unavailable: {e}")
+        return []
+
+async def get_channel_emotes(client: KickHttpClient, channel_slug: str) -> list:
+    """Kick emote groups available in a channel's chat: its own set plus Global and Emoji. [] on any failure.
+
+    Each group is {"id", "slug" (channel groups only), "name", "emotes": [{"id", "name", ...}]}.
+    """
+    async def fetch() -> list:
+        url = f"{SITE_BASE_URL}/emotes/{channel_slug}"
+        try:
+            result = await client.get(url, headers={**KICK_API_HEADERS, 'Referer': f'https://kick.com/{channel_slug}'})
+            if result.status != 200:
+                print(f"Kick emotes for {channel_slug}: HTTP {result.status}.")
+                return []
+            groups = result.json()
+            return [group for group in groups if isinstance(group, dict)] if isinstance(groups, list) else []
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"Kick emotes for {channel_slug} unavailable: {e}")
+            return []
+    return await client.cached(("channel_emotes", channel_slug), fetch, CHANNEL_EMOTES_TTL, CHANNEL_EMOTES_TTL, cacheable=bool)
+
 if __name__ == "__main__":
     async def main_test_api():
-        async with aiohttp.ClientSession() as session:
+        client = KickHttpClient()
+        try:
             channel_name = "xqc" 
             print(f"Fetching info for: {channel_name}")
-            info = await get_channel_info(session, channel_name)
+            info = await get_channel_info(client, channel_name)
             
             if info and not info.get("error"):
                 print(f"Streamer: {info['username']}")
@@ -112,4 +169,6 @@ if __name__ == "__main__":
                     print(f"Status Code: {info.get('status')}")
             else:
                 print(f"Could not fetch info for {channel_name} (No data or error returned).")
+        finally:
+            await client.close()
     asyncio.run(main_test_api())
\ No newline at end of file
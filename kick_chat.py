@@ -1,103 +1,395 @@
 # kick_chat.py
 import asyncio
-import websockets
-import json
+import os
 import traceback 
+import random
 import socket # For socket.gaierror
-from typing import Callable
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable
+from urllib.parse import urlsplit
+
+from chat_record import parse_timestamp
+from lazy_imports import lazy_import
+from pusher_codec import (CHAT_MESSAGE_EVENT, DECODE_ERRORS, PUSHER_PING_FRAME, PUSHER_PONG_FRAME, RECV_RAW_BYTES,
+                          decode_data, dumps, loads, peek_channel, peek_event)
+
+websockets = lazy_import("websockets") # Imported when the first socket opens
 
 KICK_PUSHER_APP_KEY = "32cbd69e4b950bf97679" # Your updated key
-PUSHER_URL = f"wss://ws-us2.pusher.com/app/{KICK_PUSHER_APP_KEY}?protocol=7&client=js&version=8.4.0-rc2&flash=false" # Your updated URL
-async def listen_to_kick_chat(chatroom_id: int, message_callback: Callable):
-    uri = PUSHER_URL
-    print(f"Attempting to connect to WebSocket: {uri} for chatroom_id: {chatroom_id}")
-    try:
-        async with websockets.connect(uri, open_timeout=10) as websocket: # Added open_timeout
-            await message_callback({"type": "system", "data": f"Connected to Pusher (Host: ws-us2.pusher.com) for chatroom {chatroom_id}"})
-
-            subscribe_payload = {
-                "event": "pusher:subscribe",
-                "data": {
-                    "auth": "", 
-                    "channel": f"chatrooms.{chatroom_id}.v2"
-                }
-            }
-            await websocket.send(json.dumps(subscribe_payload))
-
-            while True:
-                try:
-                    message_raw = await asyncio.wait_for(websocket.recv(), timeout=60) # Added recv timeout
-                    message_data = json.loads(message_raw)
-                    
-                    event_name = message_data.get("event")
-
-                    if event_name == "pusher:subscription_succeeded":
-                        await message_callback({"type": "system", "data": f"Subscribed to {message_data.get('channel')}"})
+# KICKERINO_PUSHER_URL points the app at another Pusher-compatible server, e.g. benchmarks/fake_kick_server.py
+PUSHER_URL = os.environ.get("KICKERINO_PUSHER_URL") or f"wss://ws-us2.pusher.com/app/{KICK_PUSHER_APP_KEY}?protocol=7&client=js&version=8.4.0-rc2&flash=false" # Your updated URL
+PUSHER_HOST = urlsplit(PUSHER_URL).netloc
+PUSHER_MAX_CHANNELS_PER_SOCKET = 50 # Subscriptions multiplexed onto one socket before another is opened
+PUSHER_MAX_SOCKETS = 4 # Hard cap on pooled sockets; past this, channels overflow onto the least loaded one
+HANDLED_PROTOCOL_EVENTS = frozenset({
+    "pusher:connection_established", "pusher:error",
+    "pusher_internal:subscription_succeeded", "pusher:subscription_succeeded"})
+
+ACTIVITY_TIMEOUT = 30 # Seconds of silence before we probe with pusher:ping (the server's activity_timeout, if lower, wins)
+PONG_TIMEOUT = 8 # No frame at all this long after a probe means the socket is dead, even if TCP hasn't noticed
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 30.0
+BACKFILL_TIMEOUT = 5.0 # Live messages are held back at most this long while a gap is backfilled
+SEEN_MESSAGE_IDS = 1000 # Per chatroom, for de-duplicating backfilled against live messages
+
+def chatroom_channel_name(chatroom_id: int) -> str:
+    return f"chatrooms.{chatroom_id}.v2"
+
+def reconnect_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so sockets dropped together don't reconnect together."""
+    return random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * (2 ** attempt)))
+
+class _Subscription:
+    __slots__ = ("callback", "backfill", "seen_ids", "last_message_at", "recovering_since", "held")
+
+    def __init__(self, callback: Callable, backfill: Callable[[], Awaitable[list]] | None):
+        self.callback = callback
+        self.backfill = backfill # -> recent messages (oldest first), fetched after a reconnect
+        self.seen_ids = OrderedDict()
+        self.last_message_at = None # created_at (epoch seconds) of the newest message delivered
+        self.recovering_since = None # (loop time, wall time) of the drop, until resubscribed
+        self.held = None # Live messages buffered while a backfill is in flight
+
+    def mark_seen(self, message_id) -> bool:
+        """Records message_id; False if it was already delivered."""
+        if message_id is None: return True
+        if message_id in self.seen_ids: return False
+        self.seen_ids[message_id] = None
+        if len(self.seen_ids) > SEEN_MESSAGE_IDS: self.seen_ids.popitem(last=False)
+        return True
+
+class PusherConnection:
+    """One pooled Pusher socket carrying any number of chatroom subscriptions.
+
+    The socket is supervised: a quiet connection is probed with pusher:ping and declared dead
+    if nothing comes back within PONG_TIMEOUT; a dead or dropped socket is reopened with jittered
+    exponential backoff, every chatroom is resubscribed, and messages sent during the gap are
+    backfilled from the chat history endpoint, de-duplicated by message id.
+    """
+    def __init__(self, manager: "PusherConnectionManager", index: int):
+        self.manager = manager
+        self.index = index
+        self.websocket = None
+        self.socket_id = None
+        self.subscriptions = {} # Pusher channel name -> _Subscription
+        self.established = asyncio.Event()
+        self.task = None
+        self.closing = False
+        self.fatal_error = None # Set for Pusher 4000-4099 errors, which must not be retried
+        self.activity_timeout = ACTIVITY_TIMEOUT
+        self.reconnect_count = 0
+        self.last_pong_rtt = None
+        self.frames_decoded = 0
+        self.frames_skipped = 0 # Peeked and dropped without a JSON decode
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def subscribe(self, channel: str, message_callback: Callable, backfill: Callable[[], Awaitable[list]] | None = None):
+        self.subscriptions[channel] = _Subscription(message_callback, backfill)
+        if self.established.is_set(): # Otherwise sent once pusher:connection_established arrives
+            await self._send_subscription("pusher:subscribe", channel)
+
+    async def unsubscribe(self, channel: str):
+        if self.subscriptions.pop(channel, None) is None: return
+        if self.established.is_set():
+            await self._send_subscription("pusher:unsubscribe", channel)
+
+    async def close(self):
+        self.closing = True
+        if self.websocket:
+            try: await asyncio.wait_for(self.websocket.close(), timeout=5) # Clean close frame; recv loop then exits by itself
+            except Exception: pass
+        if self.task and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+
+    async def _send_subscription(self, event_name: str, channel: str):
+        if not self.websocket: return
+        payload = {"event": event_name, "data": {"auth": "", "channel": channel}}
+        try:
+            await self.websocket.send(dumps(payload))
+        except websockets.exceptions.ConnectionClosed:
+            print(f"Pusher socket #{self.index}: connection closed while sending {event_name} for {channel}.")
+
+    async def _dispatch(self, channel: str, event_obj: dict):
+        subscription = self.subscriptions.get(channel)
+        if not subscription: return
+        try:
+            await subscription.callback(event_obj)
+        except Exception as e_callback:
+            print(f"Pusher socket #{self.index}: message callback for {channel} failed: {e_callback}")
+            traceback.print_exc()
+
+    async def _broadcast(self, event_obj: dict):
+        for channel in list(self.subscriptions):
+            await self._dispatch(channel, event_obj)
+
+    async def _deliver_chat(self, channel: str, message: dict):
+        subscription = self.subscriptions.get(channel)
+        if not subscription: return
+        if subscription.held is not None: # Backfill in flight; keep live messages in order behind it
+            subscription.held.append(message); return
+        if not subscription.mark_seen(message.get("id")): return
+        subscription.last_message_at = parse_timestamp(message.get("created_at"))
+        await self._dispatch(channel, {"type": "chat", "data": message})
+
+    async def _recover_channel(self, channel: str, subscription: _Subscription):
+        """Runs once a chatroom is resubscribed after a drop: reports the outage and backfills it."""
+        dropped_at, dropped_wall = subscription.recovering_since
+        subscription.recovering_since = None
+        recovery_seconds = asyncio.get_running_loop().time() - dropped_at
+        self.manager.recovery_times.append(recovery_seconds)
+        print(f"Pusher socket #{self.index}: {channel} live again {recovery_seconds:.2f}s after the drop.")
+        backfilled = 0
+        if subscription.backfill:
+            subscription.held = []
+            try:
+                history = await asyncio.wait_for(subscription.backfill(), timeout=BACKFILL_TIMEOUT)
+            except Exception as e:
+                print(f"Pusher socket #{self.index}: backfill for {channel} failed: {e}")
+                history = []
+            held, subscription.held = subscription.held, None
+            if self.subscriptions.get(channel) is not subscription: return
+            cutoff = subscription.last_message_at or dropped_wall
+            for message in history:
+                if parse_timestamp(message.get("created_at")) < cutoff: continue # Older than what this tab already shows
+                if subscription.mark_seen(message.get("id")):
+                    subscription.last_message_at = parse_timestamp(message.get("created_at"))
+                    await self._dispatch(channel, {"type": "chat", "data": message})
+                    backfilled += 1
+            for message in held: await self._deliver_chat(channel, message)
+        note = f", {backfilled} missed message{'s' if backfilled != 1 else ''} restored" if backfilled else ""
+        await self._dispatch(channel, {"type": "system", "data": f"Chat reconnected after {recovery_seconds:.1f}s{note}."})
+
+    async def _run(self):
+        attempt = 0
+        try:
+            while not self.closing:
+                was_established, reason = await self._run_session()
+                if self.closing: break
+                if self.fatal_error:
+                    await self._broadcast({"type": "error", "data": f"Chat connection rejected: {self.fatal_error}"})
+                    break
+                if was_established: attempt = 0
+                loop = asyncio.get_running_loop()
+                for subscription in self.subscriptions.values():
+                    if subscription.recovering_since is None: subscription.recovering_since = (loop.time(), time.time())
+                delay = reconnect_delay(attempt)
+                attempt += 1
+                self.reconnect_count += 1
+                self.manager.reconnect_count += 1
+                print(f"Pusher socket #{self.index}: {reason}; reconnecting in {delay:.1f}s (attempt {attempt}).")
+                await self._broadcast({"type": "error", "data": f"Chat disconnected ({reason}); reconnecting in {delay:.1f}s..."})
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            print(f"Pusher socket #{self.index}: listener cancelled.")
+            await self._broadcast({"type": "system", "data": "Chat disconnected (cancelled)."})
+        finally:
+            self.manager._connection_finished(self)
+
+    async def _run_session(self) -> tuple:
+        """One connection attempt and its recv loop. Returns (was_established, reason it ended)."""
+        uri = PUSHER_URL
+        print(f"Pusher socket #{self.index}: connecting to {uri}")
+        was_established = False
+        try:
+            async with websockets.connect(uri, open_timeout=10, close_timeout=1) as websocket:
+                self.websocket = websocket
+                awaiting_pong_since = None
+                while True:
+                    try:
+                        timeout = PONG_TIMEOUT if awaiting_pong_since else self.activity_timeout
+                        message_raw = await asyncio.wait_for(websocket.recv(decode=not RECV_RAW_BYTES), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        if awaiting_pong_since:
+                            return was_established, f"no reply to ping within {PONG_TIMEOUT}s"
+                        awaiting_pong_since = asyncio.get_running_loop().time()
+                        await websocket.send(PUSHER_PING_FRAME)
+                        continue
+                    except websockets.exceptions.ConnectionClosed as e_closed_inner:
+                        print(f"Pusher socket #{self.index}: connection closed during recv loop: {e_closed_inner}")
+                        if 4000 <= (e_closed_inner.code or 0) < 4100: self.fatal_error = e_closed_inner.reason or f"code {e_closed_inner.code}"
+                        return was_established, f"{e_closed_inner.reason or 'closed'}, code {e_closed_inner.code}"
+                    if awaiting_pong_since: # Any frame proves the socket is alive
+                        self.last_pong_rtt = asyncio.get_running_loop().time() - awaiting_pong_since
+                        awaiting_pong_since = None
+                    # Fast path: classify by peeking; only frames someone consumes are decoded
+                    event_name = peek_event(message_raw)
+                    if event_name == CHAT_MESSAGE_EVENT:
+                        channel = peek_channel(message_raw)
+                        if channel not in self.subscriptions:
+                            self.frames_skipped += 1; continue
                     elif event_name == "pusher:ping":
-                        await websocket.send(json.dumps({"event":"pusher:pong","data":{}}))
-                    elif event_name == "pusher:connection_established":
-                        socket_id = json.loads(message_data.get("data", "{}")).get("socket_id")
-                        await message_callback({"type": "system", "data": f"Pusher connection established. Socket ID: {socket_id}"})
-                    elif event_name == "App\\Events\\ChatMessageEvent":
-                        chat_message_json_str = message_data.get("data")
-                        if chat_message_json_str:
-                            chat_message = json.loads(chat_message_json_str)
-                            await message_callback({"type": "chat", "data": chat_message})
-                    # else: # Optional: Log unhandled events
-                    #     if event_name and not event_name.startswith("pusher:internal"):
-                    #         print(f"Unhandled Pusher event: {event_name} - Data: {message_data.get('data')}")
-
-                except asyncio.TimeoutError: # Timeout on recv()
-                    # print(f"WebSocket recv timeout for chatroom {chatroom_id}, sending keepalive ping...")
+                        await websocket.send(PUSHER_PONG_FRAME)
+                        continue
+                    elif event_name not in HANDLED_PROTOCOL_EVENTS: # Pong, other chatroom events (bans, pins, ...)
+                        self.frames_skipped += 1; continue
                     try:
-                        # Send a Pusher ping to see if connection is still alive, or our own if needed
-                        # await websocket.ping() # Standard WebSocket ping
-                        # Pusher might expect its own ping/pong, but ponging to their ping is usually enough
-                        pass # Rely on server pings for now
-                    except websockets.exceptions.ConnectionClosed:
-                        print(f"Connection closed while trying to send keepalive ping for chatroom {chatroom_id}.")
-                        break # Break from while loop
-                except websockets.exceptions.ConnectionClosed as e_closed_inner:
-                    print(f"WebSocket connection closed during recv loop (Chatroom {chatroom_id}): {e_closed_inner}")
-                    await message_callback({"type": "error", "data": f"Chat disconnected: {e_closed_inner.reason} (Code: {e_closed_inner.code})"})
-                    break 
-                except json.JSONDecodeError as e_json:
-                    print(f"JSON Decode Error (Chatroom {chatroom_id}): {message_raw} - Error: {e_json}")
-                except Exception as e_inner_loop:
-                    print(f"Error in WebSocket recv loop (Chatroom {chatroom_id}): {e_inner_loop}")
-                    traceback.print_exc()
-
-
-    except websockets.exceptions.InvalidURI as e_uri:
-        print(f"Invalid WebSocket URI: {uri} - Error: {e_uri}")
-        await message_callback({"type": "error", "data": f"Invalid chat server URI."})
-    except websockets.exceptions.ConnectionClosedOK as e_closed_ok: # Should be caught by inner loop's ConnectionClosed
-        print(f"WebSocket connection closed OK (Chatroom {chatroom_id}): {e_closed_ok}")
-        await message_callback({"type": "system", "data": f"Chat connection closed."})
-    except websockets.exceptions.ConnectionClosedError as e_closed_err: # Should be caught by inner loop's ConnectionClosed
-        print(f"WebSocket connection closed with error (Chatroom {chatroom_id}): {e_closed_err}")
-        await message_callback({"type": "error", "data": f"Chat connection error: {e_closed_err.reason} (Code: {e_closed_err.code})"})
-    except socket.gaierror as e_gaierror: 
-        print(f"DNS Resolution Error (gaierror) for {uri}: {e_gaierror}")
-        await message_callback({"type": "error", "data": f"Cannot resolve chat server: {e_gaierror}."})
-    except ConnectionRefusedError as e_conn_refused:
-        print(f"Connection refused for {uri}: {e_conn_refused}")
-        await message_callback({"type": "error", "data": f"Chat server refused connection."})
-    except asyncio.TimeoutError as e_timeout: # Timeout on connect()
-        print(f"Connection timed out for {uri}: {e_timeout}")
-        await message_callback({"type": "error", "data": f"Chat connection timed out."})
+                        message_data = loads(message_raw)
+                        event_data = decode_data(message_data)
+                    except DECODE_ERRORS as e_json:
+                        print(f"Pusher socket #{self.index}: JSON Decode Error: {message_raw[:300]!r} - Error: {e_json}")
+                        continue
+                    self.frames_decoded += 1
+                    channel = message_data.get("channel")
+
+                    if event_name == CHAT_MESSAGE_EVENT:
+                        if event_data: await self._deliver_chat(channel, event_data)
+                    elif event_name in ("pusher_internal:subscription_succeeded", "pusher:subscription_succeeded"):
+                        subscription = self.subscriptions.get(channel)
+                        if subscription and subscription.recovering_since:
+                            asyncio.get_running_loop().create_task(self._recover_channel(channel, subscription))
+                        else:
+                            await self._dispatch(channel, {"type": "system", "data": f"Subscribed to {channel}"})
+                    elif event_name == "pusher:connection_established":
+                        self.socket_id = event_data.get("socket_id")
+                        self.activity_timeout = min(ACTIVITY_TIMEOUT, event_data.get("activity_timeout") or ACTIVITY_TIMEOUT)
+                        print(f"Pusher socket #{self.index}: connection established. Socket ID: {self.socket_id}")
+                        was_established = True
+                        self.established.set()
+                        if not self.reconnect_count:
+                            await self._broadcast({"type": "system", "data": f"Connected to Pusher (Host: {PUSHER_HOST})"})
+                        for pending_channel in list(self.subscriptions):
+                            await self._send_subscription("pusher:subscribe", pending_channel)
+                    elif event_name == "pusher:error":
+                        print(f"Pusher socket #{self.index}: server error: {event_data}")
+                        code = event_data.get("code") if isinstance(event_data, dict) else None
+                        if code and 4000 <= code < 4100: self.fatal_error = event_data.get("message") or f"code {code}"
+
+        except websockets.exceptions.InvalidURI as e_uri:
+            print(f"Invalid WebSocket URI: {uri} - Error: {e_uri}")
+            self.fatal_error = "invalid chat server URI"
+            return was_established, "invalid chat server URI"
+        except socket.gaierror as e_gaierror:
+            print(f"DNS Resolution Error (gaierror) for {uri}: {e_gaierror}")
+            return was_established, f"cannot resolve chat server: {e_gaierror}"
+        except ConnectionRefusedError as e_conn_refused:
+            print(f"Connection refused for {uri}: {e_conn_refused}")
+            return was_established, "chat server refused connection"
+        except asyncio.TimeoutError as e_timeout: # Timeout on connect()
+            print(f"Connection timed out for {uri}: {e_timeout}")
+            return was_established, "connection timed out"
+        except websockets.exceptions.ConnectionClosed as e_closed:
+            return was_established, f"{e_closed.reason or 'closed'}, code {e_closed.code}"
+        except OSError as e_os:
+            print(f"Socket error on Pusher socket #{self.index} ({uri}): {e_os}")
+            return was_established, f"network error: {e_os}"
+        except Exception as e:
+            print(f"General WebSocket error on Pusher socket #{self.index} ({uri}): {e}")
+            traceback.print_exc()
+            return was_established, f"connection error: {e}"
+        finally:
+            self.websocket = None
+            self.established.clear()
+
+class PusherConnectionManager:
+    """Multiplexes chatroom subscriptions over a small pool of shared Pusher sockets.
+
+    Joining a chatroom sends a single pusher:subscribe frame on an already open socket;
+    a new socket is only opened when every pooled one is at PUSHER_MAX_CHANNELS_PER_SOCKET.
+    Must be used from the asyncio loop thread.
+    """
+    def __init__(self, max_channels_per_socket: int = PUSHER_MAX_CHANNELS_PER_SOCKET, max_sockets: int = PUSHER_MAX_SOCKETS):
+        self.max_channels_per_socket = max_channels_per_socket
+        self.max_sockets = max_sockets
+        self.connections = []
+        self.channel_owners = {} # Pusher channel name -> PusherConnection
+        self._next_index = 0
+        self.reconnect_count = 0
+        self.recovery_times = deque(maxlen=100) # Seconds from a socket drop to each chatroom being live again
+
+    def is_subscribed(self, chatroom_id: int) -> bool:
+        return chatroom_channel_name(chatroom_id) in self.channel_owners
+
+    async def subscribe(self, chatroom_id: int, message_callback: Callable, backfill: Callable[[], Awaitable[list]] | None = None):
+        """Joins a chatroom. backfill, if given, returns recent messages and is used to fill reconnect gaps."""
+        channel = chatroom_channel_name(chatroom_id)
+        connection = self.channel_owners.get(channel)
+        if connection is None:
+            connection = self._pick_connection()
+            self.channel_owners[channel] = connection
+        await connection.subscribe(channel, message_callback, backfill)
+
+    async def unsubscribe(self, chatroom_id: int):
+        channel = chatroom_channel_name(chatroom_id)
+        connection = self.channel_owners.pop(channel, None)
+        if connection is None: return
+        await connection.unsubscribe(channel)
+        if not connection.subscriptions: # Last chatroom on this socket; don't keep it open idle
+            await connection.close()
+
+    async def wait_for_disconnect(self, chatroom_id: int):
+        """Returns once the socket carrying this chatroom is closed for good (reconnects don't count)."""
+        connection = self.channel_owners.get(chatroom_channel_name(chatroom_id))
+        if connection and connection.task:
+            await asyncio.shield(connection.task)
+
+    async def close(self):
+        connections = list(self.connections)
+        self.channel_owners.clear()
+        for connection in connections: connection.subscriptions.clear()
+        await asyncio.gather(*(connection.close() for connection in connections), return_exceptions=True)
+
+    def _pick_connection(self) -> PusherConnection:
+        live_connections = [c for c in self.connections if not c.closing]
+        with_room = [c for c in live_connections if len(c.subscriptions) < self.max_channels_per_socket]
+        if with_room:
+            return min(with_room, key=lambda c: len(c.subscriptions))
+        if len(live_connections) >= self.max_sockets:
+            return min(live_connections, key=lambda c: len(c.subscriptions))
+        connection = PusherConnection(self, self._next_index)
+        self._next_index += 1
+        self.connections.append(connection)
+        connection.start()
+        return connection
+
+    def _connection_finished(self, connection: PusherConnection):
+        connection.closing = True
+        if connection in self.connections: self.connections.remove(connection)
+        for channel in [ch for ch, owner in self.channel_owners.items() if owner is connection]:
+            del self.channel_owners[channel]
+
+def normalize_chat_event(channel_slug: str, event_obj: dict, received_at: float) -> dict:
+    """Flattens a listener event ({"type": "chat" | "system" | "error", "data": ...}) into a plain, stable record for logs."""
+    event_type = event_obj.get("type")
+    if event_type != "chat":
+        return {"type": event_type, "channel": channel_slug, "received_at": received_at, "message": str(event_obj.get("data"))}
+    message = event_obj.get("data") or {}
+    sender = message.get("sender") or {}
+    identity = sender.get("identity") or {}
+    return {
+        "type": "chat", "channel": channel_slug, "received_at": received_at,
+        "id": message.get("id"), "created_at": message.get("created_at"),
+        "user": sender.get("username"), "user_id": sender.get("id"), "color": identity.get("color"),
+        "badges": [{"type": b.get("type"), "text": b.get("text"), "count": b.get("count")} for b in identity.get("badges") or []],
+        "content": message.get("content"), "message_type": message.get("type"),
+    }
+
+async def listen_to_kick_chat(chatroom_id: int, message_callback: Callable, manager: PusherConnectionManager | None = None,
+                              backfill: Callable[[], Awaitable[list]] | None = None):
+    """Subscribes one chatroom and keeps it live across reconnects until cancelled or rejected by the server.
+
+    Uses the given shared manager, or a private single-socket one when none is passed.
+    """
+    owns_manager = manager is None
+    if owns_manager: manager = PusherConnectionManager()
+    print(f"Subscribing to chatroom_id: {chatroom_id}")
+    try:
+        await manager.subscribe(chatroom_id, message_callback, backfill)
+        await manager.wait_for_disconnect(chatroom_id)
     except asyncio.CancelledError:
         print(f"Chat listener task for chatroom {chatroom_id} cancelled.")
         await message_callback({"type": "system", "data": "Chat disconnected (cancelled)."}) # Notify UI
-    except Exception as e:
-        print(f"General WebSocket error connecting to {uri} (Chatroom {chatroom_id}): {e}")
-        traceback.print_exc()
-        await message_callback({"type": "error", "data": f"Chat connection error: {e}"})
+    finally:
+        if owns_manager: await manager.close()
+        else: await manager.unsubscribe(chatroom_id)
 
 if __name__ == "__main__":
     async def main_test_chat():
-        import aiohttp 
-        from kick_api import get_channel_info 
+        from kick_api import get_channel_info, get_chat_history
+        from kick_http import KickHttpClient
 
         temp_channel_slug = "xqc" 
         print(f"--- Chat Test for channel: {temp_channel_slug} ---")
@@ -113,16 +405,20 @@ if __name__ == "__main__":
             elif message_obj["type"] == "error":
                 print(f"ERROR >> {message_obj['data']}")
 
-        async with aiohttp.ClientSession() as session:
+        client = KickHttpClient()
+        try:
             print(f"Fetching channel info for '{temp_channel_slug}' to get chatroom_id...")
-            info = await get_channel_info(session, temp_channel_slug)
+            info = await get_channel_info(client, temp_channel_slug)
             
             if info and info.get("chatroom_id") and not info.get("error"):
                 chatroom_id_to_test = info["chatroom_id"]
                 print(f"Got chatroom_id: {chatroom_id_to_test}. Connecting to chat...")
-                await listen_to_kick_chat(int(chatroom_id_to_test), simple_test_callback)
+                backfill = (lambda: get_chat_history(client, info["channel_id"])) if info.get("channel_id") else None
+                await listen_to_kick_chat(int(chatroom_id_to_test), simple_test_callback, backfill=backfill)
             elif info and info.get("error"):
                 print(f"API Error preventing chat test: {info['error']}")
             else:
                 print(f"Could not get chatroom_id for '{temp_channel_slug}'. Cannot connect to chat.")
+        finally:
+            await client.close()
     asyncio.run(main_test_chat())
\ No newline at end of file
@@ -0,0 +1,194 @@
+# kick_http.py
+import asyncio
+import email.utils
+import json
+import random
+import time
+from typing import Awaitable, Callable
+from urllib.parse import urlsplit
+
+from lazy_imports import lazy_import
+
+aiohttp = lazy_import("aiohttp") # Imported with the first session, not at startup
+
+CONNECTOR_LIMIT = 64
+CONNECTOR_LIMIT_PER_HOST = 8 # Kick, 7TV and each emote CDN get their own share; a burst to one host can't starve the others
+KEEPALIVE_TIMEOUT = 60 # Idle pooled connections are kept this long, so polls and emote fetches skip TCP/TLS setup
+DNS_CACHE_TTL = 300
+REQUEST_TIMEOUT_TOTAL = 20
+REQUEST_TIMEOUT_CONNECT = 8
+RETRYABLE_STATUSES = frozenset({429, 502, 503, 504})
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0 # Doubles per attempt (plus jitter) when the server gives no Retry-After
+MAX_RETRY_DELAY = 60.0
+RESPONSE_CACHE_MAX_ENTRIES = 256
+
+class HttpResult:
+    """A fully read response. The body is read inside the request, so the connection is back in the pool."""
+    __slots__ = ("url", "status", "headers", "body")
+
+    def __init__(self, url: str, status: int, headers, body: bytes):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("Content-Type", "").lower()
+
+    def json(self):
+        return json.loads(self.body)
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+def _retry_after_seconds(headers) -> float | None:
+    value = headers.get("Retry-After")
+    if not value: return None
+    try: return max(0.0, float(value))
+    except ValueError: pass
+    try: # HTTP-date form
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+class KickHttpClient:
+    """Owns the app's single pooled aiohttp session and the request policy around it.
+
+    get() retries 429 and gateway errors with exponential backoff, honouring Retry-After; a 429
+    also holds back every other request to that host until the cooldown ends. Concurrent get()s
+    of one URL with the same headers, and concurrent cached() loads of one key, share a single
+    in-flight request.
+    cached() serves fresh values from a small TTL cache and stale ones while revalidating in the
+    background. Must be used from the asyncio loop thread.
+    """
+    def __init__(self):
+        self._session = None
+        self._in_flight = {} # singleflight key -> shared Task
+        self._cache = {} # cache key -> (stored_at, value), oldest first
+        self._revalidating = {} # cache key -> background refresh Task
+        self._host_cooldowns = {} # host -> loop time before which nothing is sent (after a 429)
+        self.requests_sent = 0
+        self.retries = 0
+        self.coalesced_count = 0
+        self.cache_hits = 0
+        self.stale_hits = 0
+
+    @property
+    def session(self) -> "aiohttp.ClientSession | None":
+        return self._session
+
+    def ensure_session(self) -> "aiohttp.ClientSession":
+        """The shared session, created on first use. Call from the loop thread."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=CONNECTOR_LIMIT, limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+                                             ttl_dns_cache=DNS_CACHE_TTL, keepalive_timeout=KEEPALIVE_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_TOTAL, sock_connect=REQUEST_TIMEOUT_CONNECT))
+        return self._session
+
+    async def close(self):
+        for task in list(self._revalidating.values()): task.cancel()
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _singleflight(self, key, factory: Callable[[], Awaitable]):
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            def on_done(finished):
+                if self._in_flight.get(key) is finished: del self._in_flight[key]
+                if not finished.cancelled(): finished.exception() # Retrieved even if every waiter was cancelled
+            task.add_done_callback(on_done)
+        else:
+            self.coalesced_count += 1
+        return await asyncio.shield(task) # One caller giving up doesn't cancel the request for the others
+
+    async def get(self, url: str, headers: dict | None = None) -> HttpResult:
+        """GET with retries. Raises aiohttp.ClientError / asyncio.TimeoutError once retries are exhausted."""
+        # Per-call headers can change the response (auth, Accept, conditional GETs), so they are part of the key
+        header_key = tuple(sorted((name.lower(), value) for name, value in headers.items())) if headers else ()
+        return await self._singleflight(("GET", url, header_key), lambda: self._get_with_retries(url, headers))
+
+    async def get_json(self, url: str, headers: dict | None = None):
+        """Decoded JSON body of a 200 response, else None."""
+        result = await self.get(url, headers)
+        if result.status != 200: return None
+        try: return result.json()
+        except ValueError: return None
+
+    def _backoff_delay(self, attempt: int) -> float:
+        return min(MAX_RETRY_DELAY, RETRY_BASE_DELAY * (2 ** attempt)) * random.uniform(0.75, 1.25)
+
+    async def _wait_for_host(self, host: str):
+        loop = asyncio.get_running_loop()
+        while True:
+            delay = self._host_cooldowns.get(host, 0) - loop.time()
+            if delay <= 0: return
+            await asyncio.sleep(delay)
+
+    async def _get_with_retries(self, url: str, headers: dict | None) -> HttpResult:
+        host = urlsplit(url).hostname or ""
+        attempt = 0
+        while True:
+            await self._wait_for_host(host)
+            session = self.ensure_session()
+            try:
+                self.requests_sent += 1
+                async with session.get(url, headers=headers) as response:
+                    result = HttpResult(url, response.status, response.headers, await response.read())
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= MAX_RETRIES: raise
+                delay = self._backoff_delay(attempt)
+                print(f"KickHttpClient: {type(e).__name__} fetching {url}; retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s.")
+            else:
+                if result.status not in RETRYABLE_STATUSES or attempt >= MAX_RETRIES: return result
+                retry_after = _retry_after_seconds(result.headers)
+                delay = min(MAX_RETRY_DELAY, retry_after) if retry_after is not None else self._backoff_delay(attempt)
+                if result.status == 429:
+                    loop_time = asyncio.get_running_loop().time()
+                    self._host_cooldowns[host] = max(self._host_cooldowns.get(host, 0), loop_time + delay)
+                print(f"KickHttpClient: HTTP {result.status} from {url}; retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s.")
+            self.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def cached(self, key, load: Callable[[], Awaitable], ttl: float, stale_ttl: float = 0.0,
+                     cacheable: Callable[[object], bool] = lambda value: value is not None, max_age: float | None = None):
+        """load()'s result, served from cache while younger than ttl (or max_age when given).
+
+        Up to stale_ttl past that the stale value is returned at once and refreshed in the background;
+        passing max_age disables serving stale. Only results that pass cacheable are stored.
+        """
+        entry = self._cache.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age <= (ttl if max_age is None else max_age):
+                self.cache_hits += 1
+                return entry[1]
+            if max_age is None and age <= ttl + stale_ttl:
+                self.stale_hits += 1
+                if key not in self._revalidating:
+                    task = asyncio.ensure_future(self._load_and_store(key, load, cacheable))
+                    self._revalidating[key] = task
+                    def on_done(finished):
+                        self._revalidating.pop(key, None)
+                        if not finished.cancelled() and finished.exception():
+                            print(f"KickHttpClient: background refresh of {key} failed: {finished.exception()}")
+                    task.add_done_callback(on_done)
+                return entry[1]
+        return await self._load_and_store(key, load, cacheable)
+
+    async def _load_and_store(self, key, load: Callable[[], Awaitable], cacheable: Callable[[object], bool]):
+        value = await self._singleflight(("cached", key), load)
+        if cacheable(value):
+            self._cache.pop(key, None) # Re-inserted at the end: the dict stays ordered oldest first
+            self._cache[key] = (time.monotonic(), value)
+            while len(self._cache) > RESPONSE_CACHE_MAX_ENTRIES:
+                del self._cache[next(iter(self._cache))]
+        return value
+
+    def invalidate(self, key):
+        self._cache.pop(key, None)
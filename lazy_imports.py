@@ -0,0 +1,52 @@
+# lazy_imports.py
+import importlib
+import threading
+import time
+import types
+
+IMPORT_TIMES = {} # module name -> seconds its first real import took, for the startup report
+_import_lock = threading.Lock()
+
+class LazyModule(types.ModuleType):
+    """Stands in for a heavy module until one of its attributes is first used.
+
+    Unlike importlib.util.LazyLoader, nothing is put in sys.modules early, so a plain import of the
+    same module elsewhere (or on another thread) is unaffected; the real import runs under Python's
+    normal import lock. After loading, the module's namespace is copied in, so later attribute
+    reads are ordinary lookups.
+    """
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            with _import_lock:
+                IMPORT_TIMES.setdefault(self.__name__, time.perf_counter() - started)
+                self.__dict__.update((key, value) for key, value in module.__dict__.items() if not key.startswith("__"))
+                self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.load(), attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+def lazy_import(name: str) -> LazyModule:
+    """module = lazy_import("aiohttp"): imported on first attribute access instead of here."""
+    return LazyModule(name)
+
+def preload(*names: str):
+    """Imports modules now by name, e.g. from a background thread while the window paints.
+
+    Later first uses of their lazy stand-ins then cost only the namespace copy.
+    """
+    for name in names:
+        started = time.perf_counter()
+        importlib.import_module(name)
+        with _import_lock: IMPORT_TIMES.setdefault(name, time.perf_counter() - started)
@@ -1,40 +1,77 @@
 # main.py
+import time
+LAUNCHED_AT = time.perf_counter() # Before any other import, so the startup report includes them
 import customtkinter as ctk
-from PIL import Image, ImageTk, UnidentifiedImageError
+import argparse
 import asyncio
+import concurrent.futures
+import os
 import threading
-import io
-import aiohttp
 import traceback
 
 # Import local modules
-from kick_api import get_channel_info
-from kick_chat import listen_to_kick_chat
+from kick_api import get_channel_info, get_chat_history
+from kick_http import KickHttpClient
+from kick_chat import PusherConnectionManager, normalize_chat_event
 from channel_tab import ChannelTab 
 from badge_manager import BadgeManager
+from emote_manager import EmoteManager
+from emote_providers import default_emote_providers
+from gui_dispatcher import GuiDispatcher
+from asset_cache import DiskAssetCache
+from image_pipeline import ImagePipeline, set_animation_clock
+from image_cache import ImageCache, DEFAULT_IMAGE_CACHE_BYTES
+from asset_prefetch import AssetPrefetcher
+from emote_usage import EmoteUsageStats
+from animation_clock import AnimationClock
+from stream_poller import StreamInfoPoller
+from chat_archive import ChatArchive
+from metrics import REGISTRY, CHAT_MESSAGES, MetricsServer, DEFAULT_METRICS_PORT
+from metrics_overlay import MetricsOverlay
+from stall_watchdog import StallWatchdog, ProfileCapture, DEFAULT_STALL_THRESHOLD, DEFAULT_PROFILE_SECONDS
+from lazy_imports import lazy_import, preload
+from startup_timing import StartupTimeline
 
-# --- Global Configuration & State ---
-GUI_UPDATE_QUEUE = asyncio.Queue()
+aiohttp = lazy_import("aiohttp")
+# Imported in the background while the window paints, instead of on the first click or message
+WARM_UP_IMPORTS = ("aiohttp", "websockets", "websockets.asyncio.client", "PIL.ImageTk", "PIL.ImageSequence")
+STARTUP_TIMELINE = StartupTimeline(LAUNCHED_AT)
+SHUTDOWN_TIMEOUT_SECONDS = 5.0 # How long closing the window waits for sockets to close and buffered data to be written
+STARTUP_TIMELINE.mark("imports")
 
 ctk.set_appearance_mode("dark")
 ctk.set_default_color_theme("blue")
 
 class KickChatterApp(ctk.CTk):
-    def __init__(self, loop: asyncio.AbstractEventLoop):
+    def __init__(self, loop: asyncio.AbstractEventLoop, stall_threshold: float = DEFAULT_STALL_THRESHOLD, diagnostics_dir: str | None = None):
         super().__init__()
         self.loop = loop
+        self.http_client = KickHttpClient() # Pooled session + retry/coalescing policy shared by every HTTP caller
         self.aiohttp_session = None
         
         self.active_channels = {}
-        self.IMAGE_CACHE = {}  
-        self.EMOTE_FETCH_LOCKS = {}
+        self.asset_disk_cache = DiskAssetCache() # Emote/badge bytes and rasterized PNGs persisted across launches
+        self.image_pipeline = ImagePipeline() # Decode/resize/rasterize off the asyncio loop thread
+        # Every decoded emote and badge, bounded in bytes; KICKERINO_IMAGE_CACHE_MB sets the budget
+        image_cache_mb = os.environ.get("KICKERINO_IMAGE_CACHE_MB")
+        self.image_cache = ImageCache(max_bytes=int(float(image_cache_mb) * 1024 * 1024) if image_cache_mb else DEFAULT_IMAGE_CACHE_BYTES)
         self.badge_manager = None 
+        self.emote_manager = None
+        self.asset_prefetcher = None # Holds chat messages briefly while their emotes and badges load; created with the managers
+        self.emote_usage = EmoteUsageStats() # Per-channel emote counts, persisted; decides which emotes a new tab loads first
+        self.pusher_manager = PusherConnectionManager() # Shared Pusher sockets; only touched from the asyncio loop
+        self.stream_poller = StreamInfoPoller(self._fetch_stream_info, self._on_stream_info_changed) # Started with the session
+        self.chat_archive = ChatArchive() # Everything received, appended to compressed per-channel logs; started with the session
+        # Prometheus text on localhost; started with the session unless KICKERINO_METRICS_PORT is 0
+        self.metrics_server = MetricsServer(port=int(os.environ.get("KICKERINO_METRICS_PORT", DEFAULT_METRICS_PORT)))
 
         self.APP_FONT_FAMILY = "Segoe UI" 
         self.DEFAULT_FONT_SIZE = 13
         self.DEFAULT_FONT = (self.APP_FONT_FAMILY, self.DEFAULT_FONT_SIZE)
         self.TITLE_FONT = (self.APP_FONT_FAMILY, 15, "bold")
         self.INFO_FONT = (self.APP_FONT_FAMILY, 12)
+        self.SCROLLBACK_LIMIT = 500 # Chat lines kept per channel tab; older lines are dropped from memory and screen
+        self.display_scale = 2 if float(self.tk.call("tk", "scaling")) >= 2.0 else 1 # 2x badges from 144 DPI (Tk scaling is pixels per point)
 
         self.title("Kick.com Multi-Chatter")
         self.geometry("900x750")
@@ -78,12 +115,72 @@ class KickChatterApp(ctk.CTk):
 
 
         # --- Tab View for Channels ---
-        self.tab_view = ctk.CTkTabview(self, corner_radius=10)
+        self.tab_view = ctk.CTkTabview(self, corner_radius=10, command=self._notify_focused_tab)
         self.tab_view.grid(row=1, column=0, padx=10, pady=(5,10), sticky="nsew")
         self._initialize_info_tab()
 
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self.process_gui_updates()
+        # Loop-thread -> Tk-thread hand-off; the Tk thread picks updates up every WAKE_POLL_MS
+        self.gui_dispatcher = GuiDispatcher(self, self._handle_gui_update)
+        # One timer animates every on-screen animated emote; decoded animations register with it
+        self.animation_clock = AnimationClock(self, self._visible_chat_images)
+        set_animation_clock(self.animation_clock)
+        self.metrics_overlay = MetricsOverlay(self) # F12 shows rates, queue wait, render latency and cache ratios
+        self.bind("<F12>", self.metrics_overlay.toggle)
+        # Reports stalls of either thread with stack samples; F9 profiles both threads for DEFAULT_PROFILE_SECONDS
+        self.stall_watchdog = StallWatchdog(stall_threshold, report_dir=diagnostics_dir) if stall_threshold > 0 else None
+        if self.stall_watchdog:
+            self.stall_watchdog.watch_loop(self.loop)
+            self.stall_watchdog.watch_tk(self)
+            self.stall_watchdog.start()
+        self.profile_capture = ProfileCapture(self, self.loop, report_dir=diagnostics_dir)
+        self.bind("<F9>", lambda event: self.profile_capture.start(DEFAULT_PROFILE_SECONDS))
+        self._register_metrics()
+        self.after_idle(self._start_warm_up)
+
+    def _start_warm_up(self):
+        STARTUP_TIMELINE.mark("window_ready")
+        asyncio.run_coroutine_threadsafe(self._warm_up(), self.loop)
+
+    async def _warm_up(self):
+        """Gets everything the first channel needs ready before the user presses Connect."""
+        try:
+            await asyncio.to_thread(preload, *WARM_UP_IMPORTS) # Off both UI threads
+            STARTUP_TIMELINE.mark("deferred_imports")
+            await self._ensure_session()
+            STARTUP_TIMELINE.mark("session_ready")
+            async def timed(name, coroutine):
+                await coroutine; STARTUP_TIMELINE.mark(name)
+            await asyncio.gather(timed("badges_prerendered", self.badge_manager.prerender_badges()),
+                                 timed("global_emotes", self.emote_manager.load_global_emotes()))
+        except Exception as e:
+            print(f"Warm-up failed (everything still loads on demand): {e}")
+            traceback.print_exc()
+
+    def _register_metrics(self):
+        """Figures the app's components already track, read when the registry is collected."""
+        REGISTRY.callback("kickerino_gui_queue_depth", "Updates waiting for the Tk thread.", self.gui_dispatcher.depth)
+        REGISTRY.callback("kickerino_gui_queue_max_depth", "Deepest the GUI update queue has been.", lambda: self.gui_dispatcher.max_depth)
+        REGISTRY.callback("kickerino_pusher_reconnects_total", "Pusher socket reconnects.", lambda: self.pusher_manager.reconnect_count, kind="counter")
+        REGISTRY.callback("kickerino_http_requests_total", "HTTP requests sent, including retries.", lambda: self.http_client.requests_sent, kind="counter")
+        REGISTRY.callback("kickerino_http_retries_total", "HTTP requests retried.", lambda: self.http_client.retries, kind="counter")
+        REGISTRY.callback("kickerino_http_cache_hits_total", "API responses served from the HTTP client's cache.", lambda: self.http_client.cache_hits, kind="counter")
+        REGISTRY.callback("kickerino_image_cache_bytes", "Decoded bytes held by the in-memory image cache.", lambda: self.image_cache.total_bytes)
+        REGISTRY.callback("kickerino_image_cache_pinned_bytes", "Image cache bytes pinned by chat lines in scrollback.", lambda: self.image_cache.pinned_bytes)
+        REGISTRY.callback("kickerino_image_cache_entries", "Images (including recent failures) in the in-memory image cache.", lambda: len(self.image_cache))
+        REGISTRY.callback("kickerino_image_cache_evictions_total", "Images evicted from the in-memory cache to stay within budget.", lambda: self.image_cache.evictions, kind="counter")
+        REGISTRY.callback("kickerino_7tv_emote_set_updates_total", "7TV emote-set diffs applied from the EventAPI.",
+                          self._seventv_updates_applied, kind="counter")
+        REGISTRY.callback("kickerino_archive_dropped_total", "Chat events the archive dropped because its writer fell behind.", lambda: self.chat_archive.dropped_count, kind="counter")
+
+    def _seventv_updates_applied(self) -> int:
+        provider = self.emote_manager.providers.get("7tv") if self.emote_manager else None
+        return provider.events.updates_applied if provider else 0
+
+    def _visible_chat_images(self) -> set:
+        if self.state() == "iconic": return set()
+        tab_ui = self.active_channels.get(self.tab_view.get(), {}).get("tab_ref")
+        return set(tab_ui.visible_image_names()) if tab_ui else set()
 
     def toggle_always_on_top(self):
         """Toggles the 'always on top' state of the window."""
@@ -113,16 +210,39 @@ class KickChatterApp(ctk.CTk):
 
     async def _ensure_session(self):
         if not self.aiohttp_session or self.aiohttp_session.closed:
-            self.aiohttp_session = aiohttp.ClientSession()
+            self.aiohttp_session = self.http_client.ensure_session()
             print("aiohttp session initialized.")
+            self.stream_poller.start()
+            self.chat_archive.start()
+            if self.metrics_server.port: await self.metrics_server.start()
         if not self.badge_manager and self.aiohttp_session: # Check aiohttp_session too
-            self.badge_manager = BadgeManager(self.loop, self.aiohttp_session)
+            self.badge_manager = BadgeManager(self.loop, self.aiohttp_session, disk_cache=self.asset_disk_cache, image_pipeline=self.image_pipeline,
+                                              display_scale=self.display_scale, image_cache=self.image_cache)
             print("BadgeManager initialized.")
+        if not self.emote_manager and self.aiohttp_session:
+            self.emote_manager = EmoteManager(self.loop, self.aiohttp_session, disk_cache=self.asset_disk_cache, image_pipeline=self.image_pipeline,
+                                              image_cache=self.image_cache, providers=default_emote_providers(self.http_client, self.aiohttp_session))
+            print(f"EmoteManager initialized with emote providers: {', '.join(p.name for p in self.emote_manager.providers.providers)}.")
+        if not self.asset_prefetcher and self.emote_manager and self.badge_manager:
+            self.asset_prefetcher = AssetPrefetcher(self.image_cache, self.emote_manager, self.badge_manager, self.gui_dispatcher.post,
+                                                    emote_usage=self.emote_usage)
+
+    async def _fetch_stream_info(self, channel_slug: str) -> dict:
+        await self._ensure_session()
+        return await get_channel_info(self.http_client, channel_slug, max_age=0)
+
+    def _on_stream_info_changed(self, channel_slug: str, changed_fields: dict):
+        self.gui_dispatcher.post("stream_info_changed", {"slug": channel_slug, "data": changed_fields})
+
+    def _notify_focused_tab(self):
+        """Tells the stream poller which tab is in front; it refreshes that channel more often."""
+        focused_slug = self.tab_view.get()
+        self.loop.call_soon_threadsafe(self.stream_poller.set_focused, focused_slug)
 
     async def _close_session(self):
 
         if self.aiohttp_session and not self.aiohttp_session.closed:
-            await self.aiohttp_session.close()
+            await self.http_client.close()
             self.aiohttp_session = None 
             print("aiohttp session closed.")
 
@@ -173,65 +293,89 @@ class KickChatterApp(ctk.CTk):
             channel_tab_ui.pack(expand=True, fill="both")
             self.active_channels[slug] = {
                 "tab_ref": channel_tab_ui, "info_task": None,
-                "chat_task": None, "chatroom_id": None
+                "chatroom_id": None
             }
             channel_tab_ui.add_message_to_gui(f"[SYSTEM] Connecting to {slug}...\n", True)
-            asyncio.run_coroutine_threadsafe(self._async_connect_channel(slug), self.loop)
+            # Kept as info_task so closing the tab cancels a connect still in progress
+            self.active_channels[slug]["info_task"] = asyncio.run_coroutine_threadsafe(self._async_connect_channel(slug), self.loop)
+        self._notify_focused_tab()
         self.channel_entry.delete(0, "end")
         self.loop.call_soon_threadsafe(lambda: self.connect_button.configure(state="normal", text="Connect"))
 
     async def _async_connect_channel(self, channel_slug: str):
         # ... (same as before) ...
+        chan_data = None
         try:
             await self._ensure_session() 
-            if channel_slug not in self.active_channels: return
-            chan_data = self.active_channels[channel_slug]
-            if chan_data.get("info_task") and not chan_data["info_task"].done(): chan_data["info_task"].cancel()
-            if chan_data.get("chat_task") and not chan_data["chat_task"].done(): chan_data["chat_task"].cancel()
+            # active_channels is changed on the Tk thread: hold on to this tab's entry and compare against it after every await
+            chan_data = self.active_channels.get(channel_slug)
+            if not chan_data: return
+            if chan_data.get("chatroom_id"): await self.pusher_manager.unsubscribe(chan_data["chatroom_id"])
             if not self.aiohttp_session:
                 raise RuntimeError("aiohttp_session is None when calling get_channel_info")
-            info = await get_channel_info(self.aiohttp_session, channel_slug)
-            if channel_slug not in self.active_channels: return
+            info = await get_channel_info(self.http_client, channel_slug)
+            if self.active_channels.get(channel_slug) is not chan_data: return
             if info.get("error"):
-                await GUI_UPDATE_QUEUE.put(("stream_info_error", {"slug": channel_slug, "error": info["error"]}))
+                self.gui_dispatcher.post("stream_info_error", {"slug": channel_slug, "error": info["error"]})
                 return
-            self.active_channels[channel_slug]["chatroom_id"] = info.get("chatroom_id")
-            await GUI_UPDATE_QUEUE.put(("stream_info_update", {"slug": channel_slug, "data": info}))
+            chatroom_id = chan_data["chatroom_id"] = info.get("chatroom_id")
+            self.gui_dispatcher.post("stream_info_update", {"slug": channel_slug, "data": info})
+            self.stream_poller.add_channel(channel_slug, info)
+            # The channel's own subscriber badges load alongside the join, before its first messages arrive
+            chan_data["badge_task"] = asyncio.create_task(
+                self.badge_manager.load_channel_subscriber_badges(channel_slug, info.get("subscriber_badges") or []))
+            # Emote sets and the most-used emote images load while the chat is joined
+            chan_data["emote_task"] = asyncio.create_task(self._warm_channel_emotes(channel_slug, info))
             if not info.get("is_live"):
-                 await GUI_UPDATE_QUEUE.put(("system_message", {"slug": channel_slug, "message": f"Channel {info.get('username', channel_slug)} is offline."}))
-            if self.active_channels[channel_slug]["chatroom_id"]:
-                chatroom_id = self.active_channels[channel_slug]["chatroom_id"]
-                await GUI_UPDATE_QUEUE.put(("system_message", {"slug": channel_slug, "message": f"Joining chat for {info.get('username', channel_slug)}..."}))
+                 self.gui_dispatcher.post("system_message", {"slug": channel_slug, "message": f"Channel {info.get('username', channel_slug)} is offline."})
+            if chatroom_id:
+                self.gui_dispatcher.post("system_message", {"slug": channel_slug, "message": f"Joining chat for {info.get('username', channel_slug)}..."})
                 async def on_chat_event(event_data_obj):
-                    await GUI_UPDATE_QUEUE.put(("chat_event", {"slug": channel_slug, "event": event_data_obj}))
-                chat_task = self.loop.create_task(listen_to_kick_chat(chatroom_id, on_chat_event))
-                self.active_channels[channel_slug]["chat_task"] = chat_task
+                    if event_data_obj.get("type") == "chat": CHAT_MESSAGES.inc(channel_slug)
+                    self.chat_archive.append(channel_slug, normalize_chat_event(channel_slug, event_data_obj, time.time())) # Buffered only
+                    self.asset_prefetcher.submit(channel_slug, event_data_obj) # Posted as "chat_event" once its images are cached, or after a few ms
+                channel_id = info.get("channel_id")
+                backfill = (lambda: get_chat_history(self.http_client, channel_id)) if channel_id else None # Fills reconnect gaps
+                await self.pusher_manager.subscribe(chatroom_id, on_chat_event, backfill) # One subscribe frame on a pooled socket
             else:
-                await GUI_UPDATE_QUEUE.put(("system_message", {"slug": channel_slug, "message": f"Could not find chatroom for {channel_slug}."}))
+                self.gui_dispatcher.post("system_message", {"slug": channel_slug, "message": f"Could not find chatroom for {channel_slug}."})
+            if self.active_channels.get(channel_slug) is not chan_data: await self._abandon_connect(channel_slug, chan_data)
         except asyncio.CancelledError:
-            if channel_slug in self.active_channels: 
-                await GUI_UPDATE_QUEUE.put(("system_message", {"slug": channel_slug, "message": f"Connection to {channel_slug} cancelled."}))
+            if self.active_channels.get(channel_slug) is chan_data:
+                self.gui_dispatcher.post("system_message", {"slug": channel_slug, "message": f"Connection to {channel_slug} cancelled."})
+            elif chan_data and chan_data.get("chatroom_id"): await self._abandon_connect(channel_slug, chan_data) # Got as far as starting the join
         except Exception as e:
             print(f"Error in _async_connect_channel for {channel_slug}: {e}")
             traceback.print_exc()
             if channel_slug in self.active_channels: 
-                await GUI_UPDATE_QUEUE.put(("system_message", {"slug": channel_slug, "message": f"Connection to {channel_slug} failed: {type(e).__name__} - {e}"}))
+                self.gui_dispatcher.post("system_message", {"slug": channel_slug, "message": f"Connection to {channel_slug} failed: {type(e).__name__} - {e}"})
+
+    async def _abandon_connect(self, channel_slug: str, chan_data: dict):
+        """Undoes a connect whose tab was closed while it ran; the close may have missed the subscribe and the tasks."""
+        print(f"Channel {channel_slug} was closed while connecting; leaving its chat.")
+        for task_name in ("badge_task", "emote_task"):
+            if chan_data.get(task_name): chan_data[task_name].cancel()
+        if channel_slug not in self.active_channels: # Not reopened in the meantime
+            self.stream_poller.remove_channel(channel_slug)
+            if chan_data.get("chatroom_id"): await self.pusher_manager.unsubscribe(chan_data["chatroom_id"])
+
+    async def _warm_channel_emotes(self, channel_slug: str, info: dict):
+        """Loads the channel's emote sets from every provider (and any global set still missing) together, then its emote images by past usage."""
+        await self.emote_manager.load_channel_emotes(channel_slug, info)
+        if channel_slug not in self.active_channels: return
+        started = time.perf_counter()
+        count = await self.emote_manager.prefetch_emote_images(channel_slug, await self.emote_usage.counts(channel_slug))
+        print(f"Warmed {count} emote images for {channel_slug} in {time.perf_counter() - started:.2f}s.")
 
     def close_specific_channel(self, channel_slug: str):
         print(f"Main app: Closing channel {channel_slug}")
         if channel_slug in self.active_channels:
             channel_data = self.active_channels[channel_slug]
-            tasks_to_await_for_close = []
             if channel_data.get("info_task") and not channel_data["info_task"].done(): channel_data["info_task"].cancel()
-            if channel_data.get("chat_task") and not channel_data["chat_task"].done():
-                channel_data["chat_task"].cancel()
-                tasks_to_await_for_close.append(channel_data["chat_task"])
-            if tasks_to_await_for_close and self.loop.is_running():
-                async def await_channel_close_tasks():
-                    print(f"Awaiting cancellation of tasks for {channel_slug}...")
-                    await asyncio.gather(*tasks_to_await_for_close, return_exceptions=True)
-                    print(f"Tasks for {channel_slug} finalized.")
-                asyncio.run_coroutine_threadsafe(await_channel_close_tasks(), self.loop)
+            if channel_data.get("emote_task") and not channel_data["emote_task"].done(): self.loop.call_soon_threadsafe(channel_data["emote_task"].cancel)
+            if channel_data.get("badge_task") and not channel_data["badge_task"].done(): self.loop.call_soon_threadsafe(channel_data["badge_task"].cancel)
+            if channel_data.get("chatroom_id") and self.loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.pusher_manager.unsubscribe(channel_data["chatroom_id"]), self.loop)
             if channel_slug in self.tab_view._name_list:
                 try:
                     current_active_tab = self.tab_view.get()
@@ -241,6 +385,11 @@ class KickChatterApp(ctk.CTk):
                         self.tab_view.set(self.tab_view._name_list[0]) 
                 except Exception as e: print(f"Error deleting or resetting tab for {channel_slug}: {e}")
             del self.active_channels[channel_slug]
+            self.loop.call_soon_threadsafe(self.stream_poller.remove_channel, channel_slug)
+            if self.asset_prefetcher: self.loop.call_soon_threadsafe(self.asset_prefetcher.remove_channel, channel_slug)
+            if self.emote_manager: asyncio.run_coroutine_threadsafe(self.emote_manager.remove_channel(channel_slug), self.loop)
+            asyncio.run_coroutine_threadsafe(self.chat_archive.close_channel(channel_slug), self.loop)
+            if self.badge_manager: self.loop.call_soon_threadsafe(self.badge_manager.remove_channel, channel_slug)
             print(f"Channel {channel_slug} removed from active channels.")
             if not self.active_channels and "Info" not in self.tab_view._name_list:
                 self._initialize_info_tab()
@@ -248,96 +397,59 @@ class KickChatterApp(ctk.CTk):
                     self.tab_view.set("Info")
         else: print(f"Attempted to close non-active channel: {channel_slug}")
 
-    def process_gui_updates(self):
-        try:
-            while not GUI_UPDATE_QUEUE.empty():
-                task_type, payload = GUI_UPDATE_QUEUE.get_nowait()
-                channel_slug = payload.get("slug")
-                if task_type not in ["emote_image_loaded", "badge_image_loaded"] and \
-                   (not channel_slug or channel_slug not in self.active_channels):
-                    GUI_UPDATE_QUEUE.task_done()
-                    continue
-                tab_ui = self.active_channels.get(channel_slug, {}).get("tab_ref") if channel_slug else None
-                if not tab_ui and task_type not in ["emote_image_loaded", "badge_image_loaded"]:
-                    GUI_UPDATE_QUEUE.task_done()
-                    continue
-
-                if task_type == "stream_info_update":
-                    if tab_ui is not None:
-                        tab_ui.update_stream_info(payload["data"])
-                elif task_type == "stream_info_error":
-                    if tab_ui is not None:
-                        tab_ui.update_stream_info_error(payload["error"])
-                elif task_type == "chat_event":
-                    event_detail = payload["event"]
-                    if tab_ui is not None:
-                        if event_detail["type"] == "chat":
-                            tab_ui.display_chat_message(event_detail["data"])
-                        elif event_detail["type"] == "system":
-                            tab_ui.add_message_to_gui(f"[SYSTEM] {event_detail['data']}\n", "system")
-                        elif event_detail["type"] == "error":
-                            tab_ui.add_message_to_gui(f"[ERROR] Chat: {event_detail['data']}\n", "error")
-                elif task_type == "system_message":
-                    if tab_ui is not None:
-                        tab_ui.add_message_to_gui(f"{payload['message']}\n", "system")
-                elif task_type == "badge_image_loaded": 
-                    pass
-                GUI_UPDATE_QUEUE.task_done()
-        except asyncio.QueueEmpty: pass 
-        except Exception as e:
-            print(f"Error in process_gui_updates: {e}")
-            traceback.print_exc()
-        finally: self.after(100, self.process_gui_updates)
+    def _handle_gui_update(self, task_type: str, payload: dict):
+        """Applies one update from the asyncio side; called on the Tk thread by gui_dispatcher."""
+        channel_slug = payload.get("slug")
+        tab_ui = self.active_channels.get(channel_slug, {}).get("tab_ref") if channel_slug else None
+        if task_type == "image_loaded": # Not channel-specific: any tab may be showing a placeholder for it
+            for channel_data in self.active_channels.values():
+                if channel_data.get("tab_ref"): channel_data["tab_ref"].replace_placeholders(payload["kind"], payload["url"])
+            return
+        if tab_ui is None:
+            return # Channel was closed while the update was in flight
+
+        if task_type in ("stream_info_update", "stream_info_changed"): # The latter carries only the changed fields
+            tab_ui.update_stream_info(payload["data"])
+        elif task_type == "stream_info_error":
+            tab_ui.update_stream_info_error(payload["error"])
+        elif task_type == "chat_event":
+            event_detail = payload["event"]
+            if event_detail["type"] == "chat":
+                tab_ui.display_chat_message(event_detail["data"], payload.get("tokens"))
+                if "first_message" not in STARTUP_TIMELINE.marks:
+                    STARTUP_TIMELINE.mark("first_message"); print(STARTUP_TIMELINE.report())
+            elif event_detail["type"] == "system":
+                tab_ui.add_message_to_gui(f"[SYSTEM] {event_detail['data']}\n", "system")
+            elif event_detail["type"] == "error":
+                tab_ui.add_message_to_gui(f"[ERROR] Chat: {event_detail['data']}\n", "error")
+        elif task_type == "system_message":
+            tab_ui.add_message_to_gui(f"{payload['message']}\n", "system")
 
-    async def _load_and_cache_emote(self, url: str, name: str, origin_slug: str):
-        if url in self.IMAGE_CACHE: return
-        if url not in self.EMOTE_FETCH_LOCKS: self.EMOTE_FETCH_LOCKS[url] = asyncio.Lock()
-        async with self.EMOTE_FETCH_LOCKS[url]:
-            if url in self.IMAGE_CACHE: return
-            try:
-                await self._ensure_session()
-                if not self.aiohttp_session or self.aiohttp_session.closed:
-                    print(f"Session is closed when trying to load emote {name} from {url}.")
-                    return
-                if origin_slug in self.active_channels:
-                    await self._ensure_session()
-                async with self.aiohttp_session.get(url) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        try:
-                            pil_image = Image.open(io.BytesIO(image_data))
-                            target_height = 24 
-                            aspect_ratio = pil_image.width / pil_image.height
-                            target_width = int(target_height * aspect_ratio)
-                            if target_width <= 0: target_width = target_height 
-                            if target_height <= 0: target_height = 24
-                            pil_image_resized = pil_image.resize((target_width, target_height), Image.Resampling.LANCZOS)
-                            tk_image = ImageTk.PhotoImage(pil_image_resized)
-                            self.IMAGE_CACHE[url] = tk_image
-                        except UnidentifiedImageError: print(f"Failed to identify image for emote {name} from {url}.")
-                        except Exception as e_pil: print(f"Pillow/Tkinter image error for emote {name} ({url}): {e_pil}")
-                    else: print(f"Failed to load emote {name} from {url}: HTTP {response.status}")
-            except aiohttp.ClientError as e_http: print(f"HTTP error loading emote {name} from {url}: {e_http}")
-            except Exception as e: print(f"Error loading/caching emote {name} ({url}): {e}")
-            
     def on_closing(self):
         print("Closing application - Initiating task cancellation...")
-        tasks_to_await = []
         for slug, data in list(self.active_channels.items()):
             if data.get("info_task") and not data["info_task"].done(): data["info_task"].cancel()
-            if data.get("chat_task") and not data["chat_task"].done():
-                data["chat_task"].cancel()
-                tasks_to_await.append(data["chat_task"])
+        # Both before the wait below: updates for the closing window are dropped, and the watchdog would report the wait
+        self.gui_dispatcher.close()
+        if self.stall_watchdog: self.stall_watchdog.stop()
         if self.loop.is_running():
-            if self.aiohttp_session and not self.aiohttp_session.closed:
-                session_close_task = self.loop.create_task(self._close_session())
-                tasks_to_await.append(session_close_task)
-            if tasks_to_await:
-                async def await_app_shutdown_tasks():
-                    print(f"Awaiting {len(tasks_to_await)} app-level tasks during shutdown...")
-                    await asyncio.gather(*tasks_to_await, return_exceptions=True)
-                    print("App-level tasks finalized in on_closing.")
-                asyncio.run_coroutine_threadsafe(await_app_shutdown_tasks(), self.loop)
+            async def await_app_shutdown_tasks():
+                print("Closing shared Pusher sockets and aiohttp session during shutdown...")
+                await asyncio.gather(self.pusher_manager.close(), self.stream_poller.stop(), self._close_session(), self.metrics_server.stop(),
+                                     *([self.emote_manager.close()] if self.emote_manager else []),
+                                     *([self.asset_prefetcher.close()] if self.asset_prefetcher else []), return_exceptions=True)
+                # Once no more chat can arrive and no more images load: the archive's last batch, the disk cache index and emote usage counts
+                for name, close in (("chat archive", self.chat_archive.close), ("asset cache index", self.asset_disk_cache.flush), ("emote usage stats", self.emote_usage.flush)):
+                    try: await close()
+                    except Exception as e: print(f"Closing the {name} failed: {e}")
+                print("App-level tasks finalized in on_closing.")
+            shutdown = asyncio.run_coroutine_threadsafe(await_app_shutdown_tasks(), self.loop)
+            # The loop is stopped as soon as mainloop returns, so the final writes must finish before destroy()
+            try: shutdown.result(timeout=SHUTDOWN_TIMEOUT_SECONDS)
+            except concurrent.futures.TimeoutError: print(f"Shutdown tasks did not finish within {SHUTDOWN_TIMEOUT_SECONDS:.0f}s; closing anyway.")
+            except Exception as e: print(f"Shutdown tasks failed: {e}")
+        self.image_pipeline.shutdown()
+        self.animation_clock.stop()
         self.destroy()
         print("Tkinter window destroyed.")
 
@@ -362,11 +474,18 @@ def run_async_loop(loop: asyncio.AbstractEventLoop):
         print("Asyncio loop has stopped.")
 
 if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Kick.com multi-channel chat viewer.")
+    arg_parser.add_argument("--profile", type=float, metavar="SECONDS", help="profile both threads (cProfile + tracemalloc) for SECONDS after startup")
+    arg_parser.add_argument("--stall-threshold", type=float, default=DEFAULT_STALL_THRESHOLD * 1000, metavar="MS",
+                            help="report loop/Tk stalls longer than this with stack samples (0 = off; default %(default).0f)")
+    arg_parser.add_argument("--diagnostics-dir", help="where stall and profile reports are written (default: <data dir>/diagnostics)")
+    cli_args = arg_parser.parse_args()
     async_event_loop = asyncio.new_event_loop()
     # async_event_loop.set_debug(True)
     loop_thread = threading.Thread(target=run_async_loop, args=(async_event_loop,), daemon=True)
     loop_thread.start()
-    app = KickChatterApp(loop=async_event_loop)
+    app = KickChatterApp(loop=async_event_loop, stall_threshold=cli_args.stall_threshold / 1000, diagnostics_dir=cli_args.diagnostics_dir)
+    if cli_args.profile: app.after_idle(app.profile_capture.start, cli_args.profile)
     app.mainloop()
     print("Tkinter mainloop finished. Signaling asyncio loop to stop.")
     if async_event_loop.is_running(): async_event_loop.call_soon_threadsafe(async_event_loop.stop)
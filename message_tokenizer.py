@@ -0,0 +1,87 @@
+# message_tokenizer.py
+import itertools
+import re
+from collections import OrderedDict
+from functools import lru_cache
+
+KICK_EMOTE_URL_TEMPLATE = "https://files.kick.com/emotes/{emote_id}/fullsize"
+PARSE_CACHE_SIZE = 1024 # Recently parsed (emote index, content) pairs; copypasta spam becomes a dict hit
+# One pass over the message: Kick placeholder | URL | @mention | any other word. Whitespace falls between matches.
+TOKEN_PATTERN = re.compile(r"\[emote:(\d+):([^\]]+)\]|((?:https?://|www\.)\S+)|(@\w+)|(\S+)")
+# Part types whose data is an emote dict with "name" and "url"; also the image cache kinds for their images
+EMOTE_TOKEN_TYPES = ("kick_emote", "7tv_emote", "bttv_emote", "ffz_emote", "local_emote")
+
+_index_generations = itertools.count(1)
+
+class EmoteIndex:
+    """Immutable name -> (token_type, emote_data) lookup for one channel, merged from every emote set.
+
+    generation is unique per built index, so parse results cached against an older index are never reused.
+    """
+    __slots__ = ("lookup", "generation")
+
+    def __init__(self, lookup: dict):
+        self.lookup = lookup
+        self.generation = next(_index_generations)
+
+    def __len__(self): return len(self.lookup)
+
+EMPTY_EMOTE_INDEX = EmoteIndex({})
+
+@lru_cache(maxsize=4096)
+def kick_emote_from_placeholder(emote_id: str, emote_name: str) -> dict:
+    # Shared per (id, name) so every message using an emote points at the same small dict
+    return {"id": emote_id, "name": emote_name, "url": KICK_EMOTE_URL_TEMPLATE.format(emote_id=emote_id), "source": "kick"}
+
+class MessageTokenizer:
+    """Splits chat content into ("text" | "url" | "mention" | one of EMOTE_TOKEN_TYPES, data) parts.
+
+    Adjacent plain words and whitespace are merged into one "text" part. Results are tuples and are
+    shared between callers through an LRU keyed on (index generation, content).
+    """
+    def __init__(self, cache_size: int = PARSE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def tokenize(self, content: str, emote_index: EmoteIndex | None = None, kick_emotes_meta: list | None = None) -> tuple:
+        emote_index = emote_index or EMPTY_EMOTE_INDEX
+        cacheable = not kick_emotes_meta # Per-message emote metadata would have to be part of the key
+        if cacheable:
+            key = (emote_index.generation, content)
+            parts = self._cache.get(key)
+            if parts is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return parts
+            self.cache_misses += 1
+        parts = self._tokenize(content, emote_index.lookup, kick_emotes_meta)
+        if cacheable:
+            self._cache[key] = parts
+            if len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+        return parts
+
+    @staticmethod
+    def _tokenize(content: str, lookup: dict, kick_emotes_meta: list | None) -> tuple:
+        kick_meta_by_id = {str(e.get("id")): e for e in kick_emotes_meta if e.get("id")} if kick_emotes_meta else None
+        parts = []
+        text_start = 0 # Start of the pending run of plain text, flushed when a non-text part is found
+        for match in TOKEN_PATTERN.finditer(content):
+            word = match.group(5)
+            if word is not None:
+                found = lookup.get(word)
+                if found is None: continue # Stays inside the pending text run
+                part = found
+            elif match.group(1) is not None:
+                emote_id = match.group(1)
+                meta = kick_meta_by_id.get(emote_id) if kick_meta_by_id else None
+                part = ("kick_emote", meta if meta and meta.get("url") else kick_emote_from_placeholder(emote_id, match.group(2)))
+            elif match.group(3) is not None: part = ("url", match.group(3))
+            else: part = ("mention", match.group(4))
+            start = match.start()
+            if start > text_start: parts.append(("text", content[text_start:start]))
+            parts.append(part)
+            text_start = match.end()
+        if text_start < len(content): parts.append(("text", content[text_start:]))
+        return tuple(parts)
@@ -0,0 +1,220 @@
+# metrics.py
+"""In-process runtime metrics, shared by the asyncio loop thread and the Tk thread.
+
+Instruments are module-level and always on: an increment is a lock and an add. They are read
+by the debug overlay (metrics_overlay.py) and served in Prometheus text format by MetricsServer.
+"""
+import asyncio
+import bisect
+import math
+import threading
+from typing import Callable
+
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_PORT = 9477
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0) # Seconds
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_names: tuple, label_values: tuple) -> str:
+    if not label_names: return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf: return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {} # label values tuple -> value
+
+    def values(self) -> dict:
+        with self._lock: return dict(self._values)
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for label_values, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock: self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def remove(self, *label_values):
+        with self._lock: self._values.pop(label_values, None)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values):
+        with self._lock: self._values[label_values] = value
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock: self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+class CallbackMetric(_Metric):
+    """Value read from its owner at collection time, e.g. a queue length or an existing stats attribute.
+
+    read_fn returns a number, or {label values tuple: number} for labelled metrics.
+    """
+    def __init__(self, name: str, help_text: str, read_fn: Callable, kind: str = "gauge", label_names: tuple = ()):
+        super().__init__(name, help_text, label_names)
+        self.kind = kind
+        self.read_fn = read_fn
+
+    def values(self) -> dict:
+        try: result = self.read_fn()
+        except Exception: return {} # Owner torn down mid-scrape
+        return result if isinstance(result, dict) else {(): result}
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None: series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1 # Per-bucket (non-cumulative) counts; the last slot is +Inf
+            series[1] += value
+
+    def remove(self, *label_values):
+        with self._lock: self._values.pop(label_values, None)
+
+    def snapshot(self) -> dict:
+        """{label values: (per-bucket counts, sum)}, copied."""
+        with self._lock: return {labels: (list(counts), total) for labels, (counts, total) in self._values.items()}
+
+    def quantile(self, q: float, counts: list) -> float | None:
+        """Estimate from per-bucket counts (e.g. the difference of two snapshots), interpolating within the bucket."""
+        total = sum(counts)
+        if total <= 0: return None
+        rank = q * total
+        seen = 0
+        for position, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if position == len(self.buckets): return self.buckets[-1] # Beyond the last bound: report the bound
+                lower = self.buckets[position - 1] if position else 0.0
+                return lower + (self.buckets[position] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        bucket_label_names = self.label_names + ("le",)
+        for label_values, (counts, total) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(bucket_label_names, label_values + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, label_values)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, label_values)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Adds a metric; registering a name again replaces the previous one (e.g. a recreated owner's callback)."""
+        with self._lock: self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names: tuple = ()) -> Counter:
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name: str, help_text: str, label_names: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def callback(self, name: str, help_text: str, read_fn: Callable, kind: str = "gauge", label_names: tuple = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, read_fn, kind, label_names))
+
+    def get(self, name: str) -> _Metric | None:
+        with self._lock: return self._metrics.get(name)
+
+    def expose(self) -> str:
+        """Every metric in Prometheus text exposition format (version 0.0.4)."""
+        with self._lock: metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics: lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# --- Instruments updated directly by the code paths they measure ---
+CHAT_MESSAGES = REGISTRY.counter("kickerino_chat_messages_total", "Chat messages received from Pusher.", ("channel",))
+GUI_QUEUE_WAIT = REGISTRY.histogram("kickerino_gui_queue_wait_seconds", "Time updates wait in the GUI dispatcher queue before the Tk thread handles them.")
+RENDER_LATENCY = REGISTRY.histogram("kickerino_chat_render_latency_seconds",
+                                    "From a message's Pusher created_at to its line being inserted in the chat view.", ("channel",))
+IMAGE_CACHE_LOOKUPS = REGISTRY.counter("kickerino_image_cache_lookups_total",
+                                       "Emote and badge cache lookups while rendering; result is hit, miss (fetch started) or negative (known failure).",
+                                       ("cache", "result"))
+IMAGE_FETCHES_IN_FLIGHT = REGISTRY.gauge("kickerino_image_fetches_in_flight", "Emote and badge image loads currently running.", ("cache",))
+SCHEDULING_LAG = REGISTRY.histogram("kickerino_scheduling_lag_seconds",
+                                    "How late the watchdog's periodic callback ran: asyncio loop lag or Tk after() drift.", ("thread",))
+PREFETCH_HOLD = REGISTRY.histogram("kickerino_prefetch_hold_seconds", "How long chat messages were held while their emotes and badges loaded.",
+                                   buckets=(0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.08, 0.16))
+PREFETCH_PLACEHOLDERS = REGISTRY.counter("kickerino_prefetch_placeholders_total",
+                                         "Images still loading when their message was shown; swapped in place once they arrive.")
+THREAD_STALLS = REGISTRY.counter("kickerino_thread_stalls_total", "Times a thread went past the watchdog's stall threshold.", ("thread",))
+
+class MetricsServer:
+    """Serves REGISTRY as text on http://host:port/metrics from the asyncio loop. Localhost only by default."""
+    def __init__(self, registry: MetricsRegistry = REGISTRY, host: str = DEFAULT_METRICS_HOST, port: int = DEFAULT_METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self) -> bool:
+        if self._server: return True
+        try: self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        except OSError as e:
+            print(f"MetricsServer: could not listen on {self.host}:{self.port}: {e}")
+            return False
+        print(f"MetricsServer: serving metrics on http://{self.host}:{self.port}/metrics")
+        return True
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""): pass # Headers are not needed
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] in ("GET", "HEAD") and parts[1].split("?")[0] in ("/", "/metrics"):
+                status, body = "200 OK", self.registry.expose().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            head = (f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("latin-1")
+            writer.write(head if parts and parts[0] == "HEAD" else head + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError): pass
+        finally:
+            writer.close()
@@ -0,0 +1,104 @@
+# metrics_overlay.py
+import time
+
+import customtkinter as ctk
+
+from metrics import (REGISTRY, CHAT_MESSAGES, GUI_QUEUE_WAIT, RENDER_LATENCY, IMAGE_CACHE_LOOKUPS,
+                     IMAGE_FETCHES_IN_FLIGHT, SCHEDULING_LAG, THREAD_STALLS)
+
+OVERLAY_REFRESH_MS = 1000
+OVERLAY_FONT = ("Consolas", 11)
+
+def _format_seconds(seconds: float | None) -> str:
+    if seconds is None: return "-"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.1f}s"
+
+def _counts_delta(current: tuple | None, previous: tuple | None) -> list:
+    if current is None: return []
+    if previous is None: return current[0]
+    return [now - before for now, before in zip(current[0], previous[0])]
+
+class MetricsOverlay:
+    """Debug panel drawn over the top-right corner of the window, refreshed once a second while shown.
+
+    Rates and latency percentiles cover the last refresh interval; cache and reconnect figures are
+    totals since launch. Tk thread only.
+    """
+    def __init__(self, tk_root):
+        self.tk_root = tk_root
+        self.label = ctk.CTkLabel(tk_root, text="", font=OVERLAY_FONT, justify="left", anchor="nw",
+                                  fg_color=("gray85", "gray14"), corner_radius=6, padx=8, pady=6)
+        self._after_id = None
+        self._previous = None # (monotonic time, chat counts, queue wait snapshot, latency snapshot, scheduling lag snapshot)
+
+    @property
+    def visible(self) -> bool:
+        return self._after_id is not None
+
+    def toggle(self, event=None):
+        if self.visible: self.hide()
+        else: self.show()
+
+    def show(self):
+        if self.visible: return
+        self._previous = self._sample()
+        self.label.configure(text="collecting...")
+        self.label.place(relx=1.0, x=-14, y=56, anchor="ne")
+        self.label.lift()
+        self._after_id = self.tk_root.after(OVERLAY_REFRESH_MS, self._refresh)
+
+    def hide(self):
+        if self._after_id is not None:
+            try: self.tk_root.after_cancel(self._after_id)
+            except Exception: pass
+            self._after_id = None
+        self.label.place_forget()
+
+    def _sample(self) -> tuple:
+        return (time.monotonic(), CHAT_MESSAGES.values(), GUI_QUEUE_WAIT.snapshot(), RENDER_LATENCY.snapshot(), SCHEDULING_LAG.snapshot())
+
+    def _refresh(self):
+        self._after_id = None
+        try:
+            current = self._sample()
+            self.label.configure(text=self._render(current, self._previous))
+            self.label.lift()
+            self._previous = current
+        except Exception as e:
+            print(f"MetricsOverlay: refresh failed: {e}")
+        self._after_id = self.tk_root.after(OVERLAY_REFRESH_MS, self._refresh)
+
+    def _render(self, current: tuple, previous: tuple) -> str:
+        now, chat_counts, queue_wait, latency, lag = current
+        then, previous_chat_counts, previous_queue_wait, previous_latency, previous_lag = previous
+        elapsed = max(now - then, 1e-6)
+        lines = [f"{'channel':<16}{'msg/s':>7}{'p50':>8}{'p95':>8}"]
+        for (channel,), count in sorted(chat_counts.items(), key=lambda item: -item[1]):
+            rate = (count - previous_chat_counts.get((channel,), 0)) / elapsed
+            latency_counts = _counts_delta(latency.get((channel,)), previous_latency.get((channel,)))
+            lines.append(f"{channel[:15]:<16}{rate:>7.1f}{_format_seconds(RENDER_LATENCY.quantile(0.5, latency_counts)):>8}"
+                         f"{_format_seconds(RENDER_LATENCY.quantile(0.95, latency_counts)):>8}")
+        wait_counts = _counts_delta(queue_wait.get(()), previous_queue_wait.get(()))
+        depth = self._read("kickerino_gui_queue_depth")
+        lines.append(f"GUI queue  depth {depth:.0f}  wait p50 {_format_seconds(GUI_QUEUE_WAIT.quantile(0.5, wait_counts))}"
+                     f" p95 {_format_seconds(GUI_QUEUE_WAIT.quantile(0.95, wait_counts))}")
+        stalls = THREAD_STALLS.values()
+        for (thread,) in sorted(lag):
+            lag_counts = _counts_delta(lag.get((thread,)), previous_lag.get((thread,)))
+            lines.append(f"{thread + ' lag':<12}p95 {_format_seconds(SCHEDULING_LAG.quantile(0.95, lag_counts))}"
+                         f"  stalls {stalls.get((thread,), 0):.0f}")
+        lookups = IMAGE_CACHE_LOOKUPS.values()
+        for cache in sorted({cache for cache, _result in lookups}):
+            hits, misses, negatives = (lookups.get((cache, result), 0) for result in ("hit", "miss", "negative"))
+            total = hits + misses + negatives
+            lines.append(f"{cache:<11}{hits / total:>5.0%} hit  {misses:.0f} miss  {negatives:.0f} neg")
+        lines.append(f"image cache {self._read('kickerino_image_cache_bytes') / 1048576:.1f} MiB"
+                     f" ({self._read('kickerino_image_cache_pinned_bytes') / 1048576:.1f} pinned)"
+                     f"  evicted {self._read('kickerino_image_cache_evictions_total'):.0f}")
+        in_flight = sum(IMAGE_FETCHES_IN_FLIGHT.values().values())
+        lines.append(f"fetches in flight {in_flight:.0f}  reconnects {self._read('kickerino_pusher_reconnects_total'):.0f}")
+        return "\n".join(lines)
+
+    def _read(self, metric_name: str) -> float:
+        metric = REGISTRY.get(metric_name)
+        return sum(metric.values().values()) if metric else 0
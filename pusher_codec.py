@@ -0,0 +1,73 @@
+# pusher_codec.py
+import json
+import re
+
+try:
+    import orjson
+    JSON_BACKEND = "orjson"
+    loads = orjson.loads
+    DECODE_ERRORS = (ValueError,) # orjson.JSONDecodeError subclasses it
+    def dumps(obj) -> str: return orjson.dumps(obj).decode("utf-8")
+except ImportError:
+    try:
+        import msgspec
+        JSON_BACKEND = "msgspec"
+        loads = msgspec.json.decode
+        DECODE_ERRORS = (ValueError, msgspec.DecodeError)
+        def dumps(obj) -> str: return msgspec.json.encode(obj).decode("utf-8")
+    except ImportError:
+        JSON_BACKEND = "json"
+        loads = json.loads
+        DECODE_ERRORS = (ValueError,)
+        def dumps(obj) -> str: return json.dumps(obj, separators=(",", ":"))
+
+CHAT_MESSAGE_EVENT = "App\\Events\\ChatMessageEvent"
+PUSHER_PING_FRAME = dumps({"event": "pusher:ping", "data": {}})
+PUSHER_PONG_FRAME = dumps({"event": "pusher:pong", "data": {}})
+
+# orjson/msgspec parse bytes directly, so frames are received undecoded; the stdlib json is faster on str
+RECV_RAW_BYTES = JSON_BACKEND != "json"
+
+# Pusher sends compact envelopes, so the fields are found with find/rfind; the regexes cover anything else.
+# "channel" is an envelope key: inside the JSON-string "data" quotes are escaped, so the marker can't match there.
+_BYTES_SYNTAX = (b'"event":"', b'"channel":"', b'"', b"\\",
+                 re.compile(rb'"event"\s*:\s*"((?:[^"\\]|\\.)*)"'), re.compile(rb'"channel"\s*:\s*"((?:[^"\\]|\\.)*)"'))
+_STR_SYNTAX = tuple(item.decode("utf-8") if isinstance(item, bytes) else re.compile(item.pattern.decode("utf-8"))
+                    for item in _BYTES_SYNTAX)
+_MAX_KNOWN_NAMES = 1024
+_known_names = {} # Raw (still escaped) event/channel name as found in frames -> decoded str
+
+def _unescape(raw) -> str:
+    name = _known_names.get(raw)
+    if name is None:
+        quote = '"' if isinstance(raw, str) else b'"'
+        name = json.loads(quote + raw + quote)
+        if len(_known_names) < _MAX_KNOWN_NAMES: _known_names[raw] = name # Only a handful of distinct names exist
+    return name
+
+def _peek(frame, marker_index: int, from_end: bool) -> str | None:
+    syntax = _STR_SYNTAX if isinstance(frame, str) else _BYTES_SYNTAX
+    marker = syntax[marker_index]
+    start = frame.rfind(marker) if from_end else frame.find(marker)
+    if start >= 0:
+        start += len(marker)
+        end = frame.find(syntax[2], start)
+        if end >= 0:
+            raw = frame[start:end]
+            if not raw.endswith(syntax[3]): return _unescape(raw) # Else the quote found was escaped; use the regex
+    match = syntax[4 + marker_index].search(frame)
+    return _unescape(match.group(1)) if match else None
+
+def peek_event(frame) -> str | None:
+    """Event name of a raw Pusher frame (bytes or str) without decoding the frame."""
+    return _peek(frame, 0, False) # First key in Pusher's envelopes
+
+def peek_channel(frame) -> str | None:
+    """Channel name of a raw Pusher frame, or None for connection-level events."""
+    return _peek(frame, 1, True) # Last key, after the (long) data string
+
+def decode_data(envelope: dict):
+    """The envelope's data, which Pusher double-encodes as a JSON string for app events. Raises DECODE_ERRORS."""
+    data = envelope.get("data")
+    if isinstance(data, (str, bytes)): return loads(data) if data else {}
+    return data if data is not None else {}
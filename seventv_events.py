@@ -0,0 +1,131 @@
+# seventv_events.py
+import asyncio
+import os
+import traceback
+from typing import Awaitable, Callable
+
+from kick_chat import reconnect_delay
+from lazy_imports import lazy_import
+from pusher_codec import DECODE_ERRORS, dumps, loads
+
+websockets = lazy_import("websockets")
+
+SEVENTV_EVENTS_URL = os.environ.get("KICKERINO_7TV_EVENTS_URL", "wss://events.7tv.io/v3")
+# EventAPI opcodes
+OP_DISPATCH, OP_HELLO, OP_HEARTBEAT, OP_RECONNECT, OP_ACK, OP_ERROR, OP_END_OF_STREAM = 0, 1, 2, 4, 5, 6, 7
+OP_SUBSCRIBE, OP_UNSUBSCRIBE = 35, 36
+EMOTE_SET_UPDATE = "emote_set.update"
+DEFAULT_HEARTBEAT_INTERVAL = 45.0 # Seconds, until the server's hello says otherwise
+MISSED_HEARTBEATS = 3 # Silence for this many heartbeat intervals means the socket is dead
+
+class SevenTVEventClient:
+    """One shared 7TV EventAPI socket carrying an emote_set.update subscription per emote set.
+
+    The socket opens with the first subscription and closes with the last. It is watched through
+    the server's heartbeats; a dropped, silent or server-retired socket is reopened with jittered
+    backoff and every set is resubscribed. Diffs sent during the gap are lost, so on_resync(set_id)
+    is called for each set after a reconnect to let the owner refetch it once. Loop thread only.
+    """
+    def __init__(self, on_update: Callable[[str, dict], None], on_resync: Callable[[str], Awaitable] | None = None, url: str = SEVENTV_EVENTS_URL):
+        self.on_update = on_update # (emote set id, dispatch body with pushed/pulled/updated)
+        self.on_resync = on_resync
+        self.url = url
+        self.emote_set_ids = set()
+        self.websocket = None
+        self._ready = False # Hello received on the current socket; until then the session subscribes every set itself
+        self.task = None
+        self._resyncs = set() # on_resync tasks in flight; the loop only keeps weak references to tasks
+        self.heartbeat_interval = DEFAULT_HEARTBEAT_INTERVAL
+        self.reconnect_count = 0
+        self.updates_applied = 0
+
+    async def subscribe(self, emote_set_id: str):
+        if emote_set_id in self.emote_set_ids: return
+        self.emote_set_ids.add(emote_set_id)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        elif self._ready: await self._send(OP_SUBSCRIBE, emote_set_id) # Otherwise sent with the rest once the hello arrives
+
+    async def unsubscribe(self, emote_set_id: str):
+        if emote_set_id not in self.emote_set_ids: return
+        self.emote_set_ids.discard(emote_set_id)
+        if not self.emote_set_ids: await self.close()
+        elif self._ready: await self._send(OP_UNSUBSCRIBE, emote_set_id)
+
+    async def close(self):
+        self.emote_set_ids.clear()
+        tasks = [task for task in (self.task, *self._resyncs) if task and not task.done()]
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.task = None
+
+    async def _send(self, op: int, emote_set_id: str):
+        if not self.websocket: return
+        frame = {"op": op, "d": {"type": EMOTE_SET_UPDATE, "condition": {"object_id": emote_set_id}}}
+        try: await self.websocket.send(dumps(frame))
+        except websockets.exceptions.ConnectionClosed: print(f"7TV events: connection closed while sending op {op} for {emote_set_id}.")
+
+    async def _run(self):
+        attempt = 0
+        ever_ready = False
+        while self.emote_set_ids:
+            was_ready, reason = await self._run_session(resync=ever_ready)
+            if not self.emote_set_ids: break
+            if was_ready: attempt = 0; ever_ready = True
+            delay = reconnect_delay(attempt)
+            attempt += 1
+            self.reconnect_count += 1
+            print(f"7TV events: {reason}; reconnecting in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+    async def _run_session(self, resync: bool) -> tuple:
+        """One connection and its receive loop. Returns (whether hello arrived, reason it ended).
+
+        resync is set when an earlier session was live, so updates may have been missed.
+        """
+        was_ready = False
+        try:
+            async with websockets.connect(self.url, open_timeout=10, close_timeout=1) as websocket:
+                self.websocket = websocket
+                while True:
+                    try: raw = await asyncio.wait_for(websocket.recv(), timeout=self.heartbeat_interval * MISSED_HEARTBEATS)
+                    except asyncio.TimeoutError: return was_ready, f"no heartbeat for {self.heartbeat_interval * MISSED_HEARTBEATS:.0f}s"
+                    try: message = loads(raw)
+                    except DECODE_ERRORS as e:
+                        print(f"7TV events: undecodable frame {raw[:200]!r}: {e}"); continue
+                    op, data = message.get("op"), message.get("d") or {}
+                    if op == OP_DISPATCH:
+                        if data.get("type") == EMOTE_SET_UPDATE: self._dispatch(data.get("body") or {})
+                    elif op == OP_HELLO:
+                        self.heartbeat_interval = (data.get("heartbeat_interval") or DEFAULT_HEARTBEAT_INTERVAL * 1000) / 1000.0
+                        was_ready = self._ready = True # Before the snapshot below: sets added while it is sent are sent by subscribe()
+                        for emote_set_id in list(self.emote_set_ids): await self._send(OP_SUBSCRIBE, emote_set_id)
+                        if resync and self.on_resync:
+                            for emote_set_id in list(self.emote_set_ids):
+                                resync_task = asyncio.ensure_future(self.on_resync(emote_set_id))
+                                self._resyncs.add(resync_task)
+                                resync_task.add_done_callback(self._resyncs.discard)
+                    elif op == OP_RECONNECT: return was_ready, "server asked to reconnect"
+                    elif op == OP_END_OF_STREAM: return was_ready, f"end of stream ({data.get('message') or data.get('code')})"
+                    elif op == OP_ERROR: print(f"7TV events: server error: {data}")
+                    # OP_HEARTBEAT and OP_ACK only prove the socket is alive
+        except asyncio.CancelledError: raise
+        except websockets.exceptions.ConnectionClosed as e_closed: return was_ready, f"{e_closed.reason or 'closed'}, code {e_closed.code}"
+        except (OSError, asyncio.TimeoutError) as e_connect: return was_ready, f"network error: {e_connect or type(e_connect).__name__}"
+        except Exception as e:
+            print(f"7TV events: unexpected error: {e}")
+            traceback.print_exc()
+            return was_ready, f"error: {e}"
+        finally:
+            self.websocket = None
+            self._ready = False
+
+    def _dispatch(self, body: dict):
+        emote_set_id = body.get("id")
+        if emote_set_id not in self.emote_set_ids: return
+        try:
+            self.on_update(emote_set_id, body)
+            self.updates_applied += 1
+        except Exception as e:
+            print(f"7TV events: applying update to {emote_set_id} failed: {e}")
+            traceback.print_exc()
@@ -0,0 +1,285 @@
+# stall_watchdog.py
+"""Stall detection and on-demand profiling for the asyncio loop thread and the Tk thread.
+
+StallWatchdog keeps a heartbeat callback running on each watched thread and a monitor thread of
+its own. When a heartbeat is late by more than the threshold, the monitor samples the stalled
+thread's stack via sys._current_frames() until it recovers, then reports the most frequent stacks.
+ProfileCapture runs cProfile on both threads plus tracemalloc for a fixed time and writes the reports
+(on Python 3.12+, one process-wide cProfile plus per-thread stack sampling).
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from app_paths import user_data_dir
+from metrics import SCHEDULING_LAG, THREAD_STALLS
+
+DEFAULT_HEARTBEAT_INTERVAL = 0.1 # Seconds between heartbeats on each watched thread
+DEFAULT_STALL_THRESHOLD = 0.25 # A heartbeat this late (beyond its interval) counts as a stall
+SAMPLE_INTERVAL = 0.01 # Stack samples per second while a thread is stalled: 100
+MAX_STALL_SAMPLES = 500 # A longer stall (e.g. a deadlock) is reported after ~5 s of samples
+MAX_STACK_DEPTH = 14 # Innermost frames kept per sample
+REPORTED_STACKS = 3
+DEFAULT_PROFILE_SECONDS = 10
+PROFILE_REPORT_LINES = 60
+# From 3.12 cProfile sits on sys.monitoring: only one profiler may be active per process, and it sees every thread
+PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+PROFILE_SAMPLE_INTERVAL = 0.005 # Per-thread stack samples while profiling on 3.12+: 200 per second
+PROFILE_STACK_DEPTH = 40
+PROFILE_REPORTED_STACKS = 10
+TRACEMALLOC_FRAMES = 15
+TRACEMALLOC_REPORT_LINES = 40
+
+def default_report_dir() -> Path:
+    return user_data_dir() / "diagnostics"
+
+def _stack_signature(frame, max_depth: int = MAX_STACK_DEPTH) -> tuple:
+    entries = []
+    while frame is not None and len(entries) < max_depth:
+        entries.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return tuple(reversed(entries)) # Outermost first, like a traceback
+
+class _Heartbeat:
+    __slots__ = ("name", "thread_id", "last_beat", "reported_beat")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.thread_id = None # Known once the first heartbeat has run on the thread
+        self.last_beat = time.monotonic()
+        self.reported_beat = None # last_beat of the stall already reported, so one stall is reported once
+
+class StallWatchdog:
+    def __init__(self, threshold: float = DEFAULT_STALL_THRESHOLD, interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+                 report_dir: Path | None = None):
+        self.threshold = threshold
+        self.interval = interval
+        self.report_dir = Path(report_dir) if report_dir else default_report_dir()
+        self._heartbeats = []
+        self._stop = threading.Event()
+        self._monitor_thread = None
+        self._loop_task = None
+        self._tk_root = None
+        self._tk_after_id = None
+        self.stall_count = 0
+
+    def watch_loop(self, loop: asyncio.AbstractEventLoop, name: str = "asyncio"):
+        """Starts the loop-lag heartbeat; safe to call from any thread."""
+        heartbeat = _Heartbeat(name)
+        self._heartbeats.append(heartbeat)
+        def start(): self._loop_task = loop.create_task(self._loop_heartbeat(heartbeat))
+        loop.call_soon_threadsafe(start)
+
+    def watch_tk(self, tk_root, name: str = "tk"):
+        """Starts the after() drift heartbeat. Must be called on the Tk thread."""
+        heartbeat = _Heartbeat(name)
+        heartbeat.thread_id = threading.get_ident()
+        self._heartbeats.append(heartbeat)
+        interval_ms = max(1, int(self.interval * 1000))
+        def tick(expected_at: float):
+            now = time.monotonic()
+            SCHEDULING_LAG.observe(max(0.0, now - expected_at), name)
+            heartbeat.last_beat = now
+            self._tk_after_id = tk_root.after(interval_ms, tick, now + interval_ms / 1000.0)
+        self._tk_root = tk_root
+        self._tk_after_id = tk_root.after(interval_ms, tick, time.monotonic() + interval_ms / 1000.0)
+
+    def start(self):
+        if self._monitor_thread: return
+        self._monitor_thread = threading.Thread(target=self._monitor, name="StallWatchdog", daemon=True)
+        self._monitor_thread.start()
+
+    def stop(self):
+        """Stops monitoring; call on the Tk thread (cancels the Tk heartbeat)."""
+        self._stop.set()
+        if self._tk_after_id is not None:
+            try: self._tk_root.after_cancel(self._tk_after_id)
+            except Exception: pass
+            self._tk_after_id = None
+        if self._loop_task: self._loop_task.get_loop().call_soon_threadsafe(self._loop_task.cancel)
+
+    async def _loop_heartbeat(self, heartbeat: _Heartbeat):
+        heartbeat.thread_id = threading.get_ident()
+        loop = asyncio.get_running_loop()
+        while True:
+            expected_at = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            SCHEDULING_LAG.observe(max(0.0, loop.time() - expected_at), heartbeat.name)
+            heartbeat.last_beat = time.monotonic()
+
+    # --- Monitor thread ---
+    def _monitor(self):
+        while not self._stop.wait(self.interval / 2):
+            for heartbeat in self._heartbeats:
+                beat = heartbeat.last_beat
+                if heartbeat.thread_id is None or beat == heartbeat.reported_beat: continue
+                if time.monotonic() - beat - self.interval >= self.threshold:
+                    heartbeat.reported_beat = beat
+                    self._sample_stall(heartbeat, beat)
+
+    def _sample_stall(self, heartbeat: _Heartbeat, stalled_beat: float):
+        samples = Counter()
+        sample_count = 0
+        while heartbeat.last_beat == stalled_beat and sample_count < MAX_STALL_SAMPLES and not self._stop.is_set():
+            frame = sys._current_frames().get(heartbeat.thread_id)
+            if frame is None: return # Thread has exited
+            samples[_stack_signature(frame)] += 1
+            sample_count += 1
+            del frame
+            time.sleep(SAMPLE_INTERVAL)
+        recovered = heartbeat.last_beat != stalled_beat
+        stalled_for = (heartbeat.last_beat if recovered else time.monotonic()) - stalled_beat - self.interval
+        self.stall_count += 1
+        THREAD_STALLS.inc(heartbeat.name)
+        self._report(self._format_stall(heartbeat.name, stalled_for, recovered, samples, sample_count))
+
+    def _format_stall(self, thread_name: str, stalled_for: float, recovered: bool, samples: Counter, sample_count: int) -> str:
+        status = f"stalled for {stalled_for:.2f}s" if recovered else f"still stalled after {stalled_for:.2f}s"
+        lines = [f"[{datetime.now().isoformat(timespec='seconds')}] Watchdog: {thread_name} thread {status} "
+                 f"({sample_count} stack samples). Most frequent stacks:"]
+        for stack, count in samples.most_common(REPORTED_STACKS):
+            lines.append(f"  {count / max(sample_count, 1):.0%} ({count} samples):")
+            lines.extend(f"    {entry}" for entry in stack)
+        return "\n".join(lines)
+
+    def _report(self, text: str):
+        print(text, file=sys.stderr)
+        try:
+            self.report_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.report_dir / "stalls.log", "a", encoding="utf-8") as f: f.write(text + "\n\n")
+        except OSError as e:
+            print(f"Watchdog: could not write stall report: {e}", file=sys.stderr)
+
+class ProfileCapture:
+    """Time-boxed profile of the Tk and asyncio threads plus a tracemalloc diff, written to report_dir.
+
+    start() must be called on the Tk thread. Up to Python 3.11 cProfile only sees the thread that
+    enabled it, so each thread gets its own profiler, enabled and disabled on that thread. From
+    3.12 only one profiler can be active and it sees every thread, so a single "all-threads"
+    profile is written, and each thread's share comes from stack samples taken on a helper thread.
+    """
+    def __init__(self, tk_root, loop: asyncio.AbstractEventLoop, report_dir: Path | None = None):
+        self.tk_root = tk_root
+        self.loop = loop
+        self.report_dir = Path(report_dir) if report_dir else default_report_dir()
+        self.running = False
+        self._profilers = {}
+        self._thread_ids = {} # Thread name -> ident, for stack sampling
+        self._samples = {} # Thread name -> Counter of stack signatures
+        self._sample_count = 0
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+        self._started_tracemalloc = False
+        self._start_snapshot = None
+        self._stamp = None
+
+    def start(self, duration: float = DEFAULT_PROFILE_SECONDS) -> bool:
+        if self.running:
+            print("ProfileCapture: a capture is already running.")
+            return False
+        self.running = True
+        self._stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES); self._started_tracemalloc = True
+        self._start_snapshot = tracemalloc.take_snapshot()
+        if PER_THREAD_CPROFILE:
+            self._profilers = {"tk": cProfile.Profile(), "asyncio": cProfile.Profile()}
+            self._profilers["tk"].enable()
+            self.loop.call_soon_threadsafe(self._profilers["asyncio"].enable)
+        else:
+            self._profilers = {"all-threads": cProfile.Profile()}
+            self._profilers["all-threads"].enable()
+            self._thread_ids = {"tk": threading.get_ident()}
+            self._samples = {"tk": Counter(), "asyncio": Counter()}
+            self._sample_count = 0
+            self.loop.call_soon_threadsafe(lambda: self._thread_ids.__setitem__("asyncio", threading.get_ident()))
+            self._stop_sampling.clear()
+            self._sampler = threading.Thread(target=self._sample_threads, name="ProfileCaptureSampler", daemon=True)
+            self._sampler.start()
+        print(f"ProfileCapture: profiling both threads for {duration:g}s...")
+        self.tk_root.after(int(duration * 1000), self._finish)
+        return True
+
+    def _sample_threads(self):
+        while not self._stop_sampling.wait(PROFILE_SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for thread_name, thread_id in list(self._thread_ids.items()):
+                frame = frames.get(thread_id)
+                if frame is not None: self._samples[thread_name][_stack_signature(frame, PROFILE_STACK_DEPTH)] += 1
+            self._sample_count += 1
+            del frames
+
+    def _finish(self):
+        if not PER_THREAD_CPROFILE:
+            self._profilers["all-threads"].disable()
+            self._stop_sampling.set()
+            threading.Thread(target=self._write_reports, name="ProfileCapture", daemon=True).start()
+            return
+        self._profilers["tk"].disable()
+        def disable_loop_profiler():
+            self._profilers["asyncio"].disable()
+            threading.Thread(target=self._write_reports, name="ProfileCapture", daemon=True).start()
+        if self.loop.is_running(): self.loop.call_soon_threadsafe(disable_loop_profiler)
+        else: threading.Thread(target=self._write_reports, name="ProfileCapture", daemon=True).start()
+
+    def _format_samples(self, thread_name: str, samples: Counter) -> str:
+        total = max(self._sample_count, 1)
+        functions = Counter()
+        for stack, count in samples.items():
+            for name in {entry.split(" ", 1)[1] + " (" + entry.split(":", 1)[0] + ")" for entry in stack}: functions[name] += count
+        lines = [f"{thread_name} thread: {sum(samples.values())} of {self._sample_count} stack samples (every {PROFILE_SAMPLE_INTERVAL * 1000:g} ms).",
+                 "", f"Top {PROFILE_REPORT_LINES} functions by share of samples on the stack (inclusive):"]
+        lines += [f"  {count / total:6.1%}  {name}" for name, count in functions.most_common(PROFILE_REPORT_LINES)]
+        lines += ["", f"Top {PROFILE_REPORTED_STACKS} stacks:"]
+        for stack, count in samples.most_common(PROFILE_REPORTED_STACKS):
+            lines.append(f"  {count / total:.1%} ({count} samples):")
+            lines.extend(f"    {entry}" for entry in stack)
+        return "\n".join(lines) + "\n"
+
+    def _write_reports(self):
+        try:
+            snapshot = tracemalloc.take_snapshot() # Before building the reports, which allocate plenty themselves
+            current, peak = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc: tracemalloc.stop()
+            self.report_dir.mkdir(parents=True, exist_ok=True)
+            written = []
+            for thread_name, profiler in self._profilers.items():
+                base = self.report_dir / f"profile-{self._stamp}-{thread_name}"
+                profiler.dump_stats(f"{base}.pstats") # For snakeviz / pstats
+                text = io.StringIO()
+                pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(PROFILE_REPORT_LINES)
+                Path(f"{base}.txt").write_text(text.getvalue(), encoding="utf-8")
+                written += [f"{base}.pstats", f"{base}.txt"]
+            if self._sampler: self._sampler.join()
+            for thread_name, samples in self._samples.items():
+                sample_report = self.report_dir / f"samples-{self._stamp}-{thread_name}.txt"
+                sample_report.write_text(self._format_samples(thread_name, samples), encoding="utf-8")
+                written.append(str(sample_report))
+            lines = [f"Top {TRACEMALLOC_REPORT_LINES} allocation sites by growth during the capture:"]
+            lines += [str(stat) for stat in snapshot.compare_to(self._start_snapshot, "lineno")[:TRACEMALLOC_REPORT_LINES]]
+            lines += ["", f"Top {TRACEMALLOC_REPORT_LINES} allocation sites by size at the end:"]
+            lines += [str(stat) for stat in snapshot.statistics("lineno")[:TRACEMALLOC_REPORT_LINES]]
+            lines += ["", f"Traced memory: {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB)"]
+            memory_report = self.report_dir / f"tracemalloc-{self._stamp}.txt"
+            memory_report.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            written.append(str(memory_report))
+            print("ProfileCapture: wrote " + ", ".join(written))
+        except Exception as e:
+            print(f"ProfileCapture: failed to write reports: {e}")
+        finally:
+            self._profilers = {}
+            self._samples = {}
+            self._thread_ids = {}
+            self._sampler = None
+            self._start_snapshot = None
+            self._started_tracemalloc = False
+            self.running = False
@@ -0,0 +1,38 @@
+# startup_timing.py
+import threading
+import time
+
+from lazy_imports import IMPORT_TIMES
+from metrics import REGISTRY
+
+STARTUP_PHASES = REGISTRY.gauge("kickerino_startup_seconds", "Seconds from launch to each startup milestone.", ("phase",))
+
+class StartupTimeline:
+    """Records when each startup milestone is first reached, relative to started_at (a perf_counter value).
+
+    mark() is cheap and thread-safe; only the first mark of a name counts. report() lists the
+    milestones and the slowest deferred imports.
+    """
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.marks = {} # name -> seconds since started_at
+        self._lock = threading.Lock()
+
+    def mark(self, name: str) -> bool:
+        """True if this was the first time name was reached."""
+        if name in self.marks: return False
+        elapsed = time.perf_counter() - self.started_at
+        with self._lock:
+            if name in self.marks: return False
+            self.marks[name] = elapsed
+        STARTUP_PHASES.set(elapsed, name)
+        return True
+
+    def report(self) -> str:
+        with self._lock: marks = sorted(self.marks.items(), key=lambda item: item[1])
+        lines = ["Startup timeline (seconds since launch):"]
+        lines.extend(f"  {name:<24}{elapsed:>8.3f}" for name, elapsed in marks)
+        imports = sorted(IMPORT_TIMES.items(), key=lambda item: -item[1])
+        if imports:
+            lines.append("  deferred imports: " + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in imports[:6]))
+        return "\n".join(lines)
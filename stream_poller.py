@@ -0,0 +1,140 @@
+# stream_poller.py
+import asyncio
+import random
+import traceback
+from typing import Awaitable, Callable
+
+# Refresh intervals in seconds, by (is_live, is_focused tab)
+POLL_INTERVALS = {
+    (True, True): 30,
+    (True, False): 90,
+    (False, True): 120,
+    (False, False): 300,
+}
+JITTER_FRACTION = 0.2 # Each interval is stretched or shrunk by up to 20% so channels drift apart
+MAX_CONCURRENT_POLLS = 4
+MIN_POLL_SPACING = 0.25 # Seconds between request starts; 100 due channels become a 25 s trickle, not a burst
+FOCUS_REFRESH_DELAY = 2.0 # Switching to a tab refreshes it this soon if its next poll is further away
+MAX_ERROR_BACKOFF = 900
+POLLED_FIELDS = ("username", "title", "viewers", "category", "is_live")
+
+class _PolledChannel:
+    __slots__ = ("slug", "info", "next_due", "errors", "in_flight", "poll_task")
+
+    def __init__(self, slug: str, info: dict, next_due: float):
+        self.slug = slug
+        self.info = info
+        self.next_due = next_due
+        self.errors = 0
+        self.in_flight = False
+        self.poll_task = None
+
+class StreamInfoPoller:
+    """Keeps every open channel's stream info fresh from a single scheduler task.
+
+    Live channels and the focused tab are refreshed more often than offline or background ones,
+    intervals are jittered, request starts are spaced out and capped in number, and failing
+    channels back off exponentially. on_change(slug, changed_fields) only sees fields that changed.
+    All methods except the constructor run on the asyncio loop thread.
+    """
+    def __init__(self, fetch_info: Callable[[str], Awaitable[dict]], on_change: Callable[[str, dict], None]):
+        self.fetch_info = fetch_info
+        self.on_change = on_change
+        self.channels = {} # slug -> _PolledChannel
+        self.focused_slug = None
+        self._task = None
+        self._wakeup = None
+        self._semaphore = None
+        self._polls = set() # In-flight _poll tasks; the loop only keeps weak references to tasks
+
+    def start(self):
+        if self._task and not self._task.done(): return
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_POLLS)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        tasks = [task for task in (self._task, *self._polls) if task and not task.done()]
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True) # No update is posted once stop() returns
+
+    def add_channel(self, slug: str, initial_info: dict | None = None):
+        info = {field: (initial_info or {}).get(field) for field in POLLED_FIELDS}
+        channel = _PolledChannel(slug, info, 0.0)
+        # First refresh lands anywhere within one interval, so channels opened together don't poll together
+        channel.next_due = self._now() + random.uniform(0.2, 1.0) * self._base_interval(channel)
+        self.channels[slug] = channel
+        self._wake()
+
+    def remove_channel(self, slug: str):
+        channel = self.channels.pop(slug, None)
+        if channel and channel.poll_task: channel.poll_task.cancel()
+
+    def set_focused(self, slug: str | None):
+        self.focused_slug = slug
+        channel = self.channels.get(slug)
+        if channel and not channel.in_flight:
+            channel.next_due = min(channel.next_due, self._now() + FOCUS_REFRESH_DELAY)
+            self._wake()
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _wake(self):
+        if self._wakeup: self._wakeup.set()
+
+    def _base_interval(self, channel: _PolledChannel) -> float:
+        return POLL_INTERVALS[(bool(channel.info.get("is_live")), channel.slug == self.focused_slug)]
+
+    def _next_interval(self, channel: _PolledChannel) -> float:
+        interval = self._base_interval(channel)
+        if channel.errors: interval = min(interval * (2 ** channel.errors), MAX_ERROR_BACKOFF)
+        return interval * random.uniform(1 - JITTER_FRACTION, 1 + JITTER_FRACTION)
+
+    async def _run(self):
+        while True:
+            pending = [c for c in self.channels.values() if not c.in_flight]
+            if not pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            channel = min(pending, key=lambda c: c.next_due)
+            delay = channel.next_due - self._now()
+            if delay > 0:
+                self._wakeup.clear()
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError: pass
+                continue # Re-pick: channels may have been added, removed or refocused meanwhile
+            await self._semaphore.acquire()
+            if self.channels.get(channel.slug) is not channel:
+                self._semaphore.release(); continue
+            channel.in_flight = True
+            channel.poll_task = asyncio.get_running_loop().create_task(self._poll(channel))
+            self._polls.add(channel.poll_task)
+            channel.poll_task.add_done_callback(self._polls.discard)
+            await asyncio.sleep(MIN_POLL_SPACING)
+
+    async def _poll(self, channel: _PolledChannel):
+        try:
+            info = await self.fetch_info(channel.slug)
+            if not info or info.get("error"):
+                channel.errors += 1
+                print(f"StreamInfoPoller: refresh of {channel.slug} failed ({(info or {}).get('error')}); backing off.")
+                return
+            channel.errors = 0
+            changed = {field: info.get(field) for field in POLLED_FIELDS if info.get(field) != channel.info.get(field)}
+            if changed and self.channels.get(channel.slug) is channel:
+                channel.info.update(changed)
+                self.on_change(channel.slug, changed)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            channel.errors += 1
+            print(f"StreamInfoPoller: error refreshing {channel.slug}: {e}")
+            traceback.print_exc()
+        finally:
+            channel.in_flight = False
+            channel.poll_task = None
+            channel.next_due = self._now() + self._next_interval(channel)
+            self._semaphore.release()
+            self._wake()